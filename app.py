@@ -4,13 +4,12 @@
 """
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, Response
 from PIL import Image
-import base64
-import io
 import asyncio
 from pathlib import Path
 import os
+from typing import Optional
 
 app = FastAPI(title="圖片風格轉換工具（細粒度 Pipeline）")
 
@@ -33,6 +32,41 @@ def load_styles():
     return _FINE_GRAINED_STYLES, _STYLE_OPTIONS
 
 
+@app.on_event("startup")
+async def warm_up_models():
+    """啟動時在背景預熱 rembg 模型（不阻塞啟動與健康檢查）"""
+    from src.config import REMBG_CONFIG
+    if not REMBG_CONFIG.warmup:
+        return
+    
+    def _warm_up():
+        from src.rembg_session import warm_up_rembg
+        try:
+            seconds = warm_up_rembg()
+            print(f"🔥 rembg 模型預熱完成（{REMBG_CONFIG.model}，{seconds:.1f}s）")
+        except Exception as e:
+            print(f"⚠️ rembg 模型預熱失敗：{e}")
+    
+    from src.pipeline.executor import get_cpu_executor
+    asyncio.get_event_loop().run_in_executor(get_cpu_executor(), _warm_up)
+
+
+@app.on_event("startup")
+async def start_jobs():
+    """啟動工作佇列（恢復上次未完成的工作）"""
+    from src.jobs import JOB_MANAGER
+    await JOB_MANAGER.start()
+
+
+@app.on_event("shutdown")
+async def stop_jobs():
+    """停止工作佇列（執行中的工作下次啟動時重新執行），送出剩餘的追蹤 span"""
+    from src.jobs import JOB_MANAGER
+    from src.tracing import TRACER
+    await JOB_MANAGER.stop()
+    await asyncio.to_thread(TRACER.flush)
+
+
 @app.get("/health")
 async def health_check():
     """健康檢查端點"""
@@ -42,102 +76,47 @@ async def health_check():
     )
 
 
-def image_to_base64(image: Image.Image) -> str:
-    buffered = io.BytesIO()
-    image.save(buffered, format="PNG")
-    return f"data:image/png;base64,{base64.b64encode(buffered.getvalue()).decode()}"
-
+@app.get("/api/stats")
+async def get_stats():
+    """運行統計（Gemini 客戶端、配額、rembg、快取）"""
+    from src.gemini_pool import get_client_stats
+    from src.rembg_session import REMBG_SESSIONS
+    from src.result_cache import get_result_cache
+    from src.pipeline.step_cache import get_step_cache
+    from src.preview_store import PREVIEW_STORE
+    from src.rate_limiter import RATE_LIMITER
+    from src.hedging import GEMINI_LATENCY
+    from src.jobs import JOB_MANAGER
+    from src.tracing import TRACER
+    return {
+        "gemini_clients": get_client_stats(),
+        "rembg": REMBG_SESSIONS.stats(),
+        "result_cache": get_result_cache().stats(),
+        "step_cache": get_step_cache().stats(),
+        "previews": PREVIEW_STORE.stats(),
+        "rate_limits": RATE_LIMITER.stats(),
+        "gemini_latency": GEMINI_LATENCY.stats(),
+        "jobs": JOB_MANAGER.stats(),
+        "tracing": TRACER.stats(),
+    }
 
-async def send_progress(websocket: WebSocket, data: dict):
-    await websocket.send_json(data)
-    await asyncio.sleep(0.03)
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 指標（text format 0.0.4）"""
+    from src.metrics import render
+    return Response(content=render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
-async def simulate_progress(websocket: WebSocket, step_id: int, total_steps: int, step_name: str):
-    """模擬步驟進度"""
-    try:
-        if "AI" in step_name or "生成" in step_name:
-            max_progress = 85
-            sleep_time = 0.5
-        elif "檢測" in step_name:
-            max_progress = 80
-            sleep_time = 0.3
-        else:
-            max_progress = 90
-            sleep_time = 0.2
-        
-        await send_progress(websocket, {
-            'type': 'step_update',
-            'step_id': step_id,
-            'step_progress': 5,
-            'overall_progress': ((step_id - 1) + 0.05) / total_steps * 100,
-            'message': f'⚙️ {step_name}處理中... 5%'
-        })
-        
-        for pct in range(10, max_progress, 5):
-            await asyncio.sleep(sleep_time)
-            await send_progress(websocket, {
-                'type': 'step_update',
-                'step_id': step_id,
-                'step_progress': pct,
-                'overall_progress': ((step_id - 1) + pct / 100) / total_steps * 100,
-                'message': f'⚙️ {step_name}處理中... {pct}%'
-            })
-            
-    except asyncio.CancelledError:
-        pass
 
-
-def format_result_detail(step: dict, result: any, image: Image.Image, context: dict) -> str:
-    """萬用結果格式化"""
-    step_name = step['name']
-    
-    if "檢測圖片類型" in step_name:
-        if isinstance(result, dict) and 'image_type' in result:
-            type_name = "真人照片" if result['image_type'] == "photo" else "插畫作品"
-            return f"→ 類型：{type_name}"
-        return "→ 檢測完成"
-    
-    if "檢測身體範圍" in step_name or "身體範圍" in step_name:
-        if isinstance(result, dict) and 'body_extent' in result:
-            body_map = {
-                "head_only": "僅頭部",
-                "head_neck": "頭部+脖子",
-                "head_chest": "頭部到上胸部（理想）",
-                "full_body": "全身照"
-            }
-            body_desc = body_map.get(result['body_extent'], result['body_extent'])
-            return f"→ 身體範圍：{body_desc}"
-        return "→ 檢測完成"
-    
-    if "生成處理指令" in step_name or "Body Instruction" in step_name:
-        if isinstance(result, dict) and 'body_instruction' in result:
-            body_extent = context.get('body_extent', 'unknown')
-            instruction_type = {
-                "full_body": "裁切全身到上胸部",
-                "head_only": "生成脖子、肩膀、上胸部",
-                "head_neck": "生成肩膀和上胸部",
-                "head_chest": "保持當前構圖"
-            }.get(body_extent, "預設處理")
-            return f"→ 指令類型：{instruction_type}"
-        return "→ 指令生成完成"
-    
-    if "構建" in step_name and "Prompt" in step_name:
-        if isinstance(result, dict) and 'prompt' in result:
-            prompt_len = len(result['prompt'])
-            return f"→ Prompt 長度：{prompt_len}字"
-        return "→ Prompt 構建完成"
-    
-    if isinstance(image, Image.Image):
-        prev_size = context.get('prev_size', 'unknown')
-        curr_size = f"{image.width}x{image.height}"
-        
-        if prev_size != 'unknown' and prev_size != curr_size:
-            return f"→ {prev_size} 處理為 {curr_size}"
-        else:
-            return f"→ 尺寸：{curr_size}"
-    
-    return "→ 處理完成"
+@app.get("/api/previews/{token}")
+async def get_preview(token: str):
+    """中間步驟預覽（短效 URL）"""
+    from src.preview_store import PREVIEW_STORE
+    item = PREVIEW_STORE.get(token)
+    if item is None:
+        return JSONResponse(status_code=404, content={"error": "預覽已過期"})
+    media_type, data = item
+    return Response(content=data, media_type=media_type, headers={"Cache-Control": "private, max-age=300"})
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -153,153 +132,290 @@ async def get_styles():
     return {"styles": STYLE_OPTIONS}
 
 
+async def receive_upload(websocket: WebSocket, data: dict) -> Image.Image:
+    """
+    接收上傳圖片
+
+    - 新格式：{"style", "upload": {"size"}} 後接多個二進位 frame，分塊寫入暫存緩衝
+    - 舊格式：{"style", "image": data URL}（相容舊前端）
+    解碼在 CPU 執行緒池進行（含像素上限檢查與提早縮小）。
+    """
+    from src.upload import UploadBuffer, UploadError, decode_upload, read_data_url
+    from src.pipeline.executor import run_cpu
+
+    upload = data.get('upload')
+    if upload is None:
+        if 'image' not in data:
+            raise UploadError('缺少圖片')
+        return await run_cpu(decode_upload, await run_cpu(read_data_url, data['image']))
+
+    buffer = UploadBuffer(int(upload['size']))
+    try:
+        while not buffer.complete:
+            buffer.write(await websocket.receive_bytes())
+        return await run_cpu(decode_upload, buffer.open())
+    finally:
+        buffer.close()
+
+
+@app.post("/api/batch")
+async def create_batch_job(request: dict):
+    """
+    建立批次工作（伺服器端路徑，相對於 BATCH_ROOT；未設定 BATCH_ROOT 時停用）
+
+    每個項目經准入控制取得名額；超載時回傳 503 與 Retry-After。
+
+    Body: {"source": 資料夾或清單檔, "output_dir": 輸出資料夾, "style": 風格 ID,
+           "workers": 選填, "rpm": 選填}
+    """
+    from pathlib import Path
+    from src.admission import ADMISSION, OverCapacityError
+    from src.batch import BatchJob, start_batch_job
+    from src.config import BATCH_CONFIG
+    from src.pipeline.executor import run_cpu
+    if not BATCH_CONFIG.root:
+        return JSONResponse(status_code=403, content={"error": "HTTP 批次 API 未啟用（請設定 BATCH_ROOT，或使用 main.py batch）"})
+    try:
+        ADMISSION.check_capacity()
+    except OverCapacityError as e:
+        return JSONResponse(
+            status_code=503,
+            content={"error": str(e), "retry_after": e.retry_after},
+            headers={"Retry-After": str(int(e.retry_after))}
+        )
+    try:
+        # 列舉項目需要讀取檔案系統，在執行緒池進行
+        job = await run_cpu(
+            BatchJob,
+            request["source"],
+            request["output_dir"],
+            request.get("style", "i4_detailed"),
+            request.get("workers"),
+            request.get("rpm"),
+            root=Path(BATCH_CONFIG.root),
+            admission=ADMISSION
+        )
+    except PermissionError as e:
+        return JSONResponse(status_code=403, content={"error": str(e)})
+    except (KeyError, FileNotFoundError, ValueError) as e:
+        return JSONResponse(status_code=400, content={"error": f"無法建立批次工作：{e}"})
+    start_batch_job(job)
+    return job.summary()
+
+
+@app.get("/api/batch/{job_id}")
+async def get_batch_job(job_id: str):
+    """查詢批次工作進度"""
+    from src.batch import BATCH_JOBS
+    job = BATCH_JOBS.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "找不到批次工作"})
+    return job.summary()
+
+
 @app.websocket("/ws/process")
 async def process_image_websocket(websocket: WebSocket):
-    """萬用處理函數 - 所有風格統一邏輯"""
+    """
+    萬用處理函數 - 送出工作並訂閱事件
+
+    - 新工作：{"style", "upload": {...}, "progress"} 後接圖片，回覆 {"type": "job", "job_id"}
+    - 重新訂閱：{"job_id", "after": 最後收到的 seq}，補送遺漏的事件後繼續推送
+    連線中斷不影響工作執行，結果保存在伺服器端。超載時以 1013（Try Again Later）關閉。
+    """
     await websocket.accept()
     
-    try:
-        # 首次請求時載入風格配置
-        FINE_GRAINED_STYLES, _ = load_styles()
+    from src.admission import OverCapacityError
+    from src.jobs import JOB_MANAGER
+    from src.metrics import ACTIVE_SESSIONS
+    from src.tracing import KIND_SERVER, span
+    ACTIVE_SESSIONS.inc(endpoint="process")
+    events = None
+    
+    with span("ws /ws/process", KIND_SERVER) as session:
+        try:
+            data = await websocket.receive_json()
         
-        data = await websocket.receive_json()
-        image_base64 = data['image'].split(',')[1]
-        image_bytes = base64.b64decode(image_base64)
-        image = Image.open(io.BytesIO(image_bytes))
+            if data.get('job_id'):
+                job_id = data['job_id']
+                if await JOB_MANAGER.get(job_id) is None:
+                    await websocket.send_json({
+                        'type': 'error',
+                        'message': f'找不到工作：{job_id}'
+                    })
+                    return
+                after = int(data.get('after', 0))
+                session.set_attributes(job_id=job_id, resubscribe=True)
+            else:
+                # 首次請求時載入風格配置
+                FINE_GRAINED_STYLES, _ = load_styles()
+                # 超載時在接收圖片前就拒絕
+                await JOB_MANAGER.start()
+                JOB_MANAGER.check_capacity()
+                try:
+                    image = await receive_upload(websocket, data)
+                except ValueError as e:
+                    await websocket.send_json({
+                        'type': 'error',
+                        'message': f'上傳失敗：{e}'
+                    })
+                    return
+            
+                selected_style = data.get('style', 'i4_detailed')
+                if selected_style not in FINE_GRAINED_STYLES:
+                    await websocket.send_json({
+                        'type': 'error',
+                        'message': f'找不到風格：{selected_style}'
+                    })
+                    return
+            
+                # 進度模式：events（預設，只送實際事件）/ simulated（舊前端選用，補上模擬刻度）
+                session.set_attribute("pipeline.style", selected_style)
+                job_id = await JOB_MANAGER.submit(image, selected_style, {'progress': data.get('progress', 'events')})
+                session.set_attribute("job_id", job_id)
+                after = 0
+                await websocket.send_json({'type': 'job', 'job_id': job_id})
         
-        selected_style = data.get('style', 'i4_detailed')
-        style_config = FINE_GRAINED_STYLES.get(selected_style)
+            events = JOB_MANAGER.subscribe(job_id, after)
+            async for event in events:
+                await websocket.send_json(event)
         
-        if not style_config:
-            await send_progress(websocket, {
+        except WebSocketDisconnect:
+            print("WebSocket 連接已斷開（工作繼續在背景執行）")
+        except OverCapacityError as e:
+            session.record_error(e)
+            await websocket.send_json({
                 'type': 'error',
-                'message': f'找不到風格：{selected_style}'
+                'message': str(e),
+                'retry_after': e.retry_after
             })
-            return
-        
-        await send_progress(websocket, {
-            'type': 'image',
-            'image': image_to_base64(image),
-            'message': f'圖片已上傳 | 尺寸: {image.width}x{image.height} | 模式: {image.mode}'
-        })
-        
-        steps = style_config['steps']
-        total_steps = len(steps)
-        
-        await send_progress(websocket, {
-            'type': 'info',
-            'message': f'📋 {style_config["name"]} | 共 {total_steps} 個步驟'
-        })
-        
-        context = {'prev_size': f"{image.width}x{image.height}"}
-        current_image = image
+            await websocket.close(code=1013, reason='over capacity')
+        except Exception as e:
+            session.record_error(e)
+            await websocket.send_json({
+                'type': 'error',
+                'message': f'處理失敗：{str(e)}'
+            })
+            import traceback
+            traceback.print_exc()
+        finally:
+            ACTIVE_SESSIONS.dec(endpoint="process")
+            if events is not None:
+                await events.aclose()
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查詢工作狀態"""
+    from src.jobs import JOB_MANAGER
+    job = await JOB_MANAGER.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "找不到工作"})
+    return job
+
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str, style: Optional[str] = None):
+    """工作結果 PNG（多風格工作以 style 指定風格）"""
+    from src.jobs import JOB_MANAGER, is_valid_job_id
+    if not is_valid_job_id(job_id):
+        return JSONResponse(status_code=404, content={"error": "找不到工作"})
+    try:
+        path = JOB_MANAGER.result_path(job_id, style)
+    except ValueError:
+        return JSONResponse(status_code=404, content={"error": "找不到風格結果"})
+    if not path.is_file():
+        return JSONResponse(status_code=404, content={"error": "結果尚未完成或已過期"})
+    return FileResponse(path, media_type="image/png")
+
+
+@app.websocket("/ws/process-multi")
+async def process_multi_style_websocket(websocket: WebSocket):
+    """
+    多風格扇出：一次上傳、多個風格（共用前綴步驟只執行一次，各分支並行）
+
+    - 新工作：{"styles": [風格 ID...], "upload": {...}} 後接圖片，回覆 {"type": "job", "job_id"}
+    - 重新訂閱：{"job_id", "after": 最後收到的 seq}
+    經准入控制排隊（佔一個全域名額與每個風格的名額），每個風格完成即送出 style_complete
+    （結果以 URL 提供）。超載時以 1013（Try Again Later）關閉。
+    """
+    await websocket.accept()
+    
+    from src.admission import OverCapacityError
+    from src.jobs import JOB_MANAGER
+    from src.metrics import ACTIVE_SESSIONS
+    from src.tracing import KIND_SERVER, span
+    ACTIVE_SESSIONS.inc(endpoint="process-multi")
+    events = None
+    
+    with span("ws /ws/process-multi", KIND_SERVER) as session:
+        try:
+            data = await websocket.receive_json()
         
-        for i, step in enumerate(steps):
-            step_id = i + 1
-            step_name = step['name']
-            icon = step['icon']
-            component = step['component']
-            
-            if 'conditional' in step:
-                if not step['conditional'](context):
-                    await send_progress(websocket, {
-                        'type': 'step_complete',
-                        'step_id': step_id,
-                        'step_progress': 100,
-                        'overall_progress': step_id / total_steps * 100,
-                        'message': f'⏭️ {icon} {step_name} | 跳過（不適用）'
+            if data.get('job_id'):
+                job_id = data['job_id']
+                if await JOB_MANAGER.get(job_id) is None:
+                    await websocket.send_json({
+                        'type': 'error',
+                        'message': f'找不到工作：{job_id}'
                     })
-                    continue
-        
-            await send_progress(websocket, {
-                'type': 'step_start',
-                'step_id': step_id,
-                'step_name': f"{icon} {step_name}",
-                'step_progress': 0,
-                'overall_progress': (step_id - 1) / total_steps * 100,
-                'substeps': []
-            })
+                    return
+                after = int(data.get('after', 0))
+                session.set_attributes(job_id=job_id, resubscribe=True)
+            else:
+                FINE_GRAINED_STYLES, _ = load_styles()
+                style_ids = list(dict.fromkeys(data.get('styles') or []))
+                unknown = [style_id for style_id in style_ids if style_id not in FINE_GRAINED_STYLES]
+                if not style_ids or unknown:
+                    await websocket.send_json({
+                        'type': 'error',
+                        'message': f'找不到風格：{", ".join(unknown)}' if unknown else '請至少選擇一個風格'
+                    })
+                    return
             
-            try:
-                context['prev_size'] = f"{current_image.width}x{current_image.height}" if isinstance(current_image, Image.Image) else 'unknown'
-                
-                await send_progress(websocket, {
-                    'type': 'step_update',
-                    'step_id': step_id,
-                    'step_progress': 5,
-                    'overall_progress': ((step_id - 1) + 0.05) / total_steps * 100,
-                    'message': f'⚙️ {step_name}處理中... 5%'
-                })
-                
-                progress_task = asyncio.create_task(
-                    simulate_progress(websocket, step_id, total_steps, step_name)
-                )
-                
-                loop = asyncio.get_event_loop()
-                result = await loop.run_in_executor(None, component, current_image, context)
-                
-                progress_task.cancel()
+                # 超載時在接收圖片前就拒絕
+                await JOB_MANAGER.start()
+                JOB_MANAGER.check_capacity()
                 try:
-                    await progress_task
-                except asyncio.CancelledError:
-                    pass
-                
-                if step.get('update_context') and isinstance(result, dict):
-                    context.update(result)
-                    result_for_detail = result
-                elif step.get('update_image') and isinstance(result, Image.Image):
-                    current_image = result
-                    result_for_detail = current_image
-                else:
-                    result_for_detail = result
-                
-                detail = format_result_detail(step, result_for_detail, current_image, context)
-                
-                await send_progress(websocket, {
-                    'type': 'step_update',
-                    'step_id': step_id,
-                    'step_progress': 95,
-                    'overall_progress': ((step_id - 1) + 0.95) / total_steps * 100,
-                    'message': f'✅ {icon} {step_name}即將完成...'
-                })
-                await asyncio.sleep(0.1)
-                
-                progress_data = {
-                    'type': 'step_complete',
-                    'step_id': step_id,
-                    'step_progress': 100,
-                    'overall_progress': step_id / total_steps * 100,
-                    'message': f'✅ {icon} {step_name}完成\n   {detail}'
-                }
-                
-                if step.get('show_image') and isinstance(current_image, Image.Image):
-                    progress_data['image'] = image_to_base64(current_image)
-                
-                await send_progress(websocket, progress_data)
-                
-            except Exception as e:
-                await send_progress(websocket, {
-                    'type': 'error',
-                    'step_id': step_id,
-                    'message': f'❌ {icon} {step_name}失敗：{str(e)}'
-                })
-                raise
+                    image = await receive_upload(websocket, data)
+                except ValueError as e:
+                    await websocket.send_json({
+                        'type': 'error',
+                        'message': f'上傳失敗：{e}'
+                    })
+                    return
+            
+                session.set_attribute("pipeline.styles", ",".join(style_ids))
+                job_id = await JOB_MANAGER.submit_fanout(image, style_ids)
+                session.set_attribute("job_id", job_id)
+                after = 0
+                await websocket.send_json({'type': 'job', 'job_id': job_id})
         
-        await send_progress(websocket, {
-            'type': 'complete',
-            'image': image_to_base64(current_image),
-            'message': f'🎉 全部完成！{style_config["name"]} | 共 {total_steps} 個步驟 | 最終尺寸: {current_image.width}x{current_image.height}'
-        })
+            events = JOB_MANAGER.subscribe(job_id, after)
+            async for event in events:
+                await websocket.send_json(event)
         
-    except WebSocketDisconnect:
-        print("WebSocket 連接已斷開")
-    except Exception as e:
-        await send_progress(websocket, {
-            'type': 'error',
-            'message': f'處理失敗：{str(e)}'
-        })
-        import traceback
-        traceback.print_exc()
+        except WebSocketDisconnect:
+            print("WebSocket 連接已斷開（工作繼續在背景執行）")
+        except OverCapacityError as e:
+            session.record_error(e)
+            await websocket.send_json({
+                'type': 'error',
+                'message': str(e),
+                'retry_after': e.retry_after
+            })
+            await websocket.close(code=1013, reason='over capacity')
+        except Exception as e:
+            session.record_error(e)
+            await websocket.send_json({
+                'type': 'error',
+                'message': f'處理失敗：{str(e)}'
+            })
+            import traceback
+            traceback.print_exc()
+        finally:
+            ACTIVE_SESSIONS.dec(endpoint="process-multi")
+            if events is not None:
+                await events.aclose()
 
 
 if __name__ == "__main__":
@@ -0,0 +1 @@
+"""效能基準測試（在專案根目錄執行：python -m benchmarks.<name>）"""
@@ -0,0 +1,76 @@
+"""圖片生成對沖請求：長尾延遲比較
+
+以模擬延遲分佈（多數快速、少數慢、極少數卡住）取代 Gemini 呼叫，
+比較不對沖與對沖（p90 觸發、預算 10%）時呼叫端實際等待時間的 p50/p95/p99。
+
+    python -m benchmarks.bench_hedging --calls 300 --slow 0.08 --budget 0.1
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from src.config import API_CONFIG, DEADLINE_CONFIG, RATE_LIMIT_CONFIG
+from src.hedging import LatencyRegistry, call_with_deadline, hedged_call
+from src import hedging
+
+from .common import print_json, summarize
+
+
+def _fake_latency(rng: random.Random, slow: float, fast_ms: float, slow_ms: float) -> float:
+    if rng.random() < slow:
+        return slow_ms / 1000 * rng.uniform(1.0, 2.0)
+    return fast_ms / 1000 * rng.uniform(0.5, 1.5)
+
+
+async def _run(calls: int, slow: float, fast_ms: float, slow_ms: float, concurrency: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    model = API_CONFIG.model_image
+    latencies = []
+
+    async def fake_call():
+        await asyncio.sleep(_fake_latency(rng, slow, fast_ms, slow_ms))
+        return True
+
+    async def one():
+        start = time.perf_counter()
+        await hedged_call(model, lambda: call_with_deadline(model, fake_call), hedge=True)
+        latencies.append(time.perf_counter() - start)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with semaphore:
+            await one()
+
+    await asyncio.gather(*(limited() for _ in range(calls)))
+    stats = hedging.GEMINI_LATENCY.get(model).stats()
+    return {"latency": summarize(latencies), "hedges": stats["hedges"], "hedge_wins": stats["hedge_wins"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="圖片生成對沖請求：長尾延遲比較")
+    parser.add_argument("--calls", type=int, default=300, help="呼叫次數")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時進行的呼叫數")
+    parser.add_argument("--slow", type=float, default=0.08, help="慢呼叫比例")
+    parser.add_argument("--fast-ms", type=float, default=40, help="一般呼叫延遲（毫秒）")
+    parser.add_argument("--slow-ms", type=float, default=600, help="慢呼叫延遲（毫秒）")
+    parser.add_argument("--budget", type=float, default=0.1, help="對沖預算（佔呼叫次數比例）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    RATE_LIMIT_CONFIG.image_rpm = 1e9
+    DEADLINE_CONFIG.hedge_budget = args.budget
+    results = {"calls": args.calls, "slow_ratio": args.slow, "budget": args.budget}
+    for mode, enabled in (("no_hedge", False), ("hedge", True)):
+        DEADLINE_CONFIG.hedge_enabled = enabled
+        hedging.GEMINI_LATENCY = LatencyRegistry()
+        results[mode] = asyncio.run(
+            _run(args.calls, args.slow, args.fast_ms, args.slow_ms, args.concurrency, args.seed)
+        )
+    print_json(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""離線端到端基準：以本機替身（mock_gemini）取代 genai.Client
+
+對一組不同尺寸的測試圖，執行每個 FINE_GRAINED_STYLES 風格（DAG 排程，不使用快取）與
+StyleConverter.apply_style 的各條路徑，輸出 JSON 以便跨 commit 比較：
+- 吞吐量（每秒完成張數）、端到端延遲 p50/p95/p99、總 CPU 時間
+- 峰值 RSS（每個目標在獨立的子進程執行，互不影響）
+- 每個步驟與內層操作（圖片編碼、請求組裝、回應解析……）的耗時與 CPU 時間：
+  另跑一輪逐一執行的 profile，由追蹤 span 取得，步驟之間不重疊
+
+Gemini 延遲、429 與 500 的比例由參數決定（固定亂數種子）。沒有 rembg 模型時（離線）
+以邊緣白色區域遮罩取代模型推論（--rembg auto 的預設行為，結果中的 rembg 欄位會註明）。
+
+    python -m benchmarks.bench_offline --sizes 512 1024 2048 --repeat 3 --output bench.json
+    python -m benchmarks.bench_offline --image-latency-ms 0 --text-latency-ms 0   # 只量本機圖片處理
+"""
+
+import os
+
+# 基準不輸出追蹤（需要時以 TRACE_EXPORTER 覆寫）
+os.environ.setdefault("TRACE_EXPORTER", "none")
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+from dataclasses import asdict
+from typing import Awaitable, Callable, Dict, List
+
+import numpy as np
+from PIL import Image
+
+from src import tracing
+from src.config import API_CONFIG, RATE_LIMIT_CONFIG
+from src.image_ops import edge_background_mask
+
+from .common import make_portrait, print_json, summarize
+from .mock_gemini import MockBehavior, MockGeminiClient, install_mock
+
+# StyleConverter.apply_style 的路徑 → 參數
+CONVERTER_PATHS = {
+    "default": {},
+    "opaque": {"transparent_bg": False},
+    "raw": {"normalize_size": False},
+}
+
+
+def make_corpus(sizes: List[int], seed: int = 0) -> List[Image.Image]:
+    """不同尺寸的測試圖（偶數項為正方形，奇數項為 3:4 直式）"""
+    corpus = []
+    for i, size in enumerate(sizes):
+        width, height = (size, size) if i % 2 == 0 else (size, size * 4 // 3)
+        corpus.append(make_portrait(max(width, height), seed=seed + i).resize((width, height)))
+    return corpus
+
+
+# ============================================================
+# rembg
+# ============================================================
+
+class _StubRembgSession:
+    """離線時取代 rembg 模型：以邊緣白色區域為背景（rembg.remove 的其餘流程照常執行）"""
+
+    def predict(self, image: Image.Image, *args, **kwargs) -> List[Image.Image]:
+        background = edge_background_mask(np.array(image.convert("RGB")))
+        return [Image.fromarray(np.where(background, 0, 255).astype(np.uint8), "L")]
+
+
+def _setup_rembg(mode: str) -> str:
+    """回傳實際使用的 rembg（model / stub）"""
+    from src.rembg_session import REMBG_SESSIONS
+    if mode != "stub":
+        try:
+            REMBG_SESSIONS.get_session()
+            return "model"
+        except Exception as e:
+            if mode == "model":
+                raise
+            print(f"⚠️ rembg 模型無法載入，改用替身：{e}", file=sys.stderr)
+    REMBG_SESSIONS._session = _StubRembgSession()
+    return "stub"
+
+
+# ============================================================
+# 追蹤 span → 每步驟耗時 / CPU
+# ============================================================
+
+class _CpuSpan(tracing.Span):
+    """額外記錄期間的行程 CPU 時間（profile 輪次逐一執行，不與其他步驟重疊）"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cpu_start = time.process_time()
+        self.cpu = 0.0
+
+    def end(self) -> None:
+        super().end()
+        self.cpu = time.process_time() - self.cpu_start
+
+
+class _SpanCollector:
+    """取代 TRACER：結束的 span 留在記憶體"""
+    enabled = True
+
+    def __init__(self):
+        self.spans: List[_CpuSpan] = []
+
+    def submit(self, span: _CpuSpan) -> None:
+        self.spans.append(span)
+
+
+@contextmanager
+def _collect_spans():
+    collector = _SpanCollector()
+    saved = tracing.TRACER, tracing.Span
+    tracing.TRACER, tracing.Span = collector, _CpuSpan
+    try:
+        yield collector
+    finally:
+        tracing.TRACER, tracing.Span = saved
+
+
+def _summarize_spans(spans: List[_CpuSpan]) -> Dict[str, dict]:
+    """步驟（風格 span 的直接子 span）與內層操作，依名稱彙整耗時與 CPU"""
+    style_ids = {span.span_id for span in spans if span.name == "pipeline.style"}
+    step_ids = {span.span_id for span in spans if span.parent_id in style_ids}
+    groups = {"steps": defaultdict(list), "operations": defaultdict(list)}
+    for span in spans:
+        if span.span_id in step_ids:
+            if span.attributes.get("pipeline.outcome") != "skipped":
+                groups["steps"][span.name].append(span)
+        elif span.span_id not in style_ids:
+            groups["operations"][span.name].append(span)
+    return {
+        group: {
+            name: {"wall": summarize([s.duration for s in items]), "cpu": summarize([s.cpu for s in items])}
+            for name, items in members.items()
+        }
+        for group, members in groups.items()
+    }
+
+
+# ============================================================
+# 執行
+# ============================================================
+
+async def _measure(run_one: Callable[[Image.Image], Awaitable], jobs: List[Image.Image], concurrency: int) -> dict:
+    """以 concurrency 並行執行，回傳吞吐量、延遲、CPU 時間與錯誤"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], Counter()
+
+    async def one(image):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await run_one(image)
+            except Exception as e:
+                errors[type(e).__name__] += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    await asyncio.gather(*(one(image) for image in jobs))
+    wall = time.perf_counter() - wall_start
+    return {
+        "runs": len(jobs),
+        "errors": dict(errors),
+        "wall_seconds": round(wall, 3),
+        "throughput_per_s": round(len(latencies) / wall, 3) if wall else 0.0,
+        "latency": summarize(latencies),
+        "cpu_seconds": round(time.process_time() - cpu_start, 3),
+    }
+
+
+def _runners(target: dict):
+    """回傳 (並行執行用, profile 用) 的單張執行函式"""
+    if target["entry"] == "fine_grained":
+        from src.metrics import style_run
+        from src.pipeline.runner import RunState, execute_step
+        from src.pipeline.scheduler import run_steps
+        from src.pipeline.style_configs_fine_grained import FINE_GRAINED_STYLES
+        style_id = target["name"]
+        steps = FINE_GRAINED_STYLES[style_id]["steps"]
+
+        async def run(image):
+            with style_run(style_id):
+                await run_steps(steps, image, {}, use_cache=False)
+
+        async def profile(image):
+            # 逐一執行（不預先執行、不重疊），步驟 CPU 時間才不互相重複計入
+            state = RunState(image, {}, "")
+            with style_run(style_id):
+                for step in steps:
+                    await execute_step(step, state, use_cache=False)
+
+        return run, profile
+
+    from src.style_converter import StyleConverter
+    converter = StyleConverter()
+    kwargs = CONVERTER_PATHS[target["name"]]
+
+    async def run(image):
+        await asyncio.to_thread(converter.apply_style, image, **kwargs)
+
+    return run, run
+
+
+def run_target(target: dict, options: dict) -> dict:
+    """執行一個目標（風格或 StyleConverter 路徑 × 圖片類型）"""
+    RATE_LIMIT_CONFIG.text_rpm = RATE_LIMIT_CONFIG.image_rpm = 1e9
+    RATE_LIMIT_CONFIG.backoff_base = options["backoff"]
+    API_CONFIG.use_gateway = False
+    rembg = _setup_rembg(options["rembg"])
+
+    behavior = MockBehavior(**{**options["mock"], "image_type": target["image_type"]})
+    client = MockGeminiClient(behavior)
+    corpus = make_corpus(options["sizes"], options["seed"])
+    jobs = [image for _ in range(options["repeat"]) for image in corpus]
+
+    async def main():
+        run, profile = _runners(target)
+        for image in corpus[:options["warmup"]]:
+            try:
+                await run(image)
+            except Exception:
+                pass
+        client.calls.clear()
+        measured = await _measure(run, jobs, options["concurrency"])
+        calls = dict(client.calls)
+        with _collect_spans() as collector:
+            for image in corpus:
+                try:
+                    await profile(image)
+                except Exception:
+                    pass
+        return measured, calls, _summarize_spans(collector.spans)
+
+    # 處理過程的訊息改印到 stderr，stdout 只留 JSON 報告
+    with install_mock(client), redirect_stdout(sys.stderr):
+        measured, calls, breakdown = asyncio.run(main())
+
+    from src.pipeline.executor import shutdown_executors
+    shutdown_executors()
+    return {
+        **target,
+        **measured,
+        "gemini_calls": calls,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "rembg": rembg,
+        **breakdown,
+    }
+
+
+def _run_isolated(target: dict, options: dict) -> dict:
+    # spawn：每個目標從乾淨的行程開始，峰值 RSS 互不影響
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(run_target, target, options).result()
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main():
+    from src.pipeline.style_configs_fine_grained import FINE_GRAINED_STYLES
+
+    parser = argparse.ArgumentParser(description="離線端到端基準（Gemini 本機替身）")
+    parser.add_argument("--styles", nargs="*", default=list(FINE_GRAINED_STYLES), help="FINE_GRAINED_STYLES 風格")
+    parser.add_argument("--converter-paths", nargs="*", default=list(CONVERTER_PATHS), help="StyleConverter 路徑")
+    parser.add_argument("--image-types", nargs="+", default=["photo", "illustration"], help="替身回答的圖片類型")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[384, 768, 1536, 3072], help="測試圖長邊")
+    parser.add_argument("--repeat", type=int, default=3, help="每張圖重複次數")
+    parser.add_argument("--warmup", type=int, default=1, help="量測前預熱張數")
+    parser.add_argument("--concurrency", type=int, default=1, help="同時處理張數")
+    parser.add_argument("--text-latency-ms", type=float, default=50, help="替身文字請求延遲")
+    parser.add_argument("--image-latency-ms", type=float, default=200, help="替身圖片生成延遲")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延遲隨機比例")
+    parser.add_argument("--quota-rate", type=float, default=0.0, help="429 比例（重試）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="500 比例（失敗）")
+    parser.add_argument("--backoff", type=float, default=0.05, help="429 退避基礎秒數")
+    parser.add_argument("--rembg", choices=["auto", "model", "stub"], default="auto", help="去背模型")
+    parser.add_argument("--no-isolate", action="store_true", help="所有目標在同一行程執行（峰值 RSS 為累計值）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="輸出 JSON 檔（預設印出）")
+    args = parser.parse_args()
+
+    unknown = [style for style in args.styles if style not in FINE_GRAINED_STYLES]
+    unknown += [path for path in args.converter_paths if path not in CONVERTER_PATHS]
+    if unknown:
+        parser.error(f"未知的風格 / 路徑：{', '.join(unknown)}")
+
+    mock = MockBehavior(
+        text_latency=args.text_latency_ms / 1000,
+        image_latency=args.image_latency_ms / 1000,
+        jitter=args.jitter,
+        quota_rate=args.quota_rate,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    options = {
+        "mock": {key: value for key, value in asdict(mock).items() if key != "image_type"},
+        "sizes": args.sizes,
+        "repeat": args.repeat,
+        "warmup": args.warmup,
+        "concurrency": args.concurrency,
+        "backoff": args.backoff,
+        "rembg": args.rembg,
+        "seed": args.seed,
+    }
+    targets = [
+        {"entry": "fine_grained", "name": style, "image_type": image_type}
+        for style in args.styles for image_type in args.image_types
+    ] + [
+        {"entry": "style_converter", "name": path, "image_type": image_type}
+        for path in args.converter_paths for image_type in args.image_types
+    ]
+
+    results = []
+    for target in targets:
+        print(f"▶ {target['entry']} / {target['name']} / {target['image_type']}", file=sys.stderr)
+        results.append(run_target(target, options) if args.no_isolate else _run_isolated(target, options))
+
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "options": options,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ 已寫入 {args.output}", file=sys.stderr)
+    else:
+        print_json(report)
+
+
+if __name__ == "__main__":
+    main()
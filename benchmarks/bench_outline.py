@@ -0,0 +1,99 @@
+"""白色描邊：迭代 3×3 膨脹（舊版） vs 距離轉換（新版）
+
+回歸檢查（寬度 8，以凍結的舊版 add_white_outline 輸出為準，比對 StyleConverter.add_white_outline）：
+- 預設（方角，rounded=False）必須逐像素相同
+- 圓角模式只允許在轉角處少於方角（新描邊 ⊆ 舊描邊）
+
+    python -m benchmarks.bench_outline --widths 8 30 50
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+from scipy import ndimage
+
+from .common import make_portrait, print_json
+
+
+def legacy_add_white_outline(image: Image.Image, outline_width: int = 8) -> Image.Image:
+    """舊版 StyleConverter.add_white_outline（重複 outline_width 次 3×3 膨脹）"""
+    width, height = image.size
+    result = Image.new("RGBA", (width + outline_width * 2, height + outline_width * 2), (0, 0, 0, 0))
+    result.paste(image, (outline_width, outline_width), image)
+
+    alpha_array = np.array(result.split()[3])
+    for _ in range(outline_width):
+        alpha_array = ndimage.binary_dilation(alpha_array, structure=np.ones((3, 3)))
+
+    original_alpha = np.array(result.split()[3])
+    mask = alpha_array & (~original_alpha.astype(bool))
+
+    result_array = np.array(result)
+    result_array[mask] = (255, 255, 255, 255)
+    return Image.fromarray(result_array, "RGBA")
+
+
+def add_white_outline(image: Image.Image, outline_width: int, rounded: bool = None) -> Image.Image:
+    """正式版 StyleConverter.add_white_outline（不執行 __init__，不需建立 API 客戶端；rounded=None 使用預設值）"""
+    from src.style_converter import StyleConverter
+    converter = StyleConverter.__new__(StyleConverter)
+    if rounded is None:
+        return converter.add_white_outline(image, outline_width)
+    return converter.add_white_outline(image, outline_width, rounded=rounded)
+
+
+def _subject(size: int) -> Image.Image:
+    """去背後的人像：白色背景轉透明"""
+    data = np.array(make_portrait(size).convert("RGBA"))
+    data[(data[:, :, :3] > 240).all(axis=2), 3] = 0
+    return Image.fromarray(data, "RGBA")
+
+
+def _best_of(func, repeat: int = 3) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return round(min(timings) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="白色描邊基準與回歸檢查")
+    parser.add_argument("--size", type=int, default=1000, help="圖片邊長")
+    parser.add_argument("--widths", type=int, nargs="+", default=[8, 30, 50], help="描邊寬度")
+    args = parser.parse_args()
+
+    image = _subject(args.size)
+
+    # 回歸檢查（寬度 8）
+    legacy = np.array(legacy_add_white_outline(image, 8))
+    default = np.array(add_white_outline(image, 8))
+    rounded = np.array(add_white_outline(image, 8, rounded=True))
+    legacy_outline = legacy[:, :, 3] > 0
+    rounded_outline = rounded[:, :, 3] > 0
+    regression = {
+        "default_identical": bool(np.array_equal(legacy, default)),
+        "rounded_subset_of_legacy": bool(np.all(legacy_outline | ~rounded_outline)),
+        "rounded_corner_pixels_removed": int(np.sum(legacy_outline & ~rounded_outline)),
+    }
+
+    timings = {}
+    for width in args.widths:
+        timings[width] = {
+            "legacy_ms": _best_of(lambda: legacy_add_white_outline(image, width)),
+            "rounded_ms": _best_of(lambda: add_white_outline(image, width, rounded=True)),
+            "square_ms": _best_of(lambda: add_white_outline(image, width, rounded=False)),
+        }
+
+    print_json({"size": args.size, "regression_width_8": regression, "timings": timings})
+
+    if not (regression["default_identical"] and regression["rounded_subset_of_legacy"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
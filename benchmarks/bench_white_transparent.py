@@ -0,0 +1,79 @@
+"""make_white_transparent 微基準：逐標籤迴圈（舊版） vs bincount 查表（新版）
+
+同時驗證兩者輸出逐像素相同。
+
+    python -m benchmarks.bench_white_transparent --size 1024 --specks 400
+"""
+
+import argparse
+import time
+
+import numpy as np
+from scipy import ndimage
+
+from src.image_ops import edge_background_mask
+
+from .common import make_portrait, print_json, summarize
+
+
+def legacy_edge_background_mask(data: np.ndarray, threshold: int = 240) -> np.ndarray:
+    """舊版實作（每個邊緣標籤各做一次全圖遮罩與 np.sum）"""
+    white_mask = (data[:, :, 0] > threshold) & (data[:, :, 1] > threshold) & (data[:, :, 2] > threshold)
+    labeled, _ = ndimage.label(white_mask)
+
+    edge_labels = set()
+    edge_labels.update(labeled[0, :])
+    edge_labels.update(labeled[-1, :])
+    edge_labels.update(labeled[:, 0])
+    edge_labels.update(labeled[:, -1])
+    edge_labels.discard(0)
+
+    person_mask = (data[:, :, 0] < 245) | (data[:, :, 1] < 245) | (data[:, :, 2] < 245)
+    if np.any(person_mask):
+        person_mask_expanded = ndimage.binary_dilation(person_mask, structure=np.ones((20, 20)))
+    else:
+        person_mask_expanded = np.zeros_like(person_mask)
+
+    bg_mask = np.zeros_like(white_mask)
+    for label in edge_labels:
+        region_mask = (labeled == label)
+        overlap = np.sum(region_mask & person_mask_expanded)
+        total = np.sum(region_mask)
+        if total > 0 and overlap / total < 0.3:
+            bg_mask = bg_mask | region_mask
+    return bg_mask
+
+
+def _time(func, data, repeat: int) -> list:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(data)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="make_white_transparent 微基準")
+    parser.add_argument("--size", type=int, default=1024, help="圖片邊長")
+    parser.add_argument("--specks", type=int, default=400, help="邊緣雜點數（決定邊緣標籤數）")
+    parser.add_argument("--repeat", type=int, default=5, help="重複次數")
+    args = parser.parse_args()
+
+    data = np.array(make_portrait(args.size, args.specks).convert("RGBA"))
+    _, num_labels = ndimage.label((data[:, :, :3] > 240).all(axis=2))
+
+    legacy = legacy_edge_background_mask(data)
+    vectorized = edge_background_mask(data)
+
+    print_json({
+        "size": args.size,
+        "labels": int(num_labels),
+        "identical": bool(np.array_equal(legacy, vectorized)),
+        "legacy": summarize(_time(legacy_edge_background_mask, data, args.repeat)),
+        "vectorized": summarize(_time(edge_background_mask, data, args.repeat)),
+    })
+
+
+if __name__ == "__main__":
+    main()
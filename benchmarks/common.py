@@ -0,0 +1,69 @@
+"""基準測試共用工具 - 合成測試圖片與統計"""
+
+import json
+import math
+import random
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+def make_portrait(size: int = 1024, specks: int = 200, seed: int = 0) -> Image.Image:
+    """
+    產生類似 Gemini 輸出的測試圖：白底、中央深色人形、邊緣散落白色小點
+
+    邊緣的白點會形成大量與邊緣相連的小連通區域（make_white_transparent 的最壞情況）。
+    """
+    rng = random.Random(seed)
+    image = Image.new("RGB", (size, size), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+
+    # 頭 + 肩膀
+    cx = size // 2
+    draw.ellipse((cx - size // 6, size // 6, cx + size // 6, size // 2), fill=(200, 150, 120))
+    draw.ellipse((cx - size // 3, size // 2, cx + size // 3, size + size // 4), fill=(40, 60, 110))
+    # 衣服上的亮部（不應被轉透明）
+    draw.rectangle((cx - size // 20, size * 11 // 20, cx + size // 20, size * 13 // 20), fill=(250, 250, 250))
+
+    # 邊緣灰色雜點，每個雜點中間留一個貼邊的白點 → 大量與邊緣相連的小白色區域
+    for _ in range(specks):
+        edge = rng.choice("tblr")
+        pos = rng.randrange(4, size - 12)
+        if edge == "t":
+            grey, white = (pos, 0, pos + 8, 8), (pos + 3, 0, pos + 5, 2)
+        elif edge == "b":
+            grey, white = (pos, size - 9, pos + 8, size - 1), (pos + 3, size - 3, pos + 5, size - 1)
+        elif edge == "l":
+            grey, white = (0, pos, 8, pos + 8), (0, pos + 3, 2, pos + 5)
+        else:
+            grey, white = (size - 9, pos, size - 1, pos + 8), (size - 3, pos + 3, size - 1, pos + 5)
+        draw.rectangle(grey, fill=(200, 200, 200))
+        draw.rectangle(white, fill=(255, 255, 255))
+
+    return image
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近排名法百分位數"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """延遲統計（秒 → 毫秒）"""
+    return {
+        "count": len(values),
+        "mean_ms": round(float(np.mean(values)) * 1000, 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(max(values) * 1000, 2) if values else 0.0,
+    }
+
+
+def print_json(data) -> None:
+    print(json.dumps(data, ensure_ascii=False, indent=2))
@@ -0,0 +1,139 @@
+"""Gemini 本機替身 - 取代 genai.Client，離線重現 API 呼叫
+
+- 圖片生成請求回傳固定的測試圖（PNG），文字請求依設定回傳圖片類型 / 身體範圍
+- 延遲、配額錯誤（429，經速率限制器重試）與伺服器錯誤（直接失敗）的比例可設定
+- 以固定亂數種子決定每次呼叫的延遲與錯誤，同樣的參數得到同樣的序列
+
+    with install_mock(MockGeminiClient(MockBehavior(image_latency=0.5))):
+        ...  # 所有經過 gemini_pool 的呼叫（含 StyleConverter）都送到替身
+"""
+
+import asyncio
+import io
+import json
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Optional, Tuple
+
+from google.genai import types
+from PIL import Image
+
+from src.gemini_pool import GEMINI_POOL
+
+from .common import make_portrait
+
+
+@dataclass
+class MockBehavior:
+    """替身的回應設定"""
+    # 每次呼叫的延遲（秒），實際值在 ±jitter 比例內隨機
+    text_latency: float = 0.05
+    image_latency: float = 0.2
+    jitter: float = 0.2
+    # 回傳 429 RESOURCE_EXHAUSTED 的比例（速率限制器會重試）
+    quota_rate: float = 0.0
+    # 回傳 500 INTERNAL 的比例（呼叫失敗）
+    error_rate: float = 0.0
+    # 分析請求的回答
+    image_type: str = "photo"
+    body_extent: str = "head_chest"
+    seed: int = 0
+
+
+class MockAPIError(Exception):
+    """模擬 google.genai 的 APIError（code / status 與 is_quota_error 的判斷一致）"""
+
+    def __init__(self, code: int, status: str):
+        super().__init__(f"{code} {status}（mock）")
+        self.code = code
+        self.status = status
+
+
+def _text_response(text: str) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(candidates=[
+        types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))
+    ])
+
+
+def _image_response(png: bytes) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(candidates=[
+        types.Candidate(content=types.Content(role="model", parts=[
+            types.Part(text="mock"),
+            types.Part(inline_data=types.Blob(data=png, mime_type="image/png")),
+        ]))
+    ])
+
+
+class MockGeminiClient:
+    """genai.Client 的替身（models.generate_content 與 aio.models.generate_content）"""
+
+    def __init__(self, behavior: MockBehavior = None, fixture: Image.Image = None):
+        self.behavior = behavior or MockBehavior()
+        fixture = fixture if fixture is not None else make_portrait(1024)
+        buffer = io.BytesIO()
+        fixture.save(buffer, format="PNG")
+        self._fixture_png = buffer.getvalue()
+        self._rng = random.Random(self.behavior.seed)
+        self._lock = threading.Lock()
+        self.calls: Counter = Counter()
+        self.models = SimpleNamespace(generate_content=self._generate_content)
+        self.aio = SimpleNamespace(models=SimpleNamespace(generate_content=self._generate_content_async))
+
+    def _plan(self, request: dict) -> Tuple[float, Optional[MockAPIError], types.GenerateContentResponse]:
+        """決定這次呼叫的延遲、錯誤與回應"""
+        config = request.get("config")
+        modalities = getattr(config, "response_modalities", None) or []
+        behavior = self.behavior
+        if "IMAGE" in modalities:
+            kind, latency = "image", behavior.image_latency
+            response = _image_response(self._fixture_png)
+        else:
+            kind, latency = "text", behavior.text_latency
+            if getattr(config, "response_mime_type", None) == "application/json":
+                text = json.dumps({"image_type": behavior.image_type, "body_extent": behavior.body_extent})
+            else:
+                # 單獨的類型 / 身體範圍檢測都以關鍵字判斷，一起回答即可
+                text = f"{behavior.image_type} {behavior.body_extent}".upper()
+            response = _text_response(text)
+
+        with self._lock:
+            latency *= self._rng.uniform(1 - behavior.jitter, 1 + behavior.jitter)
+            roll = self._rng.random()
+            self.calls[kind] += 1
+            error = None
+            if roll < behavior.quota_rate:
+                error = MockAPIError(429, "RESOURCE_EXHAUSTED")
+                self.calls["quota_errors"] += 1
+            elif roll < behavior.quota_rate + behavior.error_rate:
+                error = MockAPIError(500, "INTERNAL")
+                self.calls["errors"] += 1
+        return max(0.0, latency), error, response
+
+    def _generate_content(self, **request):
+        latency, error, response = self._plan(request)
+        time.sleep(latency)
+        if error is not None:
+            raise error
+        return response
+
+    async def _generate_content_async(self, **request):
+        latency, error, response = self._plan(request)
+        await asyncio.sleep(latency)
+        if error is not None:
+            raise error
+        return response
+
+
+@contextmanager
+def install_mock(client: MockGeminiClient):
+    """讓 gemini_pool 在區塊內回傳替身（get_genai_client、StyleConverter 皆經過這裡）"""
+    GEMINI_POOL.get_client = lambda api_key=None: client
+    try:
+        yield client
+    finally:
+        del GEMINI_POOL.get_client
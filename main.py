@@ -4,6 +4,7 @@
 
 使用方式:
     python main.py --input photo.jpg --output result.png
+    python main.py batch photos/ --output out/ --style i4_detailed --workers 4 --rpm 10
 """
 
 import argparse
@@ -62,7 +63,56 @@ def process_image(
     return str(output_path)
 
 
+def run_batch(argv: list) -> None:
+    """批次處理整個資料夾或清單（可中斷後續跑）"""
+    import asyncio
+    from src.batch import BatchJob
+    from src.pipeline.executor import shutdown_executors
+    
+    parser = argparse.ArgumentParser(prog="main.py batch", description="批次轉換整個資料夾的頭像（細粒度 Pipeline）")
+    parser.add_argument("source", help="圖片資料夾，或清單檔（.json / 每行一個路徑）")
+    parser.add_argument("-o", "--output", required=True, help="輸出資料夾（進度日誌也存於此）")
+    parser.add_argument("-s", "--style", default="i4_detailed", help="風格 ID（預設 i4_detailed）")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="同時處理的圖片數")
+    parser.add_argument("--rpm", type=float, default=None, help="每分鐘 Gemini 請求數上限")
+    parser.add_argument("-q", "--quiet", action="store_true", help="安靜模式")
+    args = parser.parse_args(argv)
+    
+    job = BatchJob(args.source, args.output, args.style, args.workers, args.rpm)
+    
+    def on_item(item, record):
+        if args.quiet:
+            return
+        done = job.completed + job.failed
+        if record["status"] == "done":
+            note = "（快取）" if record["cache_hit"] else ""
+            print(f"✅ [{done}/{len(job.items) - job.skipped}] {item.key} → {record['output']}{note} {record['seconds']}s")
+        else:
+            print(f"❌ [{done}/{len(job.items) - job.skipped}] {item.key}：{record['error']}")
+    
+    if not args.quiet:
+        print(f"📂 共 {len(job.items)} 張 | 風格: {args.style} | 並行: {job.workers} | 每分鐘請求: {job.requests_per_minute}")
+    
+    try:
+        summary = asyncio.run(job.run(on_item))
+    finally:
+        shutdown_executors()
+    
+    if not args.quiet:
+        print(f"🎉 完成 {summary['completed']} | 失敗 {summary['failed']} | 略過（已完成）{summary['skipped']} | 耗時 {summary['elapsed_seconds']}s")
+    if summary["failed"]:
+        sys.exit(1)
+
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        try:
+            run_batch(sys.argv[2:])
+        except (FileNotFoundError, ValueError) as e:
+            print(f"❌ 批次處理失敗: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+    
     parser = argparse.ArgumentParser(description="向量插畫風格轉換（半寫實企業頭像、賽璐璐著色、隨機高光、透明背景）")
     parser.add_argument("-i", "--input", required=True, help="輸入圖片路徑")
     parser.add_argument("-o", "--output", default=None, help="輸出圖片路徑")
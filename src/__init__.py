@@ -5,6 +5,8 @@ from .image_processor import ImageProcessor
 from .style_converter import StyleConverter
 from .config import STYLE_CONFIG, API_CONFIG
 from .utils import retry_on_quota_error, prepare_image_for_api
+from .gemini_pool import get_genai_client, get_client_stats
+from .artifact import ImageArtifact, artifact_for
 from .prompts import get_style_prompt, ANALYZE_PROMPT
 
 __all__ = [
@@ -15,6 +17,10 @@ __all__ = [
     "API_CONFIG",
     "retry_on_quota_error",
     "prepare_image_for_api",
+    "get_genai_client",
+    "get_client_stats",
+    "ImageArtifact",
+    "artifact_for",
     "get_style_prompt",
     "ANALYZE_PROMPT",
 ]
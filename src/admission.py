@@ -0,0 +1,140 @@
+"""准入控制 - 限制同時執行的工作數，超載時拒絕新工作
+
+- 同時執行：全域上限（JOB_WORKERS）+ 每個風格的上限（i4_detailed 比 universal_intelligent 昂貴得多）；
+  多風格工作佔一個全域名額，並佔用其中每個風格的名額
+- 入口：websocket 工作經 JobManager 佇列以 try_acquire 取得名額；不經佇列的入口以 acquire 等待名額
+- 記憶體：行程 RSS 超過門檻時暫停啟動新工作；排隊中的工作等待記憶體回落
+- 卸載：佇列已滿或記憶體超過門檻時拒絕新工作（websocket 以 1013 Try Again Later 關閉，
+  相當於 HTTP 503）
+"""
+
+import asyncio
+import os
+import threading
+from collections import Counter
+from typing import Dict, Optional
+
+from .config import ADMISSION_CONFIG, JOB_CONFIG
+
+
+class OverCapacityError(RuntimeError):
+    """伺服器超載，暫時不接受新工作"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def current_rss_mb() -> Optional[float]:
+    """目前行程的常駐記憶體（MB；無法取得時回傳 None）"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class AdmissionController:
+    """全域與每風格的並行上限、記憶體與佇列長度門檻"""
+
+    def __init__(
+        self,
+        max_active: int = None,
+        style_limits: Dict[str, int] = None,
+        max_queue: int = None,
+        max_rss_mb: float = None
+    ):
+        self.max_active = max(1, max_active if max_active is not None else JOB_CONFIG.workers)
+        self.style_limits = dict(style_limits if style_limits is not None else ADMISSION_CONFIG.style_limits)
+        self.max_queue = max_queue if max_queue is not None else ADMISSION_CONFIG.max_queue
+        self.max_rss_mb = max_rss_mb if max_rss_mb is not None else ADMISSION_CONFIG.max_rss_mb
+        self._lock = threading.Lock()
+        # 執行中的工作數（全域上限）與每個風格佔用的名額
+        self._jobs = 0
+        self._active: Counter = Counter()
+        # 以 acquire 等待名額的呼叫端數（計入排隊長度）
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def active(self) -> int:
+        with self._lock:
+            return self._jobs
+
+    def memory_exceeded(self) -> bool:
+        if self.max_rss_mb <= 0:
+            return False
+        rss = current_rss_mb()
+        return rss is not None and rss >= self.max_rss_mb
+
+    def check_capacity(self, queue_depth: int = 0) -> None:
+        """是否可接受新工作（超載時拋出 OverCapacityError；排隊數含以 acquire 等待者）"""
+        reason = None
+        queue_depth += self.waiting
+        if self.max_queue > 0 and queue_depth >= self.max_queue:
+            reason = f"排隊工作已達上限（{queue_depth}）"
+        elif self.memory_exceeded():
+            reason = "伺服器記憶體不足"
+        if reason is not None:
+            with self._lock:
+                self.rejected += 1
+            raise OverCapacityError(f"伺服器忙碌：{reason}，請稍後再試", ADMISSION_CONFIG.retry_after)
+
+    def try_acquire(self, *styles: str) -> bool:
+        """取得執行名額（全域、每個風格皆有空位且記憶體未超過門檻）"""
+        if self.memory_exceeded():
+            return False
+        with self._lock:
+            if self._jobs >= self.max_active:
+                return False
+            for style in styles:
+                limit = self.style_limits.get(style)
+                if limit is not None and self._active[style] >= limit:
+                    return False
+            self._jobs += 1
+            self._active.update(styles)
+            self.admitted += 1
+            return True
+
+    async def acquire(self, *styles: str, interval: float = 1.0) -> None:
+        """等待取得執行名額（不經 JobManager 佇列的入口；記憶體可能自行回落，定期重新檢查）"""
+        if self.try_acquire(*styles):
+            return
+        with self._lock:
+            self.waiting += 1
+        try:
+            while not self.try_acquire(*styles):
+                await asyncio.sleep(interval)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+    def release(self, *styles: str) -> None:
+        with self._lock:
+            self._jobs -= 1
+            self._active.subtract(styles)
+            for style in set(styles):
+                if self._active[style] <= 0:
+                    del self._active[style]
+
+    def stats(self) -> dict:
+        rss = current_rss_mb()
+        with self._lock:
+            return {
+                "jobs": self._jobs,
+                "active": dict(self._active),
+                "waiting": self.waiting,
+                "max_active": self.max_active,
+                "style_limits": dict(self.style_limits),
+                "max_queue": self.max_queue,
+                "rss_mb": round(rss, 1) if rss is not None else None,
+                "max_rss_mb": self.max_rss_mb,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
+
+
+# 全域准入控制（所有處理入口共用）
+ADMISSION = AdmissionController()
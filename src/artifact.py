@@ -0,0 +1,134 @@
+"""圖片產物 - PIL 圖片與延遲計算、記憶化的各種編碼
+
+同一次處理中，同一張圖常被重複編碼：檢測呼叫、生成呼叫、預覽、結果快取、最終回傳……
+artifact_for(image) 取得該圖片唯一的 ImageArtifact，各組件與 websocket 層共用，
+每種編碼（PNG、指定品質的 JPEG、base64、內容雜湊、API 傳輸、預覽縮圖）最多計算一次。
+
+圖片視為不可變：步驟之間以新圖片傳遞，不會原地修改已編碼的圖片。
+ImageArtifact 只以弱參照指向圖片，登錄表不會讓圖片存活；圖片被回收時連同編碼一起移除。
+"""
+
+import base64
+import hashlib
+import io
+import threading
+import weakref
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+from .tracing import traced
+
+
+class ImageArtifact:
+    """一張圖片與其記憶化的編碼（以弱參照指向圖片，呼叫端需持有圖片）"""
+
+    def __init__(self, image: Image.Image):
+        self._image_ref = weakref.ref(image)
+        self._lock = threading.Lock()
+        self._cache: Dict[tuple, object] = {}
+
+    def _memo(self, key: tuple, compute):
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        # 編碼在鎖外進行（同一鍵同時計算兩次無害，結果相同）
+        value = compute()
+        with self._lock:
+            return self._cache.setdefault(key, value)
+
+    @property
+    def image(self) -> Image.Image:
+        image = self._image_ref()
+        if image is None:
+            raise ReferenceError("ImageArtifact 的圖片已被回收")
+        return image
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.image.size
+
+    def encode(self, fmt: str = "PNG", quality: Optional[int] = None) -> bytes:
+        """編碼為指定格式（PNG 忽略 quality）"""
+        fmt = fmt.upper()
+        if fmt == "PNG":
+            quality = None
+
+        @traced("image.encode", format=fmt)
+        def compute():
+            image = self.image
+            if fmt == "JPEG" and image.mode != "RGB":
+                from .utils import flatten_to_rgb
+                image = flatten_to_rgb(image)
+            buffered = io.BytesIO()
+            if quality is None:
+                image.save(buffered, format=fmt)
+            else:
+                image.save(buffered, format=fmt, quality=quality)
+            return buffered.getvalue()
+
+        return self._memo(("encode", fmt, quality), compute)
+
+    def png(self) -> bytes:
+        return self.encode("PNG")
+
+    def jpeg(self, quality: int = 90) -> bytes:
+        return self.encode("JPEG", quality)
+
+    def base64(self, fmt: str = "PNG", quality: Optional[int] = None) -> str:
+        return self._memo(("base64", fmt.upper(), quality), lambda: base64.b64encode(self.encode(fmt, quality)).decode())
+
+    def data_url(self, fmt: str = "PNG", quality: Optional[int] = None) -> str:
+        from .utils import MIME_TYPES
+        return f"data:{MIME_TYPES[fmt.upper()]};base64,{self.base64(fmt, quality)}"
+
+    def content_hash(self) -> str:
+        """解碼後像素的 SHA-256（與 hash_image_pixels 相同）"""
+        def compute():
+            h = hashlib.sha256()
+            h.update(f"{self.image.mode}:{self.image.width}x{self.image.height}:".encode())
+            h.update(self.image.tobytes())
+            return h.hexdigest()
+        return self._memo(("hash",), compute)
+
+    def api_payload(self, purpose: str) -> Tuple[bytes, str]:
+        """依呼叫類型（analysis / generation）的解析度策略編碼，回傳 (bytes, MIME type)"""
+        from .utils import api_image_policy, encode_with_policy
+        policy = api_image_policy(purpose)
+        encode = traced("image.encode", purpose=purpose)(encode_with_policy)
+        return self._memo(("api", policy), lambda: encode(self.image, policy))
+
+    def preview(self) -> Tuple[bytes, str]:
+        """預覽縮圖，回傳 (bytes, MIME type)"""
+        from .config import PREVIEW_CONFIG
+        from .preview_store import MEDIA_TYPES, encode_preview
+        fmt = PREVIEW_CONFIG.format
+        key = ("preview", PREVIEW_CONFIG.max_side, fmt, PREVIEW_CONFIG.quality)
+        return self._memo(key, lambda: (encode_preview(self.image), MEDIA_TYPES[fmt]))
+
+
+# 圖片 id -> ImageArtifact；圖片被回收時由弱參照回呼移除
+# （PIL 圖片定義了 __eq__、不可雜湊，無法用 WeakKeyDictionary）
+_ARTIFACTS: Dict[int, ImageArtifact] = {}
+_ARTIFACTS_LOCK = threading.RLock()  # 弱參照回呼可能在持有鎖時觸發
+
+
+def artifact_for(image: Image.Image) -> ImageArtifact:
+    """取得圖片對應的 ImageArtifact（同一張圖永遠回傳同一個）"""
+    key = id(image)
+    with _ARTIFACTS_LOCK:
+        artifact = _ARTIFACTS.get(key)
+        if artifact is not None and artifact._image_ref() is image:
+            return artifact
+
+        artifact = ImageArtifact(image)
+
+        def _drop(ref, key=key, artifact=artifact):
+            with _ARTIFACTS_LOCK:
+                if _ARTIFACTS.get(key) is artifact:
+                    del _ARTIFACTS[key]
+
+        # 回呼的弱參照掛在 artifact 上：artifact 隨登錄表項目一起釋放
+        artifact._drop_ref = weakref.ref(image, _drop)
+        _ARTIFACTS[key] = artifact
+        return artifact
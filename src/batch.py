@@ -0,0 +1,333 @@
+"""批次處理 - 整個資料夾（或清單）的頭像以同一個細粒度風格並行轉換
+
+- 輸入：圖片資料夾，或清單檔（.json 陣列 / 每行一個路徑，可用「輸入,輸出」指定輸出）
+- 並行：workers 個圖片同時處理，Gemini 呼叫共用一個 token bucket（依配額設定每分鐘請求數）
+- 輸出：每張完成即寫入（原子寫入），不等整批結束
+- 續跑：每張的結果追加到輸出目錄的進度日誌，重跑時略過已完成的項目
+- HTTP 批次：每個項目經准入控制取得名額；工作登記保留最近 BATCH_MAX_JOBS 個已結束的工作
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from PIL import Image
+
+from .admission import AdmissionController
+from .artifact import artifact_for
+from .config import BATCH_CONFIG
+from .rate_limiter import TokenBucket
+from .upload import decode_upload
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+
+@dataclass
+class BatchItem:
+    """批次中的一張圖片"""
+    key: str
+    input: Path
+    output: Path
+
+
+def resolve_under(root: Path, path) -> Path:
+    """
+    解析 root 之下的路徑（相對路徑以 root 為基準，符號連結展開後比對）
+
+    Raises:
+        PermissionError: 路徑位於 root 之外（絕對路徑、".." 或符號連結）
+    """
+    root = root.resolve()
+    resolved = (root / path).resolve()
+    if not resolved.is_relative_to(root):
+        raise PermissionError(f"路徑不在批次根目錄之下：{path}")
+    return resolved
+
+
+def collect_items(source: str, output_dir: str, style_id: str, root: Optional[Path] = None) -> List[BatchItem]:
+    """
+    列出批次項目
+
+    Args:
+        source: 圖片資料夾或清單檔
+        output_dir: 輸出資料夾（未在清單指定輸出時使用）
+        style_id: 風格 ID（預設輸出檔名 "<檔名>_<副檔名>_<風格>.png" 的一部分）
+        root: 限制所有輸入、輸出路徑位於此目錄之下（HTTP API 使用；None 不限制）
+
+    Raises:
+        PermissionError: 指定 root 時，任一路徑位於 root 之外
+    """
+    source_path = resolve_under(root, source) if root is not None else Path(source)
+    output_root = resolve_under(root, output_dir) if root is not None else Path(output_dir)
+
+    used = set()
+
+    def default_output(path: Path) -> Path:
+        # 副檔名也是檔名的一部分（a.jpg、a.png 不互相覆寫）；清單中不同資料夾的同名檔案加上序號
+        name = f"{path.stem}_{path.suffix.lstrip('.').lower()}_{style_id}"
+        output, index = output_root / f"{name}.png", 1
+        while output in used:
+            index += 1
+            output = output_root / f"{name}_{index}.png"
+        used.add(output)
+        return output
+
+    if source_path.is_dir():
+        files = sorted(p for p in source_path.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        if root is not None:
+            # 資料夾內指向 root 之外的符號連結也要拒絕
+            files = [resolve_under(root, p) for p in files]
+        return [BatchItem(p.name, p, default_output(p)) for p in files]
+
+    if not source_path.exists():
+        raise FileNotFoundError(f"找不到輸入：{source}")
+
+    base = source_path.parent
+    entries = []
+    if source_path.suffix.lower() == ".json":
+        for entry in json.loads(source_path.read_text(encoding="utf-8")):
+            if isinstance(entry, str):
+                entries.append((entry, None))
+            else:
+                entries.append((entry["input"], entry.get("output")))
+    else:
+        for line in source_path.read_text(encoding="utf-8").splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = [part.strip() for part in line.split(",", 1)]
+            entries.append((parts[0], parts[1] if len(parts) > 1 and parts[1] else None))
+
+    items = []
+    for input_str, output_str in entries:
+        input_path = Path(input_str)
+        if not input_path.is_absolute():
+            input_path = base / input_path
+        output_path = Path(output_str) if output_str else default_output(input_path)
+        if not output_path.is_absolute() and output_str:
+            output_path = output_root / output_path
+        used.add(output_path)
+        if root is not None:
+            input_path, output_path = resolve_under(root, input_path), resolve_under(root, output_path)
+        items.append(BatchItem(input_str, input_path, output_path))
+    return items
+
+
+class BatchJournal:
+    """進度日誌（JSON Lines，每張完成或失敗追加一筆並落盤）"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, dict]:
+        """讀取每個項目的最後一筆紀錄（忽略寫到一半的行）"""
+        records = {}
+        if not self.path.exists():
+            return records
+        for line in self.path.read_text(encoding="utf-8").splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[record["key"]] = record
+        return records
+
+    def append(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def _load_image(path: Path) -> Image.Image:
+    with open(path, "rb") as f:
+        return decode_upload(f)
+
+
+def _save_image(image: Image.Image, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    # 與結果快取共用同一份 PNG 編碼
+    tmp.write_bytes(artifact_for(image).png())
+    os.replace(tmp, path)
+
+
+class BatchJob:
+    """一個批次工作"""
+
+    def __init__(
+        self,
+        source: str,
+        output_dir: str,
+        style_id: str,
+        workers: int = None,
+        requests_per_minute: float = None,
+        root: Optional[Path] = None,
+        admission: Optional[AdmissionController] = None
+    ):
+        """
+        root: 限制所有路徑位於此目錄之下（見 collect_items）
+        admission: 每個項目執行前取得名額（HTTP 批次與其他處理入口共用；None 不限制）
+        """
+        from .pipeline.style_configs_fine_grained import FINE_GRAINED_STYLES
+
+        if style_id not in FINE_GRAINED_STYLES:
+            raise ValueError(f"找不到風格：{style_id}（可選：{', '.join(FINE_GRAINED_STYLES)}）")
+
+        self.id = uuid.uuid4().hex[:12]
+        self.style_id = style_id
+        self.style_config = FINE_GRAINED_STYLES[style_id]
+        self.output_dir = resolve_under(root, output_dir) if root is not None else Path(output_dir)
+        self.workers = workers or BATCH_CONFIG.workers
+        self.requests_per_minute = requests_per_minute or BATCH_CONFIG.requests_per_minute
+        self.items = collect_items(source, output_dir, style_id, root)
+        self.admission = admission
+
+        self.status = "pending"
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.cache_hits = 0
+        self.errors: Dict[str, str] = {}
+        # 整個工作失敗的原因（項目失敗記在 errors）
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    async def run(self, on_item: Callable[[BatchItem, dict], None] = None) -> dict:
+        """
+        執行批次（已在進度日誌中完成、且輸出檔存在的項目會略過）
+
+        Args:
+            on_item: 每個項目完成或失敗後呼叫 (item, 紀錄)
+        """
+        from .pipeline.executor import run_cpu
+        from .pipeline.runner import run_style
+
+        self.status = "running"
+        self.started_at = time.time()
+        journal = BatchJournal(self.output_dir / BATCH_CONFIG.journal_name)
+        try:
+            pending = await run_cpu(self._pending_items, journal)
+        except BaseException:
+            self.status = "failed"
+            self.finished_at = time.time()
+            raise
+        bucket = TokenBucket.per_minute(self.requests_per_minute)
+        queue: "asyncio.Queue[BatchItem]" = asyncio.Queue()
+        for item in pending:
+            queue.put_nowait(item)
+
+        async def worker():
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                if self.admission is not None:
+                    await self.admission.acquire(self.style_id)
+                started = time.monotonic()
+                try:
+                    image = await run_cpu(_load_image, item.input)
+                    result, cache_hit = await run_style(image, self.style_id, self.style_config, bucket)
+                    await run_cpu(_save_image, result, item.output)
+                    record = {"key": item.key, "status": "done", "style": self.style_id, "output": str(item.output),
+                              "cache_hit": cache_hit, "seconds": round(time.monotonic() - started, 2)}
+                    self.completed += 1
+                    self.cache_hits += int(cache_hit)
+                except Exception as e:
+                    record = {"key": item.key, "status": "failed", "style": self.style_id, "error": str(e),
+                              "seconds": round(time.monotonic() - started, 2)}
+                    self.failed += 1
+                    self.errors[item.key] = str(e)
+                finally:
+                    if self.admission is not None:
+                        self.admission.release(self.style_id)
+                await run_cpu(journal.append, record)
+                if on_item is not None:
+                    on_item(item, record)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.workers, max(1, len(pending))))))
+            self.status = "done"
+        except BaseException:
+            self.status = "failed"
+            raise
+        finally:
+            self.finished_at = time.time()
+        return self.summary()
+
+    def _pending_items(self, journal: BatchJournal) -> List[BatchItem]:
+        """建立輸出目錄並讀取進度日誌，回傳尚未完成的項目（檔案 I/O，在執行緒池執行）"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        previous = journal.load()
+        pending = []
+        for item in self.items:
+            record = previous.get(item.key)
+            if record and record["status"] == "done" and record.get("style") == self.style_id and item.output.exists():
+                self.skipped += 1
+            else:
+                pending.append(item)
+        return pending
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        """背景執行結束：取回例外並記錄在工作上（避免 "Task exception was never retrieved"）"""
+        if task.cancelled():
+            self.status = "cancelled"
+            self.error = "已取消"
+        elif task.exception() is not None:
+            self.status = "failed"
+            self.error = str(task.exception()) or type(task.exception()).__name__
+            print(f"⚠️ 批次工作 {self.id} 失敗：{self.error}")
+        if self.finished_at is None:
+            self.finished_at = time.time()
+
+    def summary(self) -> dict:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.time()) - self.started_at, 1)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "style": self.style_id,
+            "output_dir": str(self.output_dir),
+            "total": len(self.items),
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "cache_hits": self.cache_hits,
+            "errors": self.errors,
+            "error": self.error,
+            "elapsed_seconds": elapsed,
+        }
+
+
+# 由 HTTP API 啟動的批次工作（進程內，依建立順序）
+BATCH_JOBS: Dict[str, BatchJob] = {}
+
+
+def prune_batch_jobs(keep: int = None) -> None:
+    """只保留最近 keep 個已結束的工作（執行中的工作不移除）"""
+    keep = BATCH_CONFIG.max_jobs if keep is None else keep
+    finished = [job_id for job_id, job in BATCH_JOBS.items() if job.task is not None and job.task.done()]
+    for job_id in finished[:max(0, len(finished) - keep)]:
+        del BATCH_JOBS[job_id]
+
+
+def start_batch_job(job: BatchJob) -> BatchJob:
+    """在目前的 event loop 背景執行批次工作"""
+    prune_batch_jobs()
+    BATCH_JOBS[job.id] = job
+    job.task = asyncio.get_running_loop().create_task(job.run())
+    job.task.add_done_callback(job._task_done)
+    return job
@@ -4,6 +4,11 @@ import os
 from dataclasses import dataclass, field
 from typing import Tuple
 
+from dotenv import load_dotenv
+
+# 各設定的預設值在匯入時讀取環境變數，.env 須先載入（不覆寫已設定的環境變數）
+load_dotenv()
+
 
 @dataclass
 class StyleConfig:
@@ -26,6 +31,7 @@ class APIConfig:
     model_image: str = "gemini-3-pro-image-preview"  # 圖片生成模型（發布：2025-11-20，最新）
     model_text: str = "gemini-2.5-flash"  # 文本分析/圖片理解模型（2025年最新，增強的object detection和segmentation）
     max_retries: int = 3
+    # 舊設定（已由 RateLimitConfig 的退避取代，不再使用，保留供相容）
     base_retry_delay: int = 60
     api_gateway_url: str = "https://api-gateway.cryptoxlab.workers.dev/api/openrouter/v1/chat/completions"
     use_gateway: bool = False  # 是否使用 API 網關（設為 False 使用 Gemini SDK）
@@ -52,7 +58,192 @@ class APIConfig:
         return os.getenv("OPENROUTER_API_KEY") or os.getenv("OPENROUTER_KEY") or ""
 
 
+@dataclass
+class RembgConfig:
+    """rembg 去背設定（可用環境變量覆寫）"""
+    # 可選模型：u2net（預設，176MB）、u2netp（輕量）、isnet、silueta
+    model: str = field(default_factory=lambda: os.getenv("REMBG_MODEL", "u2net"))
+    # ONNX Runtime intra-op 執行緒上限（避免小容器被單次推論吃滿 CPU）
+    intra_op_threads: int = field(default_factory=lambda: int(os.getenv("REMBG_THREADS", "2")))
+    # FastAPI 啟動時是否預熱模型（背景執行，不阻塞健康檢查）
+    warmup: bool = field(default_factory=lambda: os.getenv("REMBG_WARMUP", "1") == "1")
+
+
+@dataclass
+class CacheConfig:
+    """結果快取設定（可用環境變量覆寫）"""
+    # 後端：memory（預設）、disk、sqlite、none（停用）
+    backend: str = field(default_factory=lambda: os.getenv("RESULT_CACHE_BACKEND", "memory"))
+    # 位元組上限，超過時以 LRU 淘汰
+    max_bytes: int = field(default_factory=lambda: int(os.getenv("RESULT_CACHE_MAX_MB", "256")) * 1024 * 1024)
+    # disk：目錄；sqlite：目錄或 .db 檔案路徑
+    path: str = field(default_factory=lambda: os.getenv("RESULT_CACHE_PATH", ".cache/results"))
+    # 步驟中間產物快取（失敗重跑、共用前綴的風格可從最後一個快取產物繼續）
+    step_backend: str = field(default_factory=lambda: os.getenv("STEP_CACHE_BACKEND", "memory"))
+    step_max_bytes: int = field(default_factory=lambda: int(os.getenv("STEP_CACHE_MAX_MB", "128")) * 1024 * 1024)
+    step_path: str = field(default_factory=lambda: os.getenv("STEP_CACHE_PATH", ".cache/steps"))
+
+
+@dataclass
+class ExecutorConfig:
+    """Pipeline 執行器設定（可用環境變量覆寫）"""
+    # CPU 密集步驟（去背、編碼、縮放等）專用執行緒池大小；網路呼叫不佔用此池
+    cpu_workers: int = field(default_factory=lambda: int(os.getenv("PIPELINE_CPU_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
+
+@dataclass
+class UploadConfig:
+    """上傳設定（可用環境變量覆寫）"""
+    # 上傳檔案大小上限
+    max_bytes: int = field(default_factory=lambda: int(os.getenv("UPLOAD_MAX_MB", "25")) * 1024 * 1024)
+    # 像素數硬上限（解碼前依檔頭判斷，防止解壓縮炸彈）
+    max_pixels: int = field(default_factory=lambda: int(os.getenv("UPLOAD_MAX_PIXELS", str(50_000_000))))
+    # 解碼後最長邊（AI 只輸出 1K，過大的照片先縮小；JPEG 用 draft 在解碼時縮小）
+    max_side: int = field(default_factory=lambda: int(os.getenv("UPLOAD_MAX_SIDE", "2048")))
+    # 上傳暫存超過此大小改寫入暫存檔
+    spool_bytes: int = 1024 * 1024
+
+
+@dataclass
+class PreviewConfig:
+    """中間預覽設定（可用環境變量覆寫）"""
+    # 預覽縮圖最長邊
+    max_side: int = field(default_factory=lambda: int(os.getenv("PREVIEW_MAX_SIDE", "512")))
+    # 預覽格式（WEBP 保留透明；JPEG 會以白底合成）
+    format: str = field(default_factory=lambda: os.getenv("PREVIEW_FORMAT", "WEBP").upper())
+    quality: int = field(default_factory=lambda: int(os.getenv("PREVIEW_QUALITY", "80")))
+    # 預覽 URL 有效秒數
+    ttl_seconds: int = field(default_factory=lambda: int(os.getenv("PREVIEW_TTL_SECONDS", "300")))
+    # 預覽暫存總大小上限
+    max_bytes: int = 32 * 1024 * 1024
+
+
+@dataclass
+class BatchConfig:
+    """批次處理設定（可用環境變量覆寫）"""
+    # 同時處理的圖片數
+    workers: int = field(default_factory=lambda: int(os.getenv("BATCH_WORKERS", "4")))
+    # 每分鐘 Gemini 請求數上限（客戶端 token bucket，依帳號配額設定）
+    requests_per_minute: float = field(default_factory=lambda: float(os.getenv("BATCH_GEMINI_RPM", "10")))
+    # 進度日誌檔名（位於輸出目錄內，用於中斷後續跑）
+    journal_name: str = ".batch_journal.jsonl"
+    # HTTP 批次 API 可存取的根目錄：所有輸入、輸出路徑（含清單項目）都必須位於其下。
+    # 未設定時停用 POST /api/batch（只能從 main.py batch 執行）
+    root: str = field(default_factory=lambda: os.getenv("BATCH_ROOT", ""))
+    # HTTP 批次工作保留數：超過時移除最舊的已結束工作（執行中的工作不移除）
+    max_jobs: int = field(default_factory=lambda: int(os.getenv("BATCH_MAX_JOBS", "50")))
+
+
+@dataclass
+class JobConfig:
+    """背景工作佇列設定（可用環境變量覆寫）"""
+    # 工作狀態資料庫（jobs.db）與產物（上傳圖片、結果）存放目錄
+    root: str = field(default_factory=lambda: os.getenv("JOBS_DIR", ".jobs"))
+    # 同時執行的工作數上限（全域；每風格上限見 AdmissionConfig）
+    workers: int = field(default_factory=lambda: int(os.getenv("JOB_WORKERS", "4")))
+    # 完成的工作保留時數（啟動時清除過期工作）
+    retention_hours: float = field(default_factory=lambda: float(os.getenv("JOB_RETENTION_HOURS", "24")))
+
+
+def _parse_limits(value: str) -> dict:
+    """解析「風格=上限」清單（逗號分隔）"""
+    limits = {}
+    for item in value.split(","):
+        if "=" in item:
+            style, limit = item.split("=", 1)
+            limits[style.strip()] = int(limit)
+    return limits
+
+
+@dataclass
+class AdmissionConfig:
+    """准入控制設定（可用環境變量覆寫；全域並行上限為 JOB_WORKERS）"""
+    # 每個風格同時執行的工作數上限（未列出的風格只受全域上限限制）
+    style_limits: dict = field(default_factory=lambda: _parse_limits(
+        os.getenv("ADMISSION_STYLE_LIMITS", "i4_detailed=2,i4_simplified=2,universal_intelligent=4")
+    ))
+    # 排隊工作數上限，超過時拒絕新工作（0 = 不限）
+    max_queue: int = field(default_factory=lambda: int(os.getenv("ADMISSION_MAX_QUEUE", "20")))
+    # 行程記憶體（RSS，MB）門檻：超過時暫停啟動新工作並拒絕新工作（0 = 停用）
+    max_rss_mb: float = field(default_factory=lambda: float(os.getenv("ADMISSION_MAX_RSS_MB", "0")))
+    # 拒絕時建議的重試秒數
+    retry_after: float = field(default_factory=lambda: float(os.getenv("ADMISSION_RETRY_AFTER", "15")))
+
+
+@dataclass
+class RateLimitConfig:
+    """Gemini 速率限制設定（可用環境變量覆寫，依帳號配額設定）"""
+    # 文字/圖片理解模型（model_text）每分鐘請求數
+    text_rpm: float = field(default_factory=lambda: float(os.getenv("GEMINI_TEXT_RPM", "60")))
+    # 圖片生成模型（model_image）每分鐘請求數
+    image_rpm: float = field(default_factory=lambda: float(os.getenv("GEMINI_IMAGE_RPM", "10")))
+    # 沒有 Retry-After 時的退避秒數（指數成長，上限 backoff_max）
+    backoff_base: float = field(default_factory=lambda: float(os.getenv("GEMINI_BACKOFF_BASE", "2")))
+    backoff_max: float = 60.0
+    # 退避時間的隨機增加比例
+    jitter: float = 0.25
+    # 連續配額錯誤時速率的下限
+    min_rpm: float = 1.0
+
+
+@dataclass
+class DeadlineConfig:
+    """Gemini 呼叫期限與對沖請求設定（可用環境變量覆寫）"""
+    # 單次呼叫期限（秒）：圖片生成 / 文字分析
+    image_timeout: float = field(default_factory=lambda: float(os.getenv("GEMINI_IMAGE_TIMEOUT", "120")))
+    text_timeout: float = field(default_factory=lambda: float(os.getenv("GEMINI_TEXT_TIMEOUT", "30")))
+    # 對沖請求（僅圖片生成）：超過延遲分位數仍未回應時再送一次，取先成功者
+    hedge_enabled: bool = field(default_factory=lambda: os.getenv("GEMINI_HEDGE", "0") == "1")
+    hedge_quantile: float = field(default_factory=lambda: float(os.getenv("GEMINI_HEDGE_QUANTILE", "0.9")))
+    # 對沖請求最多佔呼叫次數的比例（額外配額預算）
+    hedge_budget: float = field(default_factory=lambda: float(os.getenv("GEMINI_HEDGE_BUDGET", "0.1")))
+    # 樣本不足時不對沖
+    hedge_min_samples: int = 20
+    # 延遲統計保留的最近樣本數
+    latency_window: int = 200
+
+
+@dataclass
+class ApiImageConfig:
+    """送往 Gemini 的圖片解析度與編碼（可用環境變量覆寫）"""
+    # 分類呼叫（類型、身體範圍）只需小圖；JPEG/WEBP 有損傳輸
+    analysis_max_side: int = field(default_factory=lambda: int(os.getenv("GEMINI_ANALYSIS_MAX_SIDE", "768")))
+    analysis_format: str = field(default_factory=lambda: os.getenv("GEMINI_ANALYSIS_FORMAT", "JPEG").upper())
+    analysis_quality: int = field(default_factory=lambda: int(os.getenv("GEMINI_ANALYSIS_QUALITY", "90")))
+    # 生成呼叫的輸入（AI 輸出 1K，超過此邊長即縮小）；PNG 保留透明
+    generation_max_side: int = field(default_factory=lambda: int(os.getenv("GEMINI_GENERATION_MAX_SIDE", "2048")))
+    generation_format: str = field(default_factory=lambda: os.getenv("GEMINI_GENERATION_FORMAT", "PNG").upper())
+    generation_quality: int = field(default_factory=lambda: int(os.getenv("GEMINI_GENERATION_QUALITY", "95")))
+
+
+@dataclass
+class TraceConfig:
+    """請求追蹤設定（可用環境變量覆寫；輸出為 OTLP/JSON）"""
+    # 輸出方式：none（預設，停用）/ file（JSON Lines，每行一個 ExportTraceServiceRequest）/ otlp（HTTP POST）
+    exporter: str = field(default_factory=lambda: os.getenv("TRACE_EXPORTER", "none").lower())
+    file: str = field(default_factory=lambda: os.getenv("TRACE_FILE", ".traces/traces.jsonl"))
+    # file 輸出的大小上限：超過時輪替為 traces.jsonl.1、.2……，只保留 file_backups 份
+    file_max_bytes: int = field(default_factory=lambda: int(os.getenv("TRACE_FILE_MAX_MB", "64")) * 1024 * 1024)
+    file_backups: int = field(default_factory=lambda: int(os.getenv("TRACE_FILE_BACKUPS", "3")))
+    otlp_endpoint: str = field(default_factory=lambda: os.getenv("TRACE_OTLP_ENDPOINT", "http://127.0.0.1:4318/v1/traces"))
+    service_name: str = field(default_factory=lambda: os.getenv("TRACE_SERVICE_NAME", "tempo30-img-convert"))
+    # 批次輸出間隔（秒）
+    flush_interval: float = field(default_factory=lambda: float(os.getenv("TRACE_FLUSH_INTERVAL", "2")))
+
+
 # 全域設定實例
 STYLE_CONFIG = StyleConfig()
 API_CONFIG = APIConfig()
+REMBG_CONFIG = RembgConfig()
+CACHE_CONFIG = CacheConfig()
+EXECUTOR_CONFIG = ExecutorConfig()
+UPLOAD_CONFIG = UploadConfig()
+PREVIEW_CONFIG = PreviewConfig()
+BATCH_CONFIG = BatchConfig()
+JOB_CONFIG = JobConfig()
+ADMISSION_CONFIG = AdmissionConfig()
+RATE_LIMIT_CONFIG = RateLimitConfig()
+DEADLINE_CONFIG = DeadlineConfig()
+API_IMAGE_CONFIG = ApiImageConfig()
+TRACE_CONFIG = TraceConfig()
 
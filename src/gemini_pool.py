@@ -0,0 +1,143 @@
+"""Gemini 客戶端池 - 全進程共用 genai.Client，重用 HTTP 連線
+
+每次建立 genai.Client 都會開新的 HTTP 連線池（含 TLS 握手），
+因此所有組件改由這裡取得共用的客戶端：
+- 延遲建立：第一次使用時才建立
+- 執行緒安全：多個 websocket session 同時呼叫也只會建立一個
+- 依 API Key 分開快取（一般只有一把）
+"""
+
+import threading
+from typing import Dict
+
+from google import genai
+
+from .config import API_CONFIG
+from .tracing import KIND_CLIENT, span
+
+
+class GeminiClientPool:
+    """genai.Client 註冊表（每個 API Key 一個客戶端）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[str, genai.Client] = {}
+        self._created = 0
+        self._reused = 0
+
+    def get_client(self, api_key: str = None) -> genai.Client:
+        """
+        取得共用的 genai.Client
+
+        Args:
+            api_key: 指定 API Key，None 則使用 GEMINI_API_KEY
+
+        Returns:
+            genai.Client（同一把 Key 永遠回傳同一個實例）
+        """
+        with self._lock:
+            if api_key is None:
+                api_key = API_CONFIG.api_key
+
+            client = self._clients.get(api_key)
+            if client is None:
+                client = genai.Client(api_key=api_key)
+                self._clients[api_key] = client
+                self._created += 1
+            else:
+                self._reused += 1
+
+            return client
+
+    def stats(self) -> dict:
+        """
+        客戶端重用統計（以 get_client 呼叫次數計：clients_created = 新建的客戶端，
+        client_reuses = 取回既有客戶端的次數）
+
+        注意：這不是 HTTP 連線數。每個客戶端內部的 httpx 連線池不對外公開連線數，
+        一個客戶端仍可能因逾時或伺服器關閉連線而重新建立連線。
+        """
+        with self._lock:
+            total = self._created + self._reused
+            return {
+                "clients": len(self._clients),
+                "clients_created": self._created,
+                "client_reuses": self._reused,
+                "client_reuse_ratio": self._reused / total if total else 0.0,
+            }
+
+    def reset(self) -> None:
+        """清空所有客戶端（測試或切換 API Key 時使用）"""
+        with self._lock:
+            self._clients.clear()
+            self._created = 0
+            self._reused = 0
+
+
+# 全域客戶端池實例
+GEMINI_POOL = GeminiClientPool()
+
+
+def get_genai_client(api_key: str = None) -> genai.Client:
+    """取得全進程共用的 genai.Client"""
+    return GEMINI_POOL.get_client(api_key)
+
+
+def get_client_stats() -> dict:
+    """取得客戶端池統計"""
+    return GEMINI_POOL.stats()
+
+
+def _with_timeout(request: dict, seconds: float) -> dict:
+    """在請求的 config 加上 HTTP 逾時（同步呼叫無法用 asyncio 期限）"""
+    from google.genai import types
+    config = request.get("config") or types.GenerateContentConfig()
+    if config.http_options is not None:
+        return request
+    http_options = types.HttpOptions(timeout=int(seconds * 1000))
+    return {**request, "config": config.model_copy(update={"http_options": http_options})}
+
+
+def generate_content(**request):
+    """以共用客戶端呼叫 generate_content（經過速率限制與呼叫期限，配額錯誤自動重試）"""
+    import time
+    from .hedging import GEMINI_LATENCY, call_timeout
+    from .rate_limiter import RATE_LIMITER
+    client = get_genai_client()
+    model = request["model"]
+    request = _with_timeout(request, call_timeout(model))
+
+    def attempt():
+        started = time.monotonic()
+        with span("gemini.generate_content", KIND_CLIENT, **{"gemini.model": model}):
+            response = client.models.generate_content(**request)
+        GEMINI_LATENCY.get(model).record_attempt(time.monotonic() - started)
+        return response
+
+    started = time.monotonic()
+    response = RATE_LIMITER.call_sync(model, attempt)
+    # 呼叫端實際等待時間（含配額等待與重試），與 async 版本的 hedged_call 相同
+    GEMINI_LATENCY.get(model).record_call(time.monotonic() - started)
+    return response
+
+
+async def generate_content_async(hedge: bool = False, **request):
+    """
+    generate_content 的 async 版本（等待配額時不佔用執行緒）
+
+    Args:
+        hedge: 允許對沖請求（圖片生成使用，需啟用 GEMINI_HEDGE）
+    """
+    from .hedging import call_with_deadline, hedged_call
+    from .rate_limiter import RATE_LIMITER
+    client = get_genai_client()
+    model = request["model"]
+
+    async def send():
+        with span("gemini.generate_content", KIND_CLIENT, **{"gemini.model": model}):
+            return await client.aio.models.generate_content(**request)
+
+    async def attempt():
+        return await RATE_LIMITER.call(model, lambda: call_with_deadline(model, send))
+
+    return await hedged_call(model, attempt, hedge)
@@ -0,0 +1,180 @@
+"""呼叫期限與對沖請求 - 限制 Gemini 單次呼叫的等待時間，並截短延遲長尾
+
+- 期限：每次呼叫以 DEADLINE_CONFIG 的秒數為上限，逾時視為失敗（不再讓 session 無限期掛著）
+- 對沖：圖片生成超過近期延遲的 p90（可設定）仍未回應時再送一次，取先成功者、取消另一個；
+  對沖次數不超過呼叫次數的 hedge_budget 比例，且同樣經過速率限制
+- 統計：單次呼叫延遲（對沖前）與呼叫端實際等待時間（對沖後）的 p50/p90/p99
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .config import API_CONFIG, DEADLINE_CONFIG
+from .metrics import GEMINI_SECONDS
+
+
+class GeminiTimeoutError(TimeoutError):
+    """Gemini 呼叫超過期限"""
+
+
+def call_timeout(model: str) -> float:
+    """模型的單次呼叫期限（秒）"""
+    return DEADLINE_CONFIG.image_timeout if model == API_CONFIG.model_image else DEADLINE_CONFIG.text_timeout
+
+
+def _percentile(sorted_values, q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LatencyStats:
+    """單一模型的延遲統計與對沖預算"""
+
+    def __init__(self, model: str, window: int):
+        self.model = model
+        self._lock = threading.Lock()
+        self._attempts = deque(maxlen=window)   # 單次呼叫延遲
+        self._effective = deque(maxlen=window)  # 呼叫端實際等待時間
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+
+    def record_attempt(self, seconds: float) -> None:
+        with self._lock:
+            self._attempts.append(seconds)
+        GEMINI_SECONDS.observe(seconds, model=self.model)
+
+    def record_call(self, seconds: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self._effective.append(seconds)
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def hedge_delay(self) -> Optional[float]:
+        """觸發對沖的等待秒數；樣本不足時回傳 None"""
+        with self._lock:
+            if len(self._attempts) < DEADLINE_CONFIG.hedge_min_samples:
+                return None
+            return _percentile(sorted(self._attempts), DEADLINE_CONFIG.hedge_quantile)
+
+    def try_spend_hedge(self) -> bool:
+        """在預算內時記錄一次對沖並回傳 True"""
+        with self._lock:
+            if self.hedges + 1 > DEADLINE_CONFIG.hedge_budget * max(1, self.calls + 1):
+                return False
+            self.hedges += 1
+            return True
+
+    def record_hedge_win(self) -> None:
+        with self._lock:
+            self.hedge_wins += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            attempts = sorted(self._attempts)
+            effective = sorted(self._effective)
+            calls, hedges, wins, timeouts = self.calls, self.hedges, self.hedge_wins, self.timeouts
+
+        def summary(values):
+            return {f"p{int(q * 100)}": _percentile(values, q) for q in (0.5, 0.9, 0.99)}
+
+        return {
+            "calls": calls,
+            "timeouts": timeouts,
+            "hedges": hedges,
+            "hedge_wins": wins,
+            "hedge_ratio": round(hedges / calls, 3) if calls else 0.0,
+            "attempt_latency": summary(attempts),
+            "effective_latency": summary(effective),
+        }
+
+
+class LatencyRegistry:
+    """各模型的延遲統計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models: Dict[str, LatencyStats] = {}
+
+    def get(self, model: str) -> LatencyStats:
+        with self._lock:
+            stats = self._models.get(model)
+            if stats is None:
+                stats = self._models[model] = LatencyStats(model, DEADLINE_CONFIG.latency_window)
+            return stats
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = list(self._models.values())
+        return {stats.model: stats.stats() for stats in models}
+
+
+GEMINI_LATENCY = LatencyRegistry()
+
+
+async def call_with_deadline(model: str, func: Callable[[], Awaitable[Any]]) -> Any:
+    """執行一次呼叫（含期限），記錄單次延遲"""
+    stats = GEMINI_LATENCY.get(model)
+    timeout = call_timeout(model)
+    started = time.monotonic()
+    try:
+        result = await asyncio.wait_for(func(), timeout)
+    except asyncio.TimeoutError:
+        stats.record_timeout()
+        raise GeminiTimeoutError(f"{model} 呼叫逾時（{timeout:.0f} 秒）")
+    stats.record_attempt(time.monotonic() - started)
+    return result
+
+
+async def hedged_call(model: str, func: Callable[[], Awaitable[Any]], hedge: bool = False) -> Any:
+    """
+    執行呼叫；hedge=True 且已啟用時，超過延遲分位數仍未完成就再送一次
+
+    Args:
+        model: 模型名稱
+        func: 無參數函數，每次呼叫回傳新的 awaitable（一次完整的呼叫，含期限）
+        hedge: 是否允許對沖
+    """
+    stats = GEMINI_LATENCY.get(model)
+    started = time.monotonic()
+    delay = stats.hedge_delay() if hedge and DEADLINE_CONFIG.hedge_enabled else None
+
+    if delay is None:
+        result = await func()
+        stats.record_call(time.monotonic() - started)
+        return result
+
+    primary = asyncio.ensure_future(func())
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done and stats.try_spend_hedge():
+            tasks.add(asyncio.ensure_future(func()))
+
+        first_error = None
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.cancelled():
+                    continue
+                if task.exception() is None:
+                    if task is not primary:
+                        stats.record_hedge_win()
+                    stats.record_call(time.monotonic() - started)
+                    return task.result()
+                first_error = first_error or task.exception()
+        raise first_error or asyncio.CancelledError()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,178 @@
+"""共用的 numpy 影像運算 - StyleConverter 與 Pipeline 組件共用的底層實作"""
+
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy import ndimage
+
+
+# 邊界框：(min_row, max_row, min_col, max_col)，皆為包含端點
+BBox = Tuple[int, int, int, int]
+
+
+def box_dilation(mask: np.ndarray, size: int) -> np.ndarray:
+    """
+    以 size×size 方形結構元素膨脹（結果與 binary_dilation(structure=np.ones((size, size))) 逐像素相同）
+
+    方形可拆成水平、垂直兩次一維最大值濾波，成本與 size 幾乎無關。
+    偶數 size 時 binary_dilation 的中心偏右下一格，對應 maximum_filter1d 的 origin=-1。
+    """
+    origin = -1 if size % 2 == 0 else 0
+    data = mask.astype(np.uint8, copy=False)
+    data = ndimage.maximum_filter1d(data, size, axis=0, mode="constant", cval=0, origin=origin)
+    data = ndimage.maximum_filter1d(data, size, axis=1, mode="constant", cval=0, origin=origin)
+    return data.astype(bool)
+
+
+def outline_mask(mask: np.ndarray, width: int, rounded: bool = False) -> np.ndarray:
+    """
+    計算遮罩外側寬度為 width 的描邊區域
+
+    以單次距離轉換取代重複 width 次的 3×3 膨脹：
+    - rounded=False（預設）：棋盤距離（方角，與舊版迭代膨脹逐像素相同）
+    - rounded=True：歐氏距離（圓角描邊，轉角處與舊版不同，需呼叫端明確指定）
+
+    Args:
+        mask: 前景遮罩（非零為前景）
+        width: 描邊寬度（像素）
+        rounded: 是否使用圓角描邊
+
+    Returns:
+        描邊遮罩 (H, W) bool（不含原前景）
+    """
+    foreground = mask.astype(bool)
+    if width <= 0 or not np.any(foreground):
+        return np.zeros_like(foreground)
+    if rounded:
+        distance = ndimage.distance_transform_edt(~foreground)
+    else:
+        distance = ndimage.distance_transform_cdt(~foreground, metric="chessboard")
+    return (distance <= width) & ~foreground
+
+
+def edge_background_mask(data: np.ndarray, threshold: int = 240) -> np.ndarray:
+    """
+    找出要轉為透明的白色背景（與邊緣相連的白色區域，並保護人物內部）
+
+    以單次計算取代逐一標籤的迴圈：
+    - np.bincount 一次算出每個標籤的像素數，以及落在人物保護區內的像素數
+    - 以查表（標籤 → 是否為背景）一次得到整張遮罩
+
+    Args:
+        data: RGBA 或 RGB 的 uint8 陣列 (H, W, C)
+        threshold: 白色閾值
+
+    Returns:
+        背景遮罩 (H, W) bool
+    """
+    rgb = data[:, :, :3]
+    white_mask = (rgb[:, :, 0] > threshold) & (rgb[:, :, 1] > threshold) & (rgb[:, :, 2] > threshold)
+    labeled, num_labels = ndimage.label(white_mask)
+
+    # 與邊緣接觸的標籤
+    edge_labels = np.unique(np.concatenate((labeled[0, :], labeled[-1, :], labeled[:, 0], labeled[:, -1])))
+    is_edge = np.zeros(num_labels + 1, dtype=bool)
+    is_edge[edge_labels] = True
+    is_edge[0] = False
+
+    # 非白色區域（人物），提高閾值保護亮部衣物，膨脹成保護區
+    person_mask = (rgb[:, :, 0] < 245) | (rgb[:, :, 1] < 245) | (rgb[:, :, 2] < 245)
+    if np.any(person_mask):
+        person_mask_expanded = box_dilation(person_mask, 20)
+    else:
+        person_mask_expanded = np.zeros_like(person_mask)
+
+    # 每個標籤的總像素數與保護區重疊像素數
+    total = np.bincount(labeled.ravel(), minlength=num_labels + 1)
+    overlap = np.bincount(labeled[person_mask_expanded], minlength=num_labels + 1)
+
+    # 重疊小於 30% 視為背景
+    with np.errstate(divide="ignore", invalid="ignore"):
+        is_background = is_edge & (total > 0) & (overlap / total < 0.3)
+
+    return is_background[labeled]
+
+
+def alpha_bbox(alpha: np.ndarray) -> Optional[BBox]:
+    """
+    非透明區域（alpha > 0）的邊界框
+
+    以列、欄各一次 np.any 取代 np.where（不配置整張圖的索引陣列）。
+
+    Returns:
+        (min_row, max_row, min_col, max_col)；完全透明時回傳 None
+    """
+    mask = alpha > 0
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return int(rows[0]), int(rows[-1]), int(cols[0]), int(cols[-1])
+
+
+def _first_in_band(profile_fn, lo: int, hi: int, last: bool) -> Optional[int]:
+    """在 [lo, hi] 範圍內找第一個（或最後一個）有內容的位置"""
+    if lo > hi:
+        return None
+    hits = np.flatnonzero(profile_fn(lo, hi))
+    if hits.size == 0:
+        return None
+    return lo + int(hits[-1] if last else hits[0])
+
+
+def scaled_alpha_bbox(scaled_alpha: np.ndarray, bbox: BBox, scale_y: float, scale_x: float) -> Optional[BBox]:
+    """
+    由縮放前的邊界框推算縮放後的邊界框（不重新掃描整張圖）
+
+    依縮放比例預測四個邊，再只在預測位置附近的窄帶內確認；
+    窄帶寬度涵蓋 LANCZOS 濾波的支撐範圍（3 個像素，放大時乘上比例），
+    因此結果與完整掃描相同。窄帶內找不到時退回完整掃描。
+
+    Args:
+        scaled_alpha: 縮放後的 alpha 通道
+        bbox: 縮放前的邊界框
+        scale_y, scale_x: 實際的縱向、橫向縮放比例（新尺寸 / 原尺寸）
+    """
+    height, width = scaled_alpha.shape
+    min_row, max_row, min_col, max_col = bbox
+    margin_y = int(math.ceil(3 * max(1.0, scale_y))) + 2
+    margin_x = int(math.ceil(3 * max(1.0, scale_x))) + 2
+
+    def row_profile(lo, hi):
+        return (scaled_alpha[lo:hi + 1] > 0).any(axis=1)
+
+    def col_profile(lo, hi):
+        return (scaled_alpha[:, lo:hi + 1] > 0).any(axis=0)
+
+    pred_top = int(min_row * scale_y)
+    pred_bottom = int((max_row + 1) * scale_y)
+    pred_left = int(min_col * scale_x)
+    pred_right = int((max_col + 1) * scale_x)
+
+    top = _first_in_band(row_profile, max(0, pred_top - margin_y), min(height - 1, pred_top + margin_y), last=False)
+    bottom = _first_in_band(row_profile, max(0, pred_bottom - margin_y), min(height - 1, pred_bottom + margin_y), last=True)
+    left = _first_in_band(col_profile, max(0, pred_left - margin_x), min(width - 1, pred_left + margin_x), last=False)
+    right = _first_in_band(col_profile, max(0, pred_right - margin_x), min(width - 1, pred_right + margin_x), last=True)
+
+    # 窄帶外側不可能有內容；但若窄帶內也沒有（極淡的邊緣被量化為 0），真正的邊界在窄帶內側，改為完整掃描
+    if None in (top, bottom, left, right):
+        return alpha_bbox(scaled_alpha)
+    return top, bottom, left, right
+
+
+def center_body_bottom(alpha: np.ndarray, bbox: BBox) -> Optional[int]:
+    """
+    人物中心 1/3 寬度內的最低列（身體底部，不含側邊的手部）
+
+    只掃描中心欄位範圍，不對整張圖做 np.where。
+    """
+    _, _, min_col, max_col = bbox
+    center_col = (min_col + max_col) // 2
+    center_width = (max_col - min_col) // 3
+    lo = max(0, center_col - center_width)
+    hi = center_col + center_width
+    rows = np.flatnonzero((alpha[:, lo:hi + 1] > 0).any(axis=1))
+    if rows.size == 0:
+        return None
+    return int(rows[-1])
@@ -2,9 +2,9 @@
 
 from PIL import Image
 import numpy as np
-from rembg import remove
 
 from .gemini_client import ImageType
+from .rembg_session import rembg_remove
 
 
 class ImageProcessor:
@@ -25,8 +25,8 @@ class ImageProcessor:
         if image.mode != "RGBA":
             image = image.convert("RGBA")
         
-        # 使用 rembg 去背
-        result = remove(image)
+        # 使用 rembg 去背（共用 session，模型只載入一次）
+        result = rembg_remove(image)
         return result
     
     @staticmethod
@@ -0,0 +1,788 @@
+"""工作佇列 - 處理流程與 websocket 連線解耦，狀態與產物持久化
+
+- 送出：上傳圖片寫入工作目錄，SQLite 記錄工作（風格、狀態、錯誤、最終 context）；
+  多風格扇出工作的風格欄位為以逗號連接的風格 ID，每個風格的結果各存一個檔案
+- 排程：依准入控制（全域與每風格並行上限、記憶體門檻）依序啟動排隊中的工作，
+  以 StepScheduler 執行 FINE_GRAINED_STYLES 的步驟；排隊中的工作收到 queue 事件（目前位置）
+- 事件：step_start / step_complete / complete… 依序編號（seq）寫入 SQLite 並推送給訂閱者；
+  step_update 只即時推送不保存。連線中斷後以 job_id + 最後收到的 seq 重新訂閱，補送遺漏的事件
+- 重啟：未完成的工作重新排入佇列（步驟快取使用 disk / sqlite 後端時，已完成的步驟直接取回）；
+  完成的結果保存在工作目錄，直到超過保留時間
+"""
+
+import asyncio
+import json
+import re
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from PIL import Image
+
+from .admission import ADMISSION, AdmissionController
+from .artifact import artifact_for
+from .config import JOB_CONFIG
+from .metrics import style_run
+from .tracing import current_traceparent, span, traced
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+ERROR = "error"
+FINISHED = (DONE, ERROR)
+
+# 工作 ID：uuid4 十六進位的前 16 位
+JOB_ID_LENGTH = 16
+_JOB_ID_PATTERN = re.compile(rf"[0-9a-f]{{{JOB_ID_LENGTH}}}")
+# 多風格工作的風格分隔符；風格 ID 也是結果檔名的一部分
+STYLE_SEPARATOR = ","
+_STYLE_ID_PATTERN = re.compile(r"[A-Za-z0-9_]+")
+
+
+class JobStore:
+    """工作狀態與事件（SQLite，執行緒安全）"""
+
+    def __init__(self, path: str):
+        db_path = Path(path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, style TEXT NOT NULL, status TEXT NOT NULL, options TEXT NOT NULL, "
+            "created REAL NOT NULL, updated REAL NOT NULL, error TEXT, context TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "job_id TEXT NOT NULL, seq INTEGER NOT NULL, data TEXT NOT NULL, PRIMARY KEY (job_id, seq))"
+        )
+        self._conn.commit()
+
+    def create(self, job_id: str, style: str, options: dict) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, style, status, options, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, style, QUEUED, json.dumps(options), now, now)
+            )
+            self._conn.commit()
+
+    def set_status(self, job_id: str, status: str, error: str = None, context: dict = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, context = COALESCE(?, context), updated = ? WHERE id = ?",
+                (status, error, json.dumps(context, ensure_ascii=False) if context is not None else None,
+                 time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, style, status, options, created, updated, error, context FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "style": row[1],
+            "status": row[2],
+            "options": json.loads(row[3]),
+            "created": row[4],
+            "updated": row[5],
+            "error": row[6],
+            "context": json.loads(row[7]) if row[7] else None,
+        }
+
+    def unfinished(self) -> List[str]:
+        """未完成的工作（依建立時間）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status NOT IN (?, ?) ORDER BY created", FINISHED
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def add_event(self, job_id: str, data: dict) -> int:
+        """追加事件，回傳序號（從 1 開始）"""
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(seq) FROM events WHERE job_id = ?", (job_id,)).fetchone()
+            seq = (row[0] or 0) + 1
+            self._conn.execute(
+                "INSERT INTO events (job_id, seq, data) VALUES (?, ?, ?)",
+                (job_id, seq, json.dumps({**data, "seq": seq}, ensure_ascii=False))
+            )
+            self._conn.commit()
+        return seq
+
+    def events(self, job_id: str, after: int = 0) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def purge(self, before: float) -> List[str]:
+        """刪除早於 before 完成的工作，回傳被刪除的 ID"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) AND updated < ?", (*FINISHED, before)
+            ).fetchall()
+            ids = [row[0] for row in rows]
+            for job_id in ids:
+                self._conn.execute("DELETE FROM events WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._conn.commit()
+        return ids
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+
+def is_valid_job_id(job_id: str) -> bool:
+    """工作 ID 是否為 submit 產生的格式（16 位小寫十六進位；用於組成檔案路徑前檢查）"""
+    return isinstance(job_id, str) and _JOB_ID_PATTERN.fullmatch(job_id) is not None
+
+
+def job_styles(style: str) -> List[str]:
+    """工作風格欄位中的風格 ID（多風格扇出工作以逗號連接）"""
+    return style.split(STYLE_SEPARATOR)
+
+
+def result_url(job_id: str, style: str = None) -> str:
+    """工作結果的 URL（多風格工作指定風格）"""
+    url = f"/api/jobs/{job_id}/result"
+    return f"{url}?style={style}" if style else url
+
+
+def serializable_context(context: dict, max_length: int = 256) -> dict:
+    """可存入 JSON 的 context 短值（略過 alpha_geometry 等內部結構與完整 Prompt）"""
+    return {
+        key: value for key, value in context.items()
+        if isinstance(value, (int, float, bool)) or value is None
+        or (isinstance(value, str) and len(value) <= max_length)
+    }
+
+
+def _save_image(image: Image.Image, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(artifact_for(image).png())
+    os.replace(tmp, path)
+
+
+@traced("image.decode", format="PNG")
+def _load_image(path: Path) -> Image.Image:
+    image = Image.open(path)
+    image.load()
+    return image
+
+
+# ============================================================
+# 進度訊息
+# ============================================================
+
+async def simulate_progress(reporter, step_id: int, total_steps: int, step_name: str):
+    """模擬步驟進度（僅在工作選擇 simulated 模式時使用，與實際事件一起經過合併）"""
+    try:
+        if "AI" in step_name or "生成" in step_name:
+            max_progress = 85
+            sleep_time = 0.5
+        elif "檢測" in step_name:
+            max_progress = 80
+            sleep_time = 0.3
+        else:
+            max_progress = 90
+            sleep_time = 0.2
+
+        for pct in range(5, max_progress, 5):
+            reporter.update({
+                'type': 'step_update',
+                'step_id': step_id,
+                'step_progress': pct,
+                'overall_progress': ((step_id - 1) + pct / 100) / total_steps * 100,
+                'message': f'⚙️ {step_name}處理中... {pct}%'
+            })
+            await asyncio.sleep(sleep_time)
+
+    except asyncio.CancelledError:
+        pass
+
+
+def format_result_detail(step: dict, result: any, image: Image.Image, context: dict) -> str:
+    """萬用結果格式化"""
+    step_name = step['name']
+
+    if "檢測圖片類型" in step_name:
+        if isinstance(result, dict) and 'image_type' in result:
+            type_name = "真人照片" if result['image_type'] == "photo" else "插畫作品"
+            return f"→ 類型：{type_name}"
+        return "→ 檢測完成"
+
+    if "檢測身體範圍" in step_name or "身體範圍" in step_name:
+        if isinstance(result, dict) and 'body_extent' in result:
+            body_map = {
+                "head_only": "僅頭部",
+                "head_neck": "頭部+脖子",
+                "head_chest": "頭部到上胸部（理想）",
+                "full_body": "全身照"
+            }
+            body_desc = body_map.get(result['body_extent'], result['body_extent'])
+            return f"→ 身體範圍：{body_desc}"
+        return "→ 檢測完成"
+
+    if "生成處理指令" in step_name or "Body Instruction" in step_name:
+        if isinstance(result, dict) and 'body_instruction' in result:
+            body_extent = context.get('body_extent', 'unknown')
+            instruction_type = {
+                "full_body": "裁切全身到上胸部",
+                "head_only": "生成脖子、肩膀、上胸部",
+                "head_neck": "生成肩膀和上胸部",
+                "head_chest": "保持當前構圖"
+            }.get(body_extent, "預設處理")
+            return f"→ 指令類型：{instruction_type}"
+        return "→ 指令生成完成"
+
+    if "構建" in step_name and "Prompt" in step_name:
+        if isinstance(result, dict) and 'prompt' in result:
+            prompt_len = len(result['prompt'])
+            return f"→ Prompt 長度：{prompt_len}字"
+        return "→ Prompt 構建完成"
+
+    if isinstance(image, Image.Image):
+        prev_size = context.get('prev_size', 'unknown')
+        curr_size = f"{image.width}x{image.height}"
+
+        if prev_size != 'unknown' and prev_size != curr_size:
+            return f"→ {prev_size} 處理為 {curr_size}"
+        else:
+            return f"→ 尺寸：{curr_size}"
+
+    return "→ 處理完成"
+
+
+# ============================================================
+# 工作管理
+# ============================================================
+
+class JobManager:
+    """工作佇列、准入排程與事件訂閱"""
+
+    # 記憶體超過門檻時，重新檢查是否可啟動排隊工作的間隔（秒）
+    RECHECK_INTERVAL = 1.0
+
+    def __init__(self, root: str = None, admission: AdmissionController = None):
+        self.root = Path(root or JOB_CONFIG.root)
+        self.admission = admission or ADMISSION
+        self.store: Optional[JobStore] = None
+        # 排隊中的工作（依送出順序）：job_id -> 風格
+        self._pending: Dict[str, str] = {}
+        self._positions: Dict[str, int] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._start_lock = asyncio.Lock()
+
+    @property
+    def started(self) -> bool:
+        return self._dispatcher is not None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def job_dir(self, job_id: str) -> Path:
+        if not is_valid_job_id(job_id):
+            raise ValueError(f"無效的工作 ID：{job_id!r}")
+        return self.root / job_id
+
+    def result_path(self, job_id: str, style: str = None) -> Path:
+        """結果檔案（多風格工作每個風格一個檔案）"""
+        if style is None:
+            return self.job_dir(job_id) / "result.png"
+        if not _STYLE_ID_PATTERN.fullmatch(style):
+            raise ValueError(f"無效的風格 ID：{style!r}")
+        return self.job_dir(job_id) / f"result_{style}.png"
+
+    async def start(self) -> None:
+        """建立資料庫、清除過期工作、恢復未完成的工作並啟動排程（重複呼叫無效）"""
+        async with self._start_lock:
+            if not self.started:
+                await self._start()
+
+    async def _start(self) -> None:
+        from .pipeline.executor import run_cpu
+        self.store = await run_cpu(JobStore, str(self.root / "jobs.db"))
+        self._wakeup = asyncio.Event()
+
+        expired = await run_cpu(self.store.purge, time.time() - JOB_CONFIG.retention_hours * 3600)
+        for job_id in expired:
+            await run_cpu(shutil.rmtree, self.job_dir(job_id), True)
+
+        # 重新啟動前已接受的工作不受卸載門檻限制
+        for job_id in await run_cpu(self.store.unfinished):
+            job = await run_cpu(self.store.get, job_id)
+            await run_cpu(self.store.set_status, job_id, QUEUED)
+            await self.publish(job_id, {'type': 'info', 'message': '🔄 工作重新排入佇列（伺服器重新啟動）'})
+            self._pending[job_id] = job['style']
+
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        self._wakeup.set()
+
+    async def stop(self) -> None:
+        """停止排程與執行中的工作（保留為未完成，下次啟動時重新執行）"""
+        tasks = list(self._running.values())
+        if self._dispatcher is not None:
+            tasks.append(self._dispatcher)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._dispatcher = None
+        self._running = {}
+        self._pending = {}
+        self._positions = {}
+
+    def check_capacity(self) -> None:
+        """是否可接受新工作（超載時拋出 OverCapacityError，可在接收上傳前先檢查）"""
+        self.admission.check_capacity(self.queue_depth)
+
+    async def submit(self, image: Image.Image, style: str, options: dict = None) -> str:
+        """送出工作，回傳 job_id（超載時拋出 OverCapacityError）"""
+        from .pipeline.executor import run_cpu
+        await self.start()
+        self.check_capacity()
+        job_id = uuid.uuid4().hex[:JOB_ID_LENGTH]
+        options = dict(options or {})
+        # 工作的追蹤 span 接在送出者（websocket session）之下
+        traceparent = current_traceparent()
+        if traceparent is not None:
+            options.setdefault('traceparent', traceparent)
+        await run_cpu(_save_image, image, self.job_dir(job_id) / "input.png")
+        await run_cpu(self.store.create, job_id, style, options)
+        self._pending[job_id] = style
+        self._wakeup.set()
+        return job_id
+
+    async def submit_fanout(self, image: Image.Image, styles: List[str], options: dict = None) -> str:
+        """送出多風格扇出工作（佔一個全域名額與每個風格的名額）"""
+        return await self.submit(image, STYLE_SEPARATOR.join(styles), {**(options or {}), 'fanout': True})
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        """工作狀態（排隊中的工作含目前位置）"""
+        from .pipeline.executor import run_cpu
+        await self.start()
+        job = await run_cpu(self.store.get, job_id)
+        if job is None:
+            return None
+        if job_id in self._pending:
+            job['position'] = list(self._pending).index(job_id) + 1
+        if job['status'] == DONE:
+            if job['options'].get('fanout'):
+                job['results'] = {
+                    style: result_url(job_id, style) for style in job_styles(job['style'])
+                    if await run_cpu(self.result_path(job_id, style).is_file)
+                }
+            else:
+                job['result'] = result_url(job_id)
+        return job
+
+    async def publish(self, job_id: str, data: dict, persist: bool = True) -> None:
+        """發布事件（persist=False 只推送給目前的訂閱者，不保存也不編號）"""
+        from .pipeline.executor import run_cpu
+        data = {**data, 'job_id': job_id}
+        if persist:
+            seq = await run_cpu(self.store.add_event, job_id, data)
+            data['seq'] = seq
+        for queue in self._subscribers.get(job_id, ()):
+            queue.put_nowait(data)
+
+    async def subscribe(self, job_id: str, after: int = 0) -> AsyncIterator[dict]:
+        """
+        訂閱工作事件：先補送 seq > after 的已保存事件，再即時推送，直到工作結束
+
+        Args:
+            job_id: 工作 ID
+            after: 已收到的最後一個 seq（重新連線時使用）
+        """
+        from .pipeline.executor import run_cpu
+        await self.start()
+        queue: asyncio.Queue = asyncio.Queue()
+        # 先登記再讀取已保存的事件，之間發布的事件以 seq 去除重複
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            last = after
+            for event in await run_cpu(self.store.events, job_id, after):
+                last = event['seq']
+                yield event
+                if event.get('final'):
+                    return
+            job = await run_cpu(self.store.get, job_id)
+            if job is None:
+                return
+            if job_id in self._pending:
+                yield self._queue_event(job_id, list(self._pending).index(job_id) + 1)
+            if job['status'] in FINISHED:
+                # 狀態在最後一個事件保存後才更新，再讀一次即可取得全部事件
+                for event in await run_cpu(self.store.events, job_id, last):
+                    yield event
+                return
+            while True:
+                event = await queue.get()
+                if 'seq' in event:
+                    if event['seq'] <= last:
+                        continue
+                    last = event['seq']
+                yield event
+                if event.get('final'):
+                    return
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self._running),
+            "queued": self.queue_depth,
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            "admission": self.admission.stats(),
+            "jobs": self.store.counts() if self.store is not None else {},
+        }
+
+    def _queue_event(self, job_id: str, position: int) -> dict:
+        return {
+            'type': 'queue',
+            'job_id': job_id,
+            'position': position,
+            'queue_length': self.queue_depth,
+            'message': f'⏳ 排隊中：前面還有 {position - 1} 個工作'
+        }
+
+    async def _dispatch(self) -> None:
+        """依送出順序啟動可取得執行名額的工作（某風格已滿時，其他風格的工作可先執行）"""
+        while True:
+            if self._pending:
+                # 記憶體門檻可能在沒有任何事件時回落，定期重新檢查
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.RECHECK_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await self._wakeup.wait()
+            self._wakeup.clear()
+
+            for job_id, style in list(self._pending.items()):
+                if not self.admission.try_acquire(*job_styles(style)):
+                    continue
+                del self._pending[job_id]
+                self._positions.pop(job_id, None)
+                self._running[job_id] = asyncio.create_task(self._run_admitted(job_id, style))
+
+            # 只通知位置有變動的工作
+            for position, job_id in enumerate(self._pending, 1):
+                if self._positions.get(job_id) != position:
+                    self._positions[job_id] = position
+                    event = self._queue_event(job_id, position)
+                    for queue in self._subscribers.get(job_id, ()):
+                        queue.put_nowait(event)
+
+    async def _run_admitted(self, job_id: str, style: str) -> None:
+        try:
+            await self._run(job_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ 工作 {job_id} 執行失敗：{e}")
+        finally:
+            self.admission.release(*job_styles(style))
+            self._running.pop(job_id, None)
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    async def _run(self, job_id: str) -> None:
+        """執行一個工作（事件經過 ProgressReporter 合併後發布）"""
+        from .pipeline.executor import run_cpu
+        from .pipeline.progress import ProgressReporter
+        job = await run_cpu(self.store.get, job_id)
+        if job is None or job['status'] in FINISHED:
+            return
+        await run_cpu(self.store.set_status, job_id, RUNNING)
+
+        async def send(data: dict) -> None:
+            await self.publish(job_id, data, persist=data.get('type') != 'step_update')
+
+        reporter = ProgressReporter(send)
+        with span("job", parent=job['options'].get('traceparent'), job_id=job_id, **{"pipeline.style": job['style']}) as current:
+            try:
+                context = await self._process(job_id, job, reporter)
+            except Exception as e:
+                current.record_error(e)
+                await run_cpu(self.store.set_status, job_id, ERROR, str(e))
+                await reporter.send({'type': 'error', 'final': True, 'message': f'處理失敗：{str(e)}'})
+                import traceback
+                traceback.print_exc()
+            else:
+                await run_cpu(self.store.set_status, job_id, DONE, None, serializable_context(context))
+            finally:
+                reporter.close()
+
+    async def _process(self, job_id: str, job: dict, reporter) -> dict:
+        """FINE_GRAINED_STYLES 的步驟處理，回傳最終 context"""
+        if job['options'].get('fanout'):
+            return await self._process_fanout(job_id, job, reporter)
+        with style_run(job['style']) as outcome:
+            return await self._process_style(job_id, job, reporter, outcome)
+
+    async def _process_style(self, job_id: str, job: dict, reporter, outcome) -> dict:
+        from .pipeline.executor import run_cpu
+        from .pipeline.progress import progress_callback
+        from .pipeline.scheduler import StepScheduler
+        from .pipeline.style_configs_fine_grained import FINE_GRAINED_STYLES
+        from .preview_store import publish_preview
+        from .result_cache import get_result_cache, make_cache_key, hash_image_pixels
+
+        style_config = FINE_GRAINED_STYLES.get(job['style'])
+        if style_config is None:
+            raise ValueError(f"找不到風格：{job['style']}")
+        # 進度模式：events（預設，只送實際事件）/ simulated（舊前端選用，補上模擬刻度）
+        simulate_ticks = job['options'].get('progress', 'events') == 'simulated'
+        final_url = result_url(job_id)
+
+        image = await run_cpu(_load_image, self.job_dir(job_id) / "input.png")
+        await reporter.send({
+            'type': 'image',
+            'image': await run_cpu(publish_preview, image),
+            'message': f'圖片已上傳 | 尺寸: {image.width}x{image.height} | 模式: {image.mode}'
+        })
+
+        # 結果快取：相同圖片 + 風格 + Prompt 直接回傳最終結果
+        result_cache = get_result_cache()
+        image_hash = await run_cpu(hash_image_pixels, image)
+        cache_key = make_cache_key(image_hash, job['style'], style_config.get('prompt_text', ''))
+        cached_png = await run_cpu(result_cache.get, cache_key)
+
+        if cached_png is not None:
+            outcome.label = "cached"
+            cached = await run_cpu(_decode_and_save, cached_png, self.result_path(job_id))
+            await reporter.send({
+                'type': 'complete',
+                'final': True,
+                'image': final_url,
+                'cache': {'hit': True, **result_cache.stats()},
+                'message': f'⚡ 快取命中！{style_config["name"]} | 最終尺寸: {cached.width}x{cached.height}'
+            })
+            return {}
+
+        steps = style_config['steps']
+        total_steps = len(steps)
+
+        await reporter.send({
+            'type': 'info',
+            'message': f'📋 {style_config["name"]} | 共 {total_steps} 個步驟'
+        })
+
+        # 依步驟宣告的 DAG 排程：彼此獨立的步驟同時執行，結果依步驟順序確認後回報
+        cached_steps = []
+        completed = 0
+        progress_tasks = {}
+
+        def stop_simulation(index: int):
+            task = progress_tasks.pop(index, None)
+            if task is not None:
+                task.cancel()
+
+        async def on_step_event(event):
+            nonlocal completed
+            step = event.step
+            step_id = event.index + 1
+            step_name = step['name']
+            icon = step['icon']
+            duration_ms = round(event.duration * 1000, 1)
+
+            if event.kind == 'start':
+                await reporter.send({
+                    'type': 'step_start',
+                    'step_id': step_id,
+                    'step_name': f"{icon} {step_name}",
+                    'step_progress': 0,
+                    'overall_progress': completed / total_steps * 100,
+                    'speculative': event.speculative,
+                    'substeps': []
+                })
+                if simulate_ticks:
+                    progress_tasks[event.index] = asyncio.create_task(
+                        simulate_progress(reporter, step_id, total_steps, step_name)
+                    )
+                return
+
+            stop_simulation(event.index)
+
+            if event.kind == 'cancel':
+                await reporter.send({
+                    'type': 'step_update',
+                    'step_id': step_id,
+                    'step_progress': 0,
+                    'overall_progress': completed / total_steps * 100,
+                    'message': f'↩️ {icon} {step_name} | 預先執行的假設不成立，已取消'
+                })
+                return
+
+            if event.kind == 'error':
+                await reporter.send({
+                    'type': 'error',
+                    'step_id': step_id,
+                    'message': f'❌ {icon} {step_name}失敗：{str(event.error)}'
+                })
+                return
+
+            completed += 1
+            if not event.executed:
+                await reporter.send({
+                    'type': 'step_complete',
+                    'step_id': step_id,
+                    'step_progress': 100,
+                    'overall_progress': completed / total_steps * 100,
+                    'duration_ms': duration_ms,
+                    'message': f'⏭️ {icon} {step_name} | 跳過（不適用）'
+                })
+                return
+
+            if event.from_cache:
+                cached_steps.append(step_name)
+            if step.get('update_image') and isinstance(event.result, Image.Image):
+                result_for_detail = event.image
+            else:
+                result_for_detail = event.result
+            detail = format_result_detail(step, result_for_detail, event.image, event.context)
+
+            cache_note = '（快取）' if event.from_cache else ''
+            progress_data = {
+                'type': 'step_complete',
+                'step_id': step_id,
+                'step_progress': 100,
+                'overall_progress': completed / total_steps * 100,
+                'cached': event.from_cache,
+                'speculative': event.speculative,
+                'duration_ms': duration_ms,
+                'message': f'✅ {icon} {step_name}完成{cache_note}（{duration_ms:.0f} ms）\n   {detail}'
+            }
+
+            if step.get('show_image') and isinstance(event.image, Image.Image):
+                # 中間結果只傳縮圖 URL，完整結果僅在 complete 提供
+                progress_data['image'] = await run_cpu(publish_preview, event.image)
+
+            await reporter.send(progress_data)
+
+        scheduler = StepScheduler(
+            steps,
+            on_event=on_step_event,
+            step_scope=lambda index: progress_callback(
+                reporter.step_callback(index + 1, total_steps, steps[index]['name'])
+            )
+        )
+        started = time.perf_counter()
+        try:
+            state = await scheduler.run(image, {'prev_size': f"{image.width}x{image.height}"}, image_hash)
+        finally:
+            for task in progress_tasks.values():
+                task.cancel()
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        current_image = state.image
+
+        await run_cpu(_save_image, current_image, self.result_path(job_id))
+        await run_cpu(result_cache.put, cache_key, current_image)
+
+        await reporter.send({
+            'type': 'complete',
+            'final': True,
+            'image': final_url,
+            'cache': {'hit': False, **result_cache.stats()},
+            'cached_steps': cached_steps,
+            'timings': scheduler.timings(),
+            'elapsed_ms': elapsed_ms,
+            'message': f'🎉 全部完成！{style_config["name"]} | 共 {total_steps} 個步驟 | 耗時 {elapsed_ms / 1000:.1f} 秒 | 最終尺寸: {current_image.width}x{current_image.height}'
+        })
+        return state.context
+
+    async def _process_fanout(self, job_id: str, job: dict, reporter) -> dict:
+        """多風格扇出（共用前綴步驟只執行一次，分支並行）；每個風格完成即送出 style_complete"""
+        from .pipeline.executor import run_cpu
+        from .pipeline.fanout import build_style_dag, run_fanout
+        from .pipeline.style_configs_fine_grained import FINE_GRAINED_STYLES
+
+        style_ids = job_styles(job['style'])
+        unknown = [style_id for style_id in style_ids if style_id not in FINE_GRAINED_STYLES]
+        if unknown:
+            raise ValueError(f"找不到風格：{', '.join(unknown)}")
+        styles = {style_id: FINE_GRAINED_STYLES[style_id] for style_id in style_ids}
+
+        image = await run_cpu(_load_image, self.job_dir(job_id) / "input.png")
+        root = build_style_dag(styles)
+        total_steps = sum(len(config['steps']) for config in styles.values())
+        await reporter.send({
+            'type': 'info',
+            'message': f'📋 {len(styles)} 個風格 | 共 {total_steps} 個步驟，合併共用前綴後 {root.count()} 個'
+        })
+
+        finished = []
+        failed = []
+
+        async def on_result(style_id, result, error, cached):
+            name = styles[style_id]['name']
+            finished.append(style_id)
+            if error is not None:
+                failed.append(style_id)
+                await reporter.send({
+                    'type': 'style_error',
+                    'style': style_id,
+                    'progress': len(finished) / len(styles) * 100,
+                    'message': f'❌ {name} 失敗：{error}'
+                })
+                return
+            await run_cpu(_save_image, result, self.result_path(job_id, style_id))
+            note = '（快取）' if cached else ''
+            await reporter.send({
+                'type': 'style_complete',
+                'style': style_id,
+                'image': result_url(job_id, style_id),
+                'cached': cached,
+                'progress': len(finished) / len(styles) * 100,
+                'message': f'✅ {name} 完成{note} | 尺寸: {result.width}x{result.height}'
+            })
+
+        summary = await run_fanout(image, styles, on_result)
+        if len(failed) == len(styles):
+            raise RuntimeError("所有風格都失敗")
+        await reporter.send({
+            'type': 'complete',
+            'final': True,
+            'summary': summary,
+            'results': {
+                style_id: result_url(job_id, style_id) for style_id in style_ids if style_id not in failed
+            },
+            'message': f'🎉 全部完成！{len(styles) - len(failed)}/{len(styles)} 個風格'
+        })
+        return {}
+
+
+def _decode_and_save(png: bytes, path: Path) -> Image.Image:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(png)
+    os.replace(tmp, path)
+    return _load_image(path)
+
+
+# 全域工作管理器（第一次使用時啟動）
+JOB_MANAGER = JobManager()
@@ -0,0 +1,384 @@
+"""指標 - Prometheus 文字格式的計數器、量表與直方圖（不依賴 prometheus_client）
+
+量測點集中在幾個共用的執行入口，而不是各處的 print：
+- style_run / step_run：風格與步驟耗時（execute_step、StyleConverter.apply_style 都經過這裡），
+  同時建立追蹤 span（見 tracing.py）
+- run_component：組件耗時；LatencyStats.record_attempt：Gemini 每次請求延遲；
+  RembgSessionManager.remove：rembg 推論時間
+- 重試 / 429 次數、快取命中率、排隊深度等已有統計的數值，在輸出時由回呼讀取
+
+GET /metrics 輸出 render() 的結果。
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from .tracing import span
+
+# 秒數直方圖的預設邊界（涵蓋毫秒級 CPU 步驟到分鐘級圖片生成）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """指標基底：名稱、說明、標籤名稱"""
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        """(名稱後綴, 標籤值, 數值)"""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, label_values, value in self.samples():
+            names = self.labels
+            if suffix == "_bucket":
+                names = self.labels + ("le",)
+            lines.append(f"{self.name}{suffix}{_format_labels(names, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """只增不減的計數器"""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [("", key, value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(Metric):
+    """量表（可直接設定，或由回呼在輸出時讀取）"""
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Iterable[str] = (),
+        callback: Callable[[], Dict[LabelValues, float]] = None
+    ):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self._callback is not None:
+            values = self._callback()
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [("", key, value) for key, value in sorted(values.items())]
+
+
+class CallbackCounter(Gauge):
+    """由既有統計回呼讀取的計數器（例如速率限制器的重試次數）"""
+    kind = "counter"
+
+
+class Histogram(Metric):
+    """累積直方圖"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # 標籤值 -> [各邊界計數..., 總和, 次數]
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        samples = []
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                samples.append(("_bucket", key + (_format_value(bound),), count))
+            samples.append(("_sum", key, series[-2]))
+            samples.append(("_count", key, series[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    """所有指標的登記處"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指標名稱重複：{metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Iterable[str] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, help, labels, callback))
+
+    def callback_counter(self, name: str, help: str, labels: Iterable[str], callback) -> CallbackCounter:
+        return self.register(CallbackCounter(name, help, labels, callback))
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """Prometheus 文字格式（text/plain; version=0.0.4）"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # 回呼失敗不影響其他指標
+                lines.append(f"# {metric.name} 無法取得：{_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+# 全域指標登記處
+REGISTRY = MetricsRegistry()
+
+
+# ============================================================
+# 直接量測的指標
+# ============================================================
+
+STYLE_SECONDS = REGISTRY.histogram(
+    "pipeline_style_seconds", "Time to run a full style", ("style", "outcome")
+)
+STEP_SECONDS = REGISTRY.histogram(
+    "pipeline_step_seconds", "Time per pipeline step (step name from the style config)", ("style", "step", "outcome")
+)
+COMPONENT_SECONDS = REGISTRY.histogram(
+    "pipeline_component_seconds", "Time per pipeline component execution", ("component",)
+)
+GEMINI_SECONDS = REGISTRY.histogram(
+    "gemini_request_seconds", "Latency of each Gemini request attempt", ("model",)
+)
+REMBG_SECONDS = REGISTRY.histogram(
+    "rembg_inference_seconds", "rembg background removal inference time"
+)
+ACTIVE_SESSIONS = REGISTRY.gauge(
+    "websocket_active_sessions", "Open processing websocket sessions", ("endpoint",)
+)
+ACTIVE_STYLES = REGISTRY.gauge(
+    "pipeline_styles_in_progress", "Style runs currently executing", ("style",)
+)
+
+
+# ============================================================
+# 由既有統計讀取的指標
+# ============================================================
+
+def _rate_limit_field(name: str) -> Callable[[], Dict[LabelValues, float]]:
+    def collect():
+        from .rate_limiter import RATE_LIMITER
+        return {(model,): stats[name] for model, stats in RATE_LIMITER.stats().items()}
+    return collect
+
+
+def _timeouts() -> Dict[LabelValues, float]:
+    from .hedging import GEMINI_LATENCY
+    return {(model,): stats.get("timeouts", 0) for model, stats in GEMINI_LATENCY.stats().items()}
+
+
+def _cache_stats() -> Dict[str, dict]:
+    from .pipeline.step_cache import get_step_cache
+    from .result_cache import get_result_cache
+    return {"result": get_result_cache().stats(), "step": get_step_cache().stats()}
+
+
+def _cache_field(name: str) -> Callable[[], Dict[LabelValues, float]]:
+    def collect():
+        return {(cache,): stats.get(name, 0) for cache, stats in _cache_stats().items()}
+    return collect
+
+
+def _cache_hit_ratio() -> Dict[LabelValues, float]:
+    ratios = {}
+    for cache, stats in _cache_stats().items():
+        total = stats.get("hits", 0) + stats.get("misses", 0)
+        ratios[(cache,)] = stats.get("hits", 0) / total if total else 0.0
+    return ratios
+
+
+def _jobs(field: str) -> Callable[[], Dict[LabelValues, float]]:
+    def collect():
+        from .jobs import JOB_MANAGER
+        return {(): JOB_MANAGER.stats()[field]}
+    return collect
+
+
+REGISTRY.callback_counter("gemini_requests_total", "Gemini requests sent", ("model",), _rate_limit_field("requests"))
+REGISTRY.callback_counter("gemini_retries_total", "Gemini requests retried after a quota error", ("model",), _rate_limit_field("retries"))
+REGISTRY.callback_counter("gemini_quota_errors_total", "Gemini 429 / RESOURCE_EXHAUSTED responses", ("model",), _rate_limit_field("quota_errors"))
+REGISTRY.callback_counter("gemini_timeouts_total", "Gemini requests that exceeded the call deadline", ("model",), _timeouts)
+REGISTRY.gauge("gemini_current_rpm", "Current adaptive request rate per model", ("model",), _rate_limit_field("current_rpm"))
+REGISTRY.callback_counter("cache_hits_total", "Cache hits", ("cache",), _cache_field("hits"))
+REGISTRY.callback_counter("cache_misses_total", "Cache misses", ("cache",), _cache_field("misses"))
+REGISTRY.gauge("cache_hit_ratio", "Cache hit ratio since start", ("cache",), _cache_hit_ratio)
+REGISTRY.gauge("jobs_queued", "Jobs waiting for admission", (), _jobs("queued"))
+REGISTRY.gauge("jobs_running", "Jobs currently running", (), _jobs("running"))
+
+
+# ============================================================
+# 量測入口
+# ============================================================
+
+_STYLE: "contextvars.ContextVar[str]" = contextvars.ContextVar("metrics_style", default="")
+
+
+def current_style() -> str:
+    return _STYLE.get()
+
+
+class Outcome:
+    """量測結果標籤（呼叫端可在區塊內改寫，例如 cached / skipped）"""
+
+    def __init__(self, label: str = "ok"):
+        self.label = label
+
+
+@contextmanager
+def style_label(style: str):
+    """只設定區塊內步驟的風格標籤（不量測風格耗時）"""
+    token = _STYLE.set(style)
+    try:
+        yield
+    finally:
+        _STYLE.reset(token)
+
+
+@contextmanager
+def style_run(style: str):
+    """
+    量測一次風格執行（同時是一個追蹤 span）；區塊內的步驟以此風格為標籤
+
+    Yields:
+        Outcome（預設 ok，例外時為 error）
+    """
+    token = _STYLE.set(style)
+    outcome = Outcome()
+    ACTIVE_STYLES.inc(style=style)
+    started = time.perf_counter()
+    try:
+        with span("pipeline.style", **{"pipeline.style": style}) as current:
+            try:
+                yield outcome
+            except BaseException:
+                outcome.label = "error"
+                raise
+            finally:
+                current.set_attribute("pipeline.outcome", outcome.label)
+    finally:
+        STYLE_SECONDS.observe(time.perf_counter() - started, style=style, outcome=outcome.label)
+        ACTIVE_STYLES.dec(style=style)
+        _STYLE.reset(token)
+
+
+@contextmanager
+def step_run(step: str, **attributes: str):
+    """
+    量測一個步驟（同時是一個追蹤 span；風格取自外層 style_run）
+
+    Args:
+        step: 步驟名稱（span 名稱與指標標籤）
+        attributes: 其他 span 屬性
+
+    Yields:
+        Outcome（預設 executed；例外時為 error，取消時為 cancelled）
+    """
+    import asyncio
+    outcome = Outcome("executed")
+    style = current_style()
+    started = time.perf_counter()
+    try:
+        with span(step, **{"pipeline.style": style, **attributes}) as current:
+            try:
+                yield outcome
+            except asyncio.CancelledError:
+                outcome.label = "cancelled"
+                raise
+            except BaseException:
+                outcome.label = "error"
+                raise
+            finally:
+                current.set_attribute("pipeline.outcome", outcome.label)
+    finally:
+        STEP_SECONDS.observe(time.perf_counter() - started, style=style, step=step, outcome=outcome.label)
+
+
+def render() -> str:
+    return REGISTRY.render()
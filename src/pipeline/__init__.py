@@ -14,11 +14,12 @@ Pipeline 架構 - 函數式組件系統
 5. 後處理組件（Postprocess）- 統一尺寸、描邊等
 """
 
-from .engine import run_pipeline, build_pipeline_from_names
+from .engine import run_pipeline, run_pipeline_async, build_pipeline_from_names
 from .style_configs import PRESET_STYLES, STYLE_OPTIONS
 
 __all__ = [
     'run_pipeline',
+    'run_pipeline_async',
     'build_pipeline_from_names',
     'PRESET_STYLES',
     'STYLE_OPTIONS'
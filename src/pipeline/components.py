@@ -8,15 +8,15 @@
 
 from PIL import Image
 import io
-from google import genai
 from google.genai import types
 import numpy as np
-from scipy import ndimage
-from rembg import remove as rembg_remove
 
 from ..config import API_CONFIG
 from ..prompts import get_style_prompt, IMAGE_TYPE_PROMPT, BODY_EXTENT_PROMPT, UNIVERSAL_INTELLIGENT_PROMPT
-from ..utils import prepare_image_for_api
+from ..utils import encode_image_for_api
+from ..gemini_pool import generate_content
+from ..rembg_session import rembg_remove
+from ..image_ops import edge_background_mask
 
 
 # ============================================================
@@ -31,21 +31,13 @@ def gemini_25_analysis_photos_only(image: Image.Image) -> dict:
     - 如果是照片，再檢測身體範圍
     - 如果是插畫，body_extent 固定為 "head_chest"
     """
-    import os
-    from dotenv import load_dotenv
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("請在 .env 檔案中設定 GEMINI_API_KEY")
-    
-    client = genai.Client(api_key=api_key)
-    _, img_bytes = prepare_image_for_api(image)
+    img_bytes, mime_type = encode_image_for_api(image, "analysis")
     
     # 步驟1：只檢測圖片類型（對所有圖片）
-    response = client.models.generate_content(
+    response = generate_content(
         model=API_CONFIG.model_text,
         contents=[
-            types.Part.from_bytes(data=img_bytes, mime_type="image/png"),
+            types.Part.from_bytes(data=img_bytes, mime_type=mime_type),
             IMAGE_TYPE_PROMPT  # 只問類型，不問身體
         ],
         config=types.GenerateContentConfig(response_modalities=['TEXT'])
@@ -59,10 +51,10 @@ def gemini_25_analysis_photos_only(image: Image.Image) -> dict:
         return {"image_type": image_type, "body_extent": "head_chest"}
     
     # 照片：執行步驟2，檢測身體範圍
-    response_body = client.models.generate_content(
+    response_body = generate_content(
         model=API_CONFIG.model_text,
         contents=[
-            types.Part.from_bytes(data=img_bytes, mime_type="image/png"),
+            types.Part.from_bytes(data=img_bytes, mime_type=mime_type),
             BODY_EXTENT_PROMPT  # 檢測身體
         ],
         config=types.GenerateContentConfig(response_modalities=['TEXT'])
@@ -128,14 +120,6 @@ def no_preprocess(image: Image.Image, context: dict) -> Image.Image:
 
 def detailed_style_generate(image: Image.Image, context: dict) -> Image.Image:
     """詳細Prompt風格生成（原版2000字）"""
-    import os
-    from dotenv import load_dotenv
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("請在 .env 檔案中設定 GEMINI_API_KEY")
-    
-    client = genai.Client(api_key=api_key)
     
     # 準備圖片（轉 RGB，白底）
     if image.mode == "RGBA":
@@ -154,7 +138,7 @@ def detailed_style_generate(image: Image.Image, context: dict) -> Image.Image:
     prompt = get_style_prompt(body_extent)
     
     # AI生成（使用原版順序：Prompt 在前）
-    response = client.models.generate_content(
+    response = generate_content(
         model=API_CONFIG.model_image,
         contents=[
             prompt,  # Prompt 在前（原版順序）
@@ -179,14 +163,6 @@ def universal_intelligent_generate(image: Image.Image, context: dict) -> Image.I
     - 讓 AI 完全智能判斷：自動處理照片/插畫，自動裁切/生成
     - 一次 API 調用搞定一切
     """
-    import os
-    from dotenv import load_dotenv
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("請在 .env 檔案中設定 GEMINI_API_KEY")
-    
-    client = genai.Client(api_key=api_key)
     
     # 準備圖片（轉 RGB，白底）
     if image.mode == "RGBA":
@@ -201,7 +177,7 @@ def universal_intelligent_generate(image: Image.Image, context: dict) -> Image.I
     img_bytes = img_byte_arr.getvalue()
     
     # AI生成（使用萬能智能 Prompt）
-    response = client.models.generate_content(
+    response = generate_content(
         model=API_CONFIG.model_image,
         contents=[
             UNIVERSAL_INTELLIGENT_PROMPT,  # 萬能智能 Prompt（超詳細）
@@ -227,33 +203,7 @@ def transparent_background(image: Image.Image, context: dict) -> Image.Image:
         image = image.convert("RGBA")
     
     data = np.array(image)
-    threshold = 240
-    
-    white_mask = (data[:, :, 0] > threshold) & (data[:, :, 1] > threshold) & (data[:, :, 2] > threshold)
-    labeled, _ = ndimage.label(white_mask)
-    
-    edge_labels = set()
-    edge_labels.update(labeled[0, :])
-    edge_labels.update(labeled[-1, :])
-    edge_labels.update(labeled[:, 0])
-    edge_labels.update(labeled[:, -1])
-    edge_labels.discard(0)
-    
-    person_mask = (data[:, :, 0] < 245) | (data[:, :, 1] < 245) | (data[:, :, 2] < 245)
-    
-    if np.any(person_mask):
-        person_mask_expanded = ndimage.binary_dilation(person_mask, structure=np.ones((20, 20)))
-    else:
-        person_mask_expanded = np.zeros_like(person_mask)
-    
-    bg_mask = np.zeros_like(white_mask)
-    for label in edge_labels:
-        region_mask = (labeled == label)
-        overlap = np.sum(region_mask & person_mask_expanded)
-        total = np.sum(region_mask)
-        
-        if total > 0 and overlap / total < 0.3:
-            bg_mask = bg_mask | region_mask
+    bg_mask = edge_background_mask(data, threshold=240)
     
     data[bg_mask, 3] = 0
     return Image.fromarray(data, "RGBA")
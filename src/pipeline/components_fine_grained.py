@@ -6,77 +6,84 @@
 - 更容易追蹤進度
 """
 
+from typing import Optional
+
 from PIL import Image
 import io
-from google import genai
+import json
 from google.genai import types
 import numpy as np
 from scipy import ndimage
-from rembg import remove as rembg_remove
 
 from ..config import API_CONFIG
-from ..prompts import get_style_prompt, IMAGE_TYPE_PROMPT, BODY_EXTENT_PROMPT, UNIVERSAL_INTELLIGENT_PROMPT
-from ..utils import prepare_image_for_api
+from ..prompts import (
+    get_style_prompt, IMAGE_TYPE_PROMPT, BODY_EXTENT_PROMPT, ANALYZE_JSON_PROMPT, UNIVERSAL_INTELLIGENT_PROMPT,
+)
+from ..utils import encode_image_for_api, flatten_to_rgb
+from ..gemini_pool import generate_content, generate_content_async
+from ..rembg_session import REMBG_SESSIONS, rembg_remove
+from ..image_ops import BBox, alpha_bbox, center_body_bottom, edge_background_mask, scaled_alpha_bbox
+from ..tracing import traced
+from .executor import run_cpu
+from .progress import report_progress
 
 
 # ============================================================
 # 分析組件（拆分為2個）
 # ============================================================
 
-def detect_image_type(image: Image.Image, context: dict) -> dict:
-    """步驟1：檢測圖片類型（照片/插畫）"""
-    import os
-    from dotenv import load_dotenv
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("請在 .env 檔案中設定 GEMINI_API_KEY")
-    
-    client = genai.Client(api_key=api_key)
-    _, img_bytes = prepare_image_for_api(image)
-    
-    response = client.models.generate_content(
+@traced("gemini.build_request")
+def _image_type_request(image: Image.Image, context: dict) -> dict:
+    img_bytes, mime_type = encode_image_for_api(image, "analysis")
+    return dict(
         model=API_CONFIG.model_text,
         contents=[
-            types.Part.from_bytes(data=img_bytes, mime_type="image/png"),
+            types.Part.from_bytes(data=img_bytes, mime_type=mime_type),
             IMAGE_TYPE_PROMPT
         ],
         config=types.GenerateContentConfig(response_modalities=['TEXT'])
     )
-    
+
+
+def _parse_image_type_text(result: str) -> str:
+    return "illustration" if "ILLUSTRATION" in result else "photo"
+
+
+@traced("gemini.parse_response")
+def _parse_image_type(response) -> dict:
     result = response.candidates[0].content.parts[0].text.strip().upper()
-    image_type = "illustration" if "ILLUSTRATION" in result else "photo"
-    
-    return {"image_type": image_type}
+    return {"image_type": _parse_image_type_text(result)}
 
 
-def detect_body_extent(image: Image.Image, context: dict) -> dict:
-    """步驟2：檢測身體範圍（僅照片）"""
-    # 如果是插畫，跳過此步驟
-    if context.get("image_type") == "illustration":
-        return {"body_extent": "head_chest"}
-    
-    import os
-    from dotenv import load_dotenv
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("請在 .env 檔案中設定 GEMINI_API_KEY")
-    
-    client = genai.Client(api_key=api_key)
-    _, img_bytes = prepare_image_for_api(image)
-    
-    response = client.models.generate_content(
+def detect_image_type(image: Image.Image, context: dict) -> dict:
+    """步驟1：檢測圖片類型（照片/插畫）"""
+    response = generate_content(**_image_type_request(image, context))
+    return _parse_image_type(response)
+
+
+async def detect_image_type_async(image: Image.Image, context: dict) -> dict:
+    """步驟1（async）：檢測圖片類型，網路呼叫直接在 event loop 上進行"""
+    request = await run_cpu(_image_type_request, image, context)
+    report_progress(0.1, "等待 Gemini 回應...")
+    response = await generate_content_async(**request)
+    report_progress(0.9, "已收到 Gemini 回應")
+    return _parse_image_type(response)
+
+
+@traced("gemini.build_request")
+def _body_extent_request(image: Image.Image, context: dict) -> dict:
+    img_bytes, mime_type = encode_image_for_api(image, "analysis")
+    return dict(
         model=API_CONFIG.model_text,
         contents=[
-            types.Part.from_bytes(data=img_bytes, mime_type="image/png"),
+            types.Part.from_bytes(data=img_bytes, mime_type=mime_type),
             BODY_EXTENT_PROMPT
         ],
         config=types.GenerateContentConfig(response_modalities=['TEXT'])
     )
-    
-    result_body = response.candidates[0].content.parts[0].text.strip().upper()
-    
+
+
+def _parse_body_extent_text(result_body: str) -> str:
     body_extent = "full_body"
     if "HEAD_ONLY" in result_body:
         body_extent = "head_only"
@@ -84,8 +91,134 @@ def detect_body_extent(image: Image.Image, context: dict) -> dict:
         body_extent = "head_neck"
     elif "HEAD_CHEST" in result_body:
         body_extent = "head_chest"
+    return body_extent
+
+
+@traced("gemini.parse_response")
+def _parse_body_extent(response) -> dict:
+    result_body = response.candidates[0].content.parts[0].text.strip().upper()
+    return {"body_extent": _parse_body_extent_text(result_body)}
+
+
+def detect_body_extent(image: Image.Image, context: dict) -> dict:
+    """步驟2：檢測身體範圍（僅照片）"""
+    # 如果是插畫，跳過此步驟
+    if context.get("image_type") == "illustration":
+        return {"body_extent": "head_chest"}
     
-    return {"body_extent": body_extent}
+    response = generate_content(**_body_extent_request(image, context))
+    return _parse_body_extent(response)
+
+
+async def detect_body_extent_async(image: Image.Image, context: dict) -> dict:
+    """步驟2（async）：檢測身體範圍（僅照片）"""
+    if context.get("image_type") == "illustration":
+        return {"body_extent": "head_chest"}
+    
+    request = await run_cpu(_body_extent_request, image, context)
+    report_progress(0.1, "等待 Gemini 回應...")
+    response = await generate_content_async(**request)
+    report_progress(0.9, "已收到 Gemini 回應")
+    return _parse_body_extent(response)
+
+
+# ============================================================
+# 合併檢測（類型 + 身體範圍，一次呼叫）
+# ============================================================
+
+_ANALYZE_SCHEMA = types.Schema(
+    type=types.Type.OBJECT,
+    properties={
+        "image_type": types.Schema(type=types.Type.STRING, enum=["PHOTO", "ILLUSTRATION"]),
+        "body_extent": types.Schema(
+            type=types.Type.STRING, enum=["HEAD_ONLY", "HEAD_NECK", "HEAD_CHEST", "FULL_BODY"]
+        ),
+    },
+    required=["image_type", "body_extent"],
+)
+
+
+@traced("gemini.build_request")
+def _analyze_request(image: Image.Image, context: dict) -> dict:
+    img_bytes, mime_type = encode_image_for_api(image, "analysis")
+    return dict(
+        model=API_CONFIG.model_text,
+        contents=[
+            types.Part.from_bytes(data=img_bytes, mime_type=mime_type),
+            ANALYZE_JSON_PROMPT
+        ],
+        config=types.GenerateContentConfig(
+            response_modalities=['TEXT'],
+            response_mime_type="application/json",
+            response_schema=_ANALYZE_SCHEMA
+        )
+    )
+
+
+@traced("gemini.parse_response")
+def _parse_analysis(response) -> dict:
+    text = response.candidates[0].content.parts[0].text
+    try:
+        data = json.loads(text)
+        type_text = str(data.get("image_type", "")).upper()
+        body_text = str(data.get("body_extent", "")).upper()
+    except (json.JSONDecodeError, AttributeError):
+        # 結構化輸出失敗時退回關鍵字比對
+        type_text = body_text = text.upper()
+    
+    image_type = _parse_image_type_text(type_text)
+    if image_type == "illustration":
+        # 與 detect_body_extent 相同：插畫不判斷身體範圍
+        body_extent = "head_chest"
+    else:
+        body_extent = _parse_body_extent_text(body_text)
+    return {"image_type": image_type, "body_extent": body_extent}
+
+
+def analyze_image(image: Image.Image, context: dict) -> dict:
+    """步驟1（合併）：一次呼叫同時檢測圖片類型與身體範圍（JSON 結構化輸出）"""
+    response = generate_content(**_analyze_request(image, context))
+    return _parse_analysis(response)
+
+
+async def analyze_image_async(image: Image.Image, context: dict) -> dict:
+    """步驟1（合併，async）"""
+    request = await run_cpu(_analyze_request, image, context)
+    report_progress(0.1, "等待 Gemini 回應...")
+    response = await generate_content_async(**request)
+    report_progress(0.9, "已收到 Gemini 回應")
+    return _parse_analysis(response)
+
+
+def use_detected_body_extent(image: Image.Image, context: dict) -> dict:
+    """步驟2（合併）：沿用 analyze_image 的身體範圍結果（不呼叫 API；未檢測時與其他組件相同預設 head_chest）"""
+    return {"body_extent": context.get("body_extent", "head_chest")}
+
+
+# ============================================================
+# 圖片幾何共享（同一張圖只掃描一次）
+# ============================================================
+
+# context 鍵：目前圖片的 alpha 幾何 {"size": (寬, 高), "bbox": 邊界框或 None}
+# 只含 tuple / int，可序列化。update_image 步驟執行前由 runner 清除，
+# 產生新圖片的組件若能由輸入推算輸出的幾何（裁切、縮放定位），就直接記錄，不必重新掃描。
+ALPHA_GEOMETRY = "alpha_geometry"
+
+
+def _remember_alpha_bbox(image: Image.Image, context: dict, bbox: Optional[BBox]) -> None:
+    """記錄圖片的 alpha 邊界框（None 表示完全透明）"""
+    context[ALPHA_GEOMETRY] = {"size": tuple(image.size), "bbox": bbox}
+
+
+def _get_alpha_bbox(image: Image.Image, context: dict) -> Optional[BBox]:
+    """取得 RGBA 圖片的 alpha 邊界框（context 有目前圖片的幾何就直接使用）"""
+    geometry = context.get(ALPHA_GEOMETRY)
+    if isinstance(geometry, dict) and tuple(geometry.get("size", ())) == tuple(image.size):
+        bbox = geometry.get("bbox")
+        return tuple(bbox) if bbox is not None else None
+    bbox = alpha_bbox(np.asarray(image)[:, :, 3])
+    _remember_alpha_bbox(image, context, bbox)
+    return bbox
 
 
 # ============================================================
@@ -97,6 +230,9 @@ def rembg_remove_background(image: Image.Image, context: dict) -> Image.Image:
     if context.get("image_type") == "photo":
         if image.mode != "RGBA":
             image = image.convert("RGBA")
+        # 首次使用時載入模型可能需數秒，就緒後回報
+        REMBG_SESSIONS.get_session()
+        report_progress(0.3, "模型已就緒，去背中...")
         return rembg_remove(image)
     else:
         return image.convert("RGBA") if image.mode != "RGBA" else image
@@ -107,18 +243,15 @@ def crop_to_content(image: Image.Image, context: dict) -> Image.Image:
     if image.mode != "RGBA":
         return image
     
-    alpha = np.array(image.split()[-1])
-    rows = np.any(alpha > 0, axis=1)
-    cols = np.any(alpha > 0, axis=0)
-    
-    if np.any(rows) and np.any(cols):
-        top = np.argmax(rows)
-        bottom = len(rows) - np.argmax(rows[::-1])
-        left = np.argmax(cols)
-        right = len(cols) - np.argmax(cols[::-1])
-        return image.crop((left, top, right, bottom))
+    bbox = _get_alpha_bbox(image, context)
+    if bbox is None:
+        return image
     
-    return image
+    top, bottom, left, right = bbox
+    cropped = image.crop((left, top, right + 1, bottom + 1))
+    # 裁切後內容剛好填滿畫面
+    _remember_alpha_bbox(cropped, context, (0, cropped.height - 1, 0, cropped.width - 1))
+    return cropped
 
 
 # ============================================================
@@ -153,28 +286,17 @@ def build_full_prompt(image: Image.Image, context: dict) -> dict:
     return {"prompt": prompt}
 
 
-def ai_generate_style(image: Image.Image, context: dict) -> Image.Image:
-    """步驟7：AI 生成向量插畫（1K 正方形）"""
-    import os
-    from dotenv import load_dotenv
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("請在 .env 檔案中設定 GEMINI_API_KEY")
-    
-    client = genai.Client(api_key=api_key)
-    
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='PNG')
-    img_bytes = img_byte_arr.getvalue()
+@traced("gemini.build_request")
+def _style_request(image: Image.Image, context: dict) -> dict:
+    img_bytes, mime_type = encode_image_for_api(image, "generation")
     
     prompt = context.get("prompt", get_style_prompt("head_chest"))
     
-    response = client.models.generate_content(
+    return dict(
         model=API_CONFIG.model_image,
         contents=[
             prompt,
-            types.Part.from_bytes(data=img_bytes, mime_type="image/png")
+            types.Part.from_bytes(data=img_bytes, mime_type=mime_type)
         ],
         config=types.GenerateContentConfig(
             response_modalities=['TEXT', 'IMAGE'],
@@ -184,42 +306,18 @@ def ai_generate_style(image: Image.Image, context: dict) -> Image.Image:
             )
         )
     )
-    
-    for part in response.candidates[0].content.parts:
-        if part.inline_data is not None:
-            return Image.open(io.BytesIO(part.inline_data.data))
-    
-    raise ValueError("AI 未返回圖片")
 
 
-def ai_generate_universal(image: Image.Image, context: dict) -> Image.Image:
-    """步驟7（萬能版）：AI 萬能智能生成（1K 正方形）"""
-    import os
-    from dotenv import load_dotenv
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("請在 .env 檔案中設定 GEMINI_API_KEY")
+@traced("gemini.build_request")
+def _universal_request(image: Image.Image, context: dict) -> dict:
+    # 準備圖片（白底 RGB）
+    img_bytes, mime_type = encode_image_for_api(flatten_to_rgb(image), "generation")
     
-    client = genai.Client(api_key=api_key)
-    
-    # 準備圖片
-    if image.mode == "RGBA":
-        bg = Image.new("RGB", image.size, (255, 255, 255))
-        bg.paste(image, mask=image.split()[3])
-        image = bg
-    elif image.mode != "RGB":
-        image = image.convert("RGB")
-    
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='PNG')
-    img_bytes = img_byte_arr.getvalue()
-    
-    response = client.models.generate_content(
+    return dict(
         model=API_CONFIG.model_image,
         contents=[
             UNIVERSAL_INTELLIGENT_PROMPT,
-            types.Part.from_bytes(data=img_bytes, mime_type="image/png")
+            types.Part.from_bytes(data=img_bytes, mime_type=mime_type)
         ],
         config=types.GenerateContentConfig(
             response_modalities=['TEXT', 'IMAGE'],
@@ -229,14 +327,50 @@ def ai_generate_universal(image: Image.Image, context: dict) -> Image.Image:
             )
         )
     )
-    
+
+
+@traced("gemini.parse_response")
+def _parse_generated_image(response) -> Image.Image:
     for part in response.candidates[0].content.parts:
         if part.inline_data is not None:
-            return Image.open(io.BytesIO(part.inline_data.data))
+            # 在此完成解碼（Image.open 為延遲解碼）
+            image = Image.open(io.BytesIO(part.inline_data.data))
+            image.load()
+            return image
     
     raise ValueError("AI 未返回圖片")
 
 
+def ai_generate_style(image: Image.Image, context: dict) -> Image.Image:
+    """步驟7：AI 生成向量插畫（1K 正方形）"""
+    response = generate_content(**_style_request(image, context))
+    return _parse_generated_image(response)
+
+
+async def ai_generate_style_async(image: Image.Image, context: dict) -> Image.Image:
+    """步驟7（async）：AI 生成向量插畫，等待期間不佔用執行緒"""
+    request = await run_cpu(_style_request, image, context)
+    report_progress(0.1, "等待 Gemini 回應...")
+    response = await generate_content_async(hedge=True, **request)
+    report_progress(0.9, "已收到 Gemini 回應")
+    return _parse_generated_image(response)
+
+
+def ai_generate_universal(image: Image.Image, context: dict) -> Image.Image:
+    """步驟7（萬能版）：AI 萬能智能生成（1K 正方形）"""
+    response = generate_content(**_universal_request(image, context))
+    return _parse_generated_image(response)
+
+
+async def ai_generate_universal_async(image: Image.Image, context: dict) -> Image.Image:
+    """步驟7（萬能版，async）：AI 萬能智能生成"""
+    request = await run_cpu(_universal_request, image, context)
+    report_progress(0.1, "等待 Gemini 回應...")
+    response = await generate_content_async(hedge=True, **request)
+    report_progress(0.9, "已收到 Gemini 回應")
+    return _parse_generated_image(response)
+
+
 # ============================================================
 # 背景處理組件（拆分為2個）
 # ============================================================
@@ -268,33 +402,7 @@ def make_white_transparent(image: Image.Image, context: dict) -> Image.Image:
         image = image.convert("RGBA")
     
     data = np.array(image)
-    threshold = 240
-    
-    white_mask = (data[:, :, 0] > threshold) & (data[:, :, 1] > threshold) & (data[:, :, 2] > threshold)
-    labeled, _ = ndimage.label(white_mask)
-    
-    edge_labels = set()
-    edge_labels.update(labeled[0, :])
-    edge_labels.update(labeled[-1, :])
-    edge_labels.update(labeled[:, 0])
-    edge_labels.update(labeled[:, -1])
-    edge_labels.discard(0)
-    
-    person_mask = (data[:, :, 0] < 245) | (data[:, :, 1] < 245) | (data[:, :, 2] < 245)
-    
-    if np.any(person_mask):
-        person_mask_expanded = ndimage.binary_dilation(person_mask, structure=np.ones((20, 20)))
-    else:
-        person_mask_expanded = np.zeros_like(person_mask)
-    
-    bg_mask = np.zeros_like(white_mask)
-    for label in edge_labels:
-        region_mask = (labeled == label)
-        overlap = np.sum(region_mask & person_mask_expanded)
-        total = np.sum(region_mask)
-        
-        if total > 0 and overlap / total < 0.3:
-            bg_mask = bg_mask | region_mask
+    bg_mask = edge_background_mask(data, threshold=240)
     
     data[bg_mask, 3] = 0
     return Image.fromarray(data, "RGBA")
@@ -309,50 +417,53 @@ def keep_background(image: Image.Image, context: dict) -> Image.Image:
 # 後處理組件（拆分為3個）
 # ============================================================
 
-def calculate_normalization(image: Image.Image, context: dict) -> dict:
-    """步驟10：計算標準化參數"""
-    if image.mode != "RGBA":
-        image = image.convert("RGBA")
-    
-    target_size = (1000, 1000)
-    alpha = np.array(image.split()[3])
-    person_mask = alpha > 0
-    
-    if not np.any(person_mask):
-        return {
-            "scale": 1.0,
-            "x_offset": 0,
-            "y_offset": 0,
-            "target_size": target_size
-        }
-    
-    rows, cols = np.where(person_mask)
-    min_row, max_row = rows.min(), rows.max()
-    min_col, max_col = cols.min(), cols.max()
+def _normalization_scale(bbox: BBox, image_size: tuple, target_size: tuple) -> float:
+    """人物邊界（加 10% 緩衝）縮放到目標畫布 70% 高、85% 寬的比例"""
+    width, height = image_size
+    min_row, max_row, min_col, max_col = bbox
     
     person_height = max_row - min_row
     person_width = max_col - min_col
     
+    # 添加緩衝
     padding_h = max(10, int(person_height * 0.1))
     padding_w = max(10, int(person_width * 0.1))
     min_row = max(0, min_row - padding_h)
-    max_row = min(image.height - 1, max_row + padding_h)
+    max_row = min(height - 1, max_row + padding_h)
     min_col = max(0, min_col - padding_w)
-    max_col = min(image.width - 1, max_col + padding_w)
+    max_col = min(width - 1, max_col + padding_w)
     
     person_height = max_row - min_row
     person_width = max_col - min_col
     
+    # 計算縮放
     target_person_height = int(target_size[1] * 0.70)
     target_person_width = int(target_size[0] * 0.85)
     
-    scale = min(
+    return min(
         target_person_height / person_height if person_height > 0 else 1.0,
         target_person_width / person_width if person_width > 0 else 1.0
     )
+
+
+def calculate_normalization(image: Image.Image, context: dict) -> dict:
+    """步驟10：計算標準化參數"""
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    
+    target_size = (1000, 1000)
+    bbox = _get_alpha_bbox(image, context)
+    
+    if bbox is None:
+        return {
+            "scale": 1.0,
+            "x_offset": 0,
+            "y_offset": 0,
+            "target_size": target_size
+        }
     
     return {
-        "scale": scale,
+        "scale": _normalization_scale(bbox, image.size, target_size),
         "target_size": target_size,
         "needs_positioning": True
     }
@@ -364,59 +475,47 @@ def resize_and_position(image: Image.Image, context: dict) -> Image.Image:
         image = image.convert("RGBA")
     
     target_size = (1000, 1000)
-    alpha = np.array(image.split()[3])
-    person_mask = alpha > 0
+    bbox = _get_alpha_bbox(image, context)
     
-    if not np.any(person_mask):
-        return image.resize(target_size, Image.Resampling.LANCZOS)
+    if bbox is None:
+        # 完全透明的圖縮放後仍完全透明
+        resized = image.resize(target_size, Image.Resampling.LANCZOS)
+        _remember_alpha_bbox(resized, context, None)
+        return resized
     
-    # 找出人物區域
-    rows, cols = np.where(person_mask)
-    min_row, max_row = rows.min(), rows.max()
-    min_col, max_col = cols.min(), cols.max()
+    scale = _normalization_scale(bbox, image.size, target_size)
     
-    person_height = max_row - min_row
-    person_width = max_col - min_col
+    # 縮放和定位
+    scaled = image.resize((int(image.width * scale), int(image.height * scale)), Image.Resampling.LANCZOS)
+    result = Image.new("RGBA", target_size, (0, 0, 0, 0))
     
-    # 添加緩衝
-    padding_h = max(10, int(person_height * 0.1))
-    padding_w = max(10, int(person_width * 0.1))
-    min_row = max(0, min_row - padding_h)
-    max_row = min(image.height - 1, max_row + padding_h)
-    min_col = max(0, min_col - padding_w)
-    max_col = min(image.width - 1, max_col + padding_w)
+    # 縮放後的人物位置：由縮放前邊界推算，只在邊緣附近窄帶確認
+    scaled_alpha = np.asarray(scaled)[:, :, 3]
+    scaled_bbox = scaled_alpha_bbox(
+        scaled_alpha, bbox, scaled.height / image.height, scaled.width / image.width
+    )
+    if scaled_bbox is None:
+        _remember_alpha_bbox(result, context, None)
+        return result
     
-    person_height = max_row - min_row
-    person_width = max_col - min_col
+    scaled_min_row, scaled_max_row, scaled_min_col, scaled_max_col = scaled_bbox
     
-    # 計算縮放
-    target_person_height = int(target_size[1] * 0.70)
-    target_person_width = int(target_size[0] * 0.85)
+    person_center = scaled_min_col + (scaled_max_col - scaled_min_col) / 2
+    x_offset = int(target_size[0] / 2 - person_center)
     
-    scale = min(
-        target_person_height / person_height if person_height > 0 else 1.0,
-        target_person_width / person_width if person_width > 0 else 1.0
-    )
+    head_top_y = int(target_size[1] * 0.35)
+    y_offset = head_top_y - scaled_min_row
     
-    # 縮放和定位
-    scaled = image.resize((int(image.width * scale), int(image.height * scale)), Image.Resampling.LANCZOS)
-    result = Image.new("RGBA", target_size, (0, 0, 0, 0))
+    result.paste(scaled, (x_offset, y_offset), scaled)
     
-    # 計算位置
-    scaled_alpha = np.array(scaled.split()[3])
-    if np.any(scaled_alpha > 0):
-        scaled_rows, scaled_cols = np.where(scaled_alpha > 0)
-        scaled_min_row = scaled_rows.min()
-        scaled_min_col = scaled_cols.min()
-        scaled_max_col = scaled_cols.max()
-        
-        person_center = scaled_min_col + (scaled_max_col - scaled_min_col) / 2
-        x_offset = int(target_size[0] / 2 - person_center)
-        
-        head_top_y = int(target_size[1] * 0.35)
-        y_offset = head_top_y - scaled_min_row
-        
-        result.paste(scaled, (x_offset, y_offset), scaled)
+    # 貼到透明畫布後 alpha 不變：輸出的邊界框 = 縮放後邊界框 + 貼上位移
+    # （超出畫布時被裁掉的部分無法推算，留給下一步掃描）
+    placed_bbox = (
+        scaled_min_row + y_offset, scaled_max_row + y_offset,
+        scaled_min_col + x_offset, scaled_max_col + x_offset
+    )
+    if placed_bbox[0] >= 0 and placed_bbox[1] < target_size[1] and placed_bbox[2] >= 0 and placed_bbox[3] < target_size[0]:
+        _remember_alpha_bbox(result, context, placed_bbox)
     
     return result
 
@@ -430,20 +529,12 @@ def crop_bottom_edge(image: Image.Image, context: dict) -> Image.Image:
         return image
     
     data = np.array(image)
-    alpha = data[:, :, 3]
-    person_mask = alpha > 0
-    
-    if np.any(person_mask):
-        rows, cols = np.where(person_mask)
-        min_col, max_col = cols.min(), cols.max()
-        center_col = (min_col + max_col) // 2
-        center_width = (max_col - min_col) // 3
-        
-        center_region = (cols >= center_col - center_width) & (cols <= center_col + center_width)
-        if np.any(center_region):
-            body_bottom_row = rows[center_region].max()
-            if body_bottom_row < data.shape[0] - 1:
-                data[body_bottom_row + 1:, :, 3] = 0
+    bbox = _get_alpha_bbox(image, context)
+    
+    if bbox is not None:
+        body_bottom_row = center_body_bottom(data[:, :, 3], bbox)
+        if body_bottom_row is not None and body_bottom_row < data.shape[0] - 1:
+            data[body_bottom_row + 1:, :, 3] = 0
     
     return Image.fromarray(data, "RGBA")
 
@@ -461,3 +552,17 @@ def convert_to_rgba(image: Image.Image, context: dict) -> Image.Image:
     """轉換為 RGBA 格式"""
     return image.convert("RGBA") if image.mode != "RGBA" else image
 
+
+
+# ============================================================
+# Async 版本對照（有網路呼叫的組件）
+# ============================================================
+
+ASYNC_COMPONENTS = {
+    detect_image_type: detect_image_type_async,
+    detect_body_extent: detect_body_extent_async,
+    analyze_image: analyze_image_async,
+    ai_generate_style: ai_generate_style_async,
+    ai_generate_universal: ai_generate_universal_async,
+}
+
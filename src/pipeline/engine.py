@@ -1,12 +1,55 @@
 """Pipeline 執行引擎"""
 
+import asyncio
+from functools import wraps
+from typing import Dict, Callable, Any, List
+
 from PIL import Image
-from typing import Dict, Callable, Any
+
+
+# 五個槽位的宣告（依序）：讀寫的 context 鍵與是否更新圖片，由 DAG 排程決定可重疊的部分
+# （分析呼叫 Gemini 時，預處理先假設為照片去背）
+PIPELINE_SLOTS = [
+    ("analysis", {"outputs": ["image_type", "body_extent"], "update_context": True, "gemini": True}),
+    ("preprocess", {"inputs": ["image_type"], "update_image": True, "speculate": {"image_type": "photo"}}),
+    ("style", {"inputs": ["body_extent"], "update_image": True, "gemini": True}),
+    ("background", {"update_image": True}),
+    ("postprocess", {"inputs": ["image_type"], "update_image": True}),
+]
+
+
+def _analysis_component(func: Callable[[Image.Image], dict]) -> Callable[[Image.Image, dict], dict]:
+    """分析組件只接收圖片，轉為 (image, context) 介面"""
+    @wraps(func)
+    def component(image: Image.Image, context: dict) -> dict:
+        return func(image)
+    return component
+
+
+def pipeline_steps(config: Dict[str, Callable]) -> List[Dict[str, Any]]:
+    """把槽位配置轉為宣告式步驟清單（未設定的槽位略過）"""
+    steps = []
+    for slot, declaration in PIPELINE_SLOTS:
+        func = config.get(slot)
+        if func is None:
+            continue
+        component = _analysis_component(func) if slot == "analysis" else func
+        steps.append({"name": slot, "component": component, **declaration})
+    return steps
+
+
+async def run_pipeline_async(image: Image.Image, config: Dict[str, Callable]) -> Image.Image:
+    """run_pipeline 的 async 版本"""
+    from ..metrics import style_run
+    from .scheduler import run_steps
+    with style_run("engine"):
+        state = await run_steps(pipeline_steps(config), image, {}, use_cache=False)
+    return state.image
 
 
 def run_pipeline(image: Image.Image, config: Dict[str, Callable]) -> Image.Image:
     """
-    執行處理 Pipeline
+    執行處理 Pipeline（不可在執行中的 event loop 內呼叫，請改用 run_pipeline_async）
     
     Args:
         image: 輸入圖片
@@ -21,30 +64,7 @@ def run_pipeline(image: Image.Image, config: Dict[str, Callable]) -> Image.Image
     Returns:
         處理後的圖片
     """
-    context = {}
-    
-    # 步驟1：分析（如果有）
-    if "analysis" in config and config["analysis"] is not None:
-        analysis_result = config["analysis"](image)
-        context.update(analysis_result)
-    
-    # 步驟2：預處理（如果有）
-    if "preprocess" in config and config["preprocess"] is not None:
-        image = config["preprocess"](image, context)
-    
-    # 步驟3：風格生成（如果有）
-    if "style" in config and config["style"] is not None:
-        image = config["style"](image, context)
-    
-    # 步驟4：背景處理（如果有）
-    if "background" in config and config["background"] is not None:
-        image = config["background"](image, context)
-    
-    # 步驟5：後處理（如果有）
-    if "postprocess" in config and config["postprocess"] is not None:
-        image = config["postprocess"](image, context)
-    
-    return image
+    return asyncio.run(run_pipeline_async(image, config))
 
 
 # 預設組件註冊表
@@ -0,0 +1,72 @@
+"""Pipeline 執行器 - 決定每個組件在哪裡執行
+
+- 有網路呼叫的組件：使用 async 版本（client.aio），直接在 event loop 上等待，不佔執行緒
+- CPU 密集組件：送到專用、有界的執行緒池（不使用 loop 的預設執行緒池，
+  避免擠佔健康檢查等其他工作）
+
+同時處理的 websocket session 數因此受 API 速率限制，而不是執行緒數。
+"""
+
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from PIL import Image
+
+from ..config import EXECUTOR_CONFIG
+
+
+_CPU_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_CPU_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_cpu_executor() -> ThreadPoolExecutor:
+    """取得 CPU 步驟專用執行緒池（第一次使用時建立）"""
+    global _CPU_EXECUTOR
+    if _CPU_EXECUTOR is None:
+        with _CPU_EXECUTOR_LOCK:
+            if _CPU_EXECUTOR is None:
+                _CPU_EXECUTOR = ThreadPoolExecutor(
+                    max_workers=EXECUTOR_CONFIG.cpu_workers,
+                    thread_name_prefix="pipeline-cpu"
+                )
+    return _CPU_EXECUTOR
+
+
+def shutdown_executors() -> None:
+    """關閉並重設執行器（下次使用時依 EXECUTOR_CONFIG 重新建立）"""
+    global _CPU_EXECUTOR
+    with _CPU_EXECUTOR_LOCK:
+        if _CPU_EXECUTOR is not None:
+            _CPU_EXECUTOR.shutdown(wait=True)
+            _CPU_EXECUTOR = None
+
+
+async def run_cpu(func: Callable, *args: Any, **kwargs: Any) -> Any:
+    """在 CPU 專用執行緒池執行同步函數（帶入目前的 contextvars，例如進度回呼）"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    func = functools.partial(ctx.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_cpu_executor(), func)
+
+
+async def run_component(component: Callable, image: Image.Image, context: dict) -> Any:
+    """
+    執行一個 Pipeline 組件
+
+    有 async 版本（ASYNC_COMPONENTS）的組件直接 await，其餘送到 CPU 執行緒池。
+    """
+    from .components_fine_grained import ASYNC_COMPONENTS
+
+    from ..metrics import COMPONENT_SECONDS
+
+    with COMPONENT_SECONDS.time(component=getattr(component, '__name__', str(component))):
+        async_component = ASYNC_COMPONENTS.get(component)
+        if async_component is not None:
+            return await async_component(image, context)
+        if asyncio.iscoroutinefunction(component):
+            return await component(image, context)
+        return await run_cpu(component, image, context)
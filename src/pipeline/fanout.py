@@ -0,0 +1,142 @@
+"""多風格扇出 - 一次上傳、多個風格，共用前綴步驟只執行一次
+
+把選取風格的步驟清單合併成一棵前綴樹（DAG）：
+- 從頭開始、語意相同的步驟（同組件、同 DAG 讀寫宣告、同結果用途、同 conditional 判斷函數）合併為同一節點
+- 節點有多個子節點時分岔，各分支（通常是各自的 AI 生成）並行執行
+- 每個風格的最後一個節點完成即回呼，不等其他分支
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from PIL import Image
+
+from ..metrics import style_label
+from ..result_cache import get_result_cache, hash_image_pixels
+from .executor import run_cpu
+from .runner import RunState, execute_step, load_cached_result, style_cache_key
+
+# (風格 ID, 結果圖片或 None, 錯誤或 None, 是否命中結果快取)
+ResultCallback = Callable[[str, Optional[Image.Image], Optional[Exception], bool], Awaitable[None]]
+
+
+def step_signature(step: dict) -> tuple:
+    """步驟的語意識別（相同者可合併；conditional 以判斷函數身分比對，風格設定應共用具名函數）"""
+    return (
+        step['component'],
+        tuple(sorted(step.get('inputs', ()))),
+        tuple(sorted(step.get('outputs', ()))),
+        tuple(sorted(step.get('conditional_inputs', ()))),
+        step.get('uses_image', True),
+        tuple(sorted(step.get('speculate', {}).items())),
+        bool(step.get('update_context')),
+        bool(step.get('update_image')),
+        step.get('conditional'),
+    )
+
+
+@dataclass
+class StepNode:
+    """前綴樹節點（根節點 step 為 None）"""
+    step: Optional[dict] = None
+    signature: Optional[tuple] = None
+    children: List["StepNode"] = field(default_factory=list)
+    # 在此節點結束的風格
+    styles: List[str] = field(default_factory=list)
+
+    def subtree_styles(self) -> List[str]:
+        styles = list(self.styles)
+        for child in self.children:
+            styles.extend(child.subtree_styles())
+        return styles
+
+    def count(self) -> int:
+        return (1 if self.step is not None else 0) + sum(child.count() for child in self.children)
+
+
+def build_style_dag(styles: Dict[str, dict]) -> StepNode:
+    """
+    合併多個風格的步驟清單
+
+    Args:
+        styles: {風格 ID: FINE_GRAINED_STYLES 中的設定}
+
+    Returns:
+        前綴樹的根節點
+    """
+    root = StepNode()
+    for style_id, config in styles.items():
+        node = root
+        for step in config['steps']:
+            signature = step_signature(step)
+            child = next((c for c in node.children if c.signature == signature), None)
+            if child is None:
+                child = StepNode(step, signature)
+                node.children.append(child)
+            node = child
+        node.styles.append(style_id)
+    return root
+
+
+async def run_fanout(
+    image: Image.Image,
+    styles: Dict[str, dict],
+    on_result: ResultCallback
+) -> dict:
+    """
+    以一張圖片執行多個風格（共用前綴只執行一次，分支並行）
+
+    Args:
+        image: 輸入圖片
+        styles: {風格 ID: 設定}
+        on_result: 每個風格完成（或失敗）時呼叫
+
+    Returns:
+        統計：{"styles", "cached", "steps_total", "steps_merged"}
+    """
+    result_cache = get_result_cache()
+    image_hash = await run_cpu(hash_image_pixels, image)
+
+    # 已有最終結果的風格直接回傳，不進入 DAG
+    pending = {}
+    cached = []
+    for style_id, config in styles.items():
+        cache_key = style_cache_key(image_hash, style_id, config)
+        result = await load_cached_result(cache_key)
+        if result is not None:
+            cached.append(style_id)
+            await on_result(style_id, result, None, True)
+        else:
+            pending[style_id] = (config, cache_key)
+
+    root = build_style_dag({style_id: config for style_id, (config, _) in pending.items()})
+
+    async def visit(node: StepNode, state: RunState) -> None:
+        if node.step is not None:
+            try:
+                # 共用前綴步驟以所有分支風格為標籤
+                with style_label(",".join(node.subtree_styles())):
+                    await execute_step(node.step, state)
+            except Exception as e:
+                for style_id in node.subtree_styles():
+                    await on_result(style_id, None, e, False)
+                return
+
+        for style_id in node.styles:
+            await run_cpu(result_cache.put, pending[style_id][1], state.image)
+            await on_result(style_id, state.image, None, False)
+
+        if len(node.children) == 1:
+            await visit(node.children[0], state)
+        elif node.children:
+            await asyncio.gather(*(visit(child, state.fork()) for child in node.children))
+
+    await visit(root, RunState(image, {}, image_hash))
+
+    return {
+        "styles": list(styles),
+        "cached": cached,
+        "steps_total": sum(len(config['steps']) for config, _ in pending.values()),
+        "steps_merged": root.count(),
+    }
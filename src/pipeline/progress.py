@@ -0,0 +1,124 @@
+"""進度回報 - 由實際事件驅動的步驟進度，並依時間合併訊息
+
+- 組件內以 report_progress(比例, 訊息) 回報實際事件（Gemini 請求送出/回應、rembg 模型就緒等），
+  未設定回呼時為 no-op；回呼透過 contextvars 傳遞，CPU 執行緒池中呼叫同樣有效
+- ProgressReporter：重要訊息（step_start、step_complete、complete…）立即送出；
+  step_update 在 interval 內每個步驟只送最新一筆，且同一步驟的進度與整體進度都不倒退
+  （DAG 排程下多個步驟可能同時進行）
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+ProgressCallback = Callable[[float, str], None]
+
+_PROGRESS_CALLBACK: "contextvars.ContextVar[Optional[ProgressCallback]]" = contextvars.ContextVar(
+    "pipeline_progress_callback", default=None
+)
+
+
+def report_progress(fraction: float, message: str) -> None:
+    """組件回報目前步驟的進度（0–1）"""
+    callback = _PROGRESS_CALLBACK.get()
+    if callback is not None:
+        callback(fraction, message)
+
+
+@contextmanager
+def progress_callback(callback: Optional[ProgressCallback]):
+    """在此範圍內執行的組件把進度回報給 callback"""
+    token = _PROGRESS_CALLBACK.set(callback)
+    try:
+        yield
+    finally:
+        _PROGRESS_CALLBACK.reset(token)
+
+
+class ProgressReporter:
+    """websocket 進度訊息的送出與合併"""
+
+    def __init__(self, send: Callable[[dict], Awaitable], interval: float = 0.1):
+        self._send = send
+        self.interval = interval
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._lock = asyncio.Lock()
+        # 每個步驟尚未送出的最新 step_update
+        self._pending: Dict[Any, dict] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._last_sent = 0.0
+        # 每個步驟已送出的最高進度、已送出的最高整體進度（避免倒退）
+        self._step_progress: Dict[Any, float] = {}
+        self._overall = 0.0
+
+    def _clamp_overall(self, data: dict) -> dict:
+        if 'overall_progress' in data:
+            self._overall = max(self._overall, data['overall_progress'])
+            data = {**data, 'overall_progress': self._overall}
+        return data
+
+    async def send(self, data: dict) -> None:
+        """立即送出（同一步驟尚未送出的 step_update 已過時，直接丟棄）"""
+        step_id = data.get('step_id')
+        if data.get('type') in ('step_start', 'step_complete'):
+            self._pending.pop(step_id, None)
+            self._step_progress[step_id] = data.get('step_progress', 0)
+        elif 'step_id' not in data:
+            self._pending.clear()
+        data = self._clamp_overall(data)
+        async with self._lock:
+            await self._send(data)
+            self._last_sent = time.monotonic()
+
+    def update(self, data: dict) -> None:
+        """排入 step_update（interval 內每個步驟合併為最新一筆）"""
+        step_id = data.get('step_id')
+        if data.get('step_progress', 0) <= self._step_progress.get(step_id, -1):
+            return
+        self._step_progress[step_id] = data.get('step_progress', 0)
+        self._pending[step_id] = data
+        if self._flush_handle is None:
+            delay = max(0.0, self._last_sent + self.interval - time.monotonic())
+            self._flush_handle = self._loop.call_later(delay, self._schedule_flush)
+
+    def _schedule_flush(self) -> None:
+        self._flush_handle = None
+        if self._pending:
+            self._loop.create_task(self.flush())
+
+    async def flush(self) -> None:
+        pending, self._pending = list(self._pending.values()), {}
+        if not pending:
+            return
+        async with self._lock:
+            for data in pending:
+                await self._send(self._clamp_overall(data))
+            self._last_sent = time.monotonic()
+
+    def step_callback(self, step_id: int, total_steps: int, step_name: str) -> ProgressCallback:
+        """建立組件用的進度回呼（可在任何執行緒呼叫）"""
+        def callback(fraction: float, message: str) -> None:
+            pct = int(max(0.0, min(fraction, 0.99)) * 100)
+            data = {
+                'type': 'step_update',
+                'step_id': step_id,
+                'step_progress': pct,
+                'overall_progress': ((step_id - 1) + pct / 100) / total_steps * 100,
+                'message': f'⚙️ {step_name}：{message}'
+            }
+            if threading.get_ident() == self._loop_thread:
+                self.update(data)
+            else:
+                self._loop.call_soon_threadsafe(self.update, data)
+        return callback
+
+    def close(self) -> None:
+        """取消尚未送出的合併訊息"""
+        self._pending = {}
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
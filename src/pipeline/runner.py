@@ -0,0 +1,136 @@
+"""無介面 Pipeline 執行 - 以 FINE_GRAINED_STYLES 的步驟清單處理單張圖片
+
+與 websocket 流程相同的步驟語意（conditional / update_context / update_image）與快取
+（結果快取、步驟快取），供批次處理等不需要逐步回報的呼叫端使用。
+"""
+
+import io
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple
+
+from PIL import Image
+
+from ..metrics import step_run, style_run
+from ..rate_limiter import TokenBucket
+from ..tracing import traced
+from ..result_cache import get_result_cache, hash_image_pixels, make_cache_key
+from .components_fine_grained import ALPHA_GEOMETRY
+from .executor import run_component, run_cpu
+from .step_cache import get_step_cache
+
+
+def is_gemini_step(step: dict) -> bool:
+    """步驟是否呼叫 Gemini（有 async 版本的組件即為網路呼叫；步驟可用 "gemini" 欄位明確指定）"""
+    from .components_fine_grained import ASYNC_COMPONENTS
+    return step.get('gemini', step['component'] in ASYNC_COMPONENTS)
+
+
+@dataclass
+class RunState:
+    """執行中的狀態：目前圖片、context、目前圖片產物的 ID（步驟快取鍵的一部分）"""
+    image: Image.Image
+    context: dict
+    artifact_id: str
+
+    def fork(self) -> "RunState":
+        """分支時複製 context（圖片不可變，可共用）"""
+        return RunState(self.image, dict(self.context), self.artifact_id)
+
+
+async def execute_step(
+    step: dict,
+    state: RunState,
+    gemini_bucket: Optional[TokenBucket] = None,
+    use_cache: bool = True
+) -> Tuple[bool, Any, bool]:
+    """
+    執行一個步驟並更新 state（conditional 不成立時略過）
+
+    Returns:
+        (是否執行, 組件結果, 是否命中步驟快取)
+    """
+    with step_run(step['name'], **{'pipeline.component': getattr(step['component'], '__name__', '')}) as outcome:
+        if 'conditional' in step and not step['conditional'](state.context):
+            outcome.label = "skipped"
+            return False, None, False
+
+        step_cache = get_step_cache()
+        component = step['component']
+        state.context['prev_size'] = f"{state.image.width}x{state.image.height}"
+        step_key = step_cache.step_key(state.artifact_id, component, state.context, step.get('inputs', ()))
+        geometry = state.context.get(ALPHA_GEOMETRY)
+        from_cache, result = False, None
+        if use_cache:
+            from_cache, result = await run_cpu(step_cache.get, step_key)
+
+        if from_cache:
+            outcome.label = "cached"
+        else:
+            if gemini_bucket is not None and is_gemini_step(step):
+                await gemini_bucket.acquire()
+            result = await run_component(component, state.image, state.context)
+            if use_cache:
+                await run_cpu(step_cache.put, step_key, result)
+
+        if step.get('update_context') and isinstance(result, dict):
+            state.context.update(result)
+        elif step.get('update_image') and isinstance(result, Image.Image):
+            if result is not state.image and state.context.get(ALPHA_GEOMETRY) is geometry:
+                # 組件沒有記錄新圖片的幾何（或快取命中），舊圖片的幾何不再適用
+                state.context[ALPHA_GEOMETRY] = None
+            state.image = result
+            state.artifact_id = step_key
+        return True, result, from_cache
+
+
+def style_cache_key(image_hash: str, style_id: str, style_config: dict) -> str:
+    """風格的結果快取鍵"""
+    return make_cache_key(image_hash, style_id, style_config.get('prompt_text', ''))
+
+
+async def load_cached_result(cache_key: str) -> Optional[Image.Image]:
+    """從結果快取取回圖片（未命中回傳 None）"""
+    cached_png = await run_cpu(get_result_cache().get, cache_key)
+    if cached_png is None:
+        return None
+    return await run_cpu(_decode_png, cached_png)
+
+
+async def run_style(
+    image: Image.Image,
+    style_id: str,
+    style_config: dict,
+    gemini_bucket: Optional[TokenBucket] = None
+) -> Tuple[Image.Image, bool]:
+    """
+    執行一個風格的完整步驟清單
+
+    Args:
+        image: 輸入圖片
+        style_id: 風格 ID（結果快取鍵的一部分）
+        style_config: FINE_GRAINED_STYLES 中的風格設定
+        gemini_bucket: 每次呼叫 Gemini 前取得一個 token（None 不限制）
+
+    Returns:
+        (結果圖片, 是否命中結果快取)
+    """
+    with style_run(style_id) as outcome:
+        image_hash = await run_cpu(hash_image_pixels, image)
+        cache_key = style_cache_key(image_hash, style_id, style_config)
+        cached = await load_cached_result(cache_key)
+        if cached is not None:
+            outcome.label = "cached"
+            return cached, True
+
+        from .scheduler import run_steps
+        state = await run_steps(style_config['steps'], image, {}, image_hash, gemini_bucket=gemini_bucket)
+
+        await run_cpu(get_result_cache().put, cache_key, state.image)
+        return state.image, False
+
+
+@traced("image.decode", format="PNG")
+def _decode_png(data: bytes) -> Image.Image:
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
@@ -0,0 +1,356 @@
+"""DAG 排程 - 依步驟宣告的 context 輸入/輸出，平行執行彼此獨立的步驟
+
+步驟宣告（除既有欄位外）：
+- inputs: 組件讀取的 context 鍵（同時是步驟快取鍵的一部分）
+- outputs: update_context 步驟寫入的 context 鍵；未宣告時視為屏障（等待之前所有步驟）
+- conditional_inputs: conditional 讀取的 context 鍵
+- uses_image: 組件是否讀取圖片（預設 True；只處理 context 的步驟設為 False）
+- speculate: {鍵: 假設值}，產生該鍵的步驟尚未完成時先以假設值預先執行
+
+每個讀取的鍵（含圖片）依賴清單中在它之前、最後一個寫入該鍵的步驟。依賴完成
+（即使仍是預先執行的結果）即可開始；呼叫 Gemini 的步驟只在依賴全部確認後才開始，
+不為可能作廢的結果付費。
+
+假設值與實際值不符時，取消（或丟棄）該步驟與所有用到其結果的後續步驟，再以實際值
+重跑；以假設值 conditional 成立、實際不成立的步驟因此被取消並略過。
+CPU 執行緒池中已開始的工作無法中斷，只會丟棄結果。
+"""
+
+import asyncio
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, ContextManager, Dict, List, Optional, Set
+
+from PIL import Image
+
+from ..rate_limiter import TokenBucket
+from .runner import RunState, execute_step, is_gemini_step
+
+# 圖片在依賴分析中視為一個特殊的鍵
+_IMAGE = "<image>"
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"            # 已完成，但依賴或假設尚未確認
+CONFIRMED = "confirmed"
+
+
+@dataclass
+class StepEvent:
+    """排程事件：start（開始執行）/ cancel（預先執行作廢）/ complete（結果確認）/ error（確認失敗）"""
+    kind: str
+    index: int
+    step: dict
+    speculative: bool = False
+    executed: bool = False
+    result: Any = None
+    image: Optional[Image.Image] = None
+    context: Optional[dict] = None
+    from_cache: bool = False
+    duration: float = 0.0
+    error: Optional[BaseException] = None
+
+
+@dataclass
+class ScheduledStep:
+    """DAG 中的一個步驟（靜態依賴 + 執行狀態）"""
+    index: int
+    step: dict
+    deps: Set[int]
+    # 預先執行：產生者 -> {鍵: 假設值}
+    soft: Dict[int, Dict[str, Any]]
+    ancestors: Set[int]
+    # 輸入圖片來自哪個步驟（None 為原圖）
+    image_source: Optional[int]
+
+    status: str = PENDING
+    task: Optional[asyncio.Task] = None
+    used: Set[int] = field(default_factory=set)
+    assumed: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    speculative: bool = False
+    started: float = 0.0
+    before: dict = field(default_factory=dict)
+    state: Optional[RunState] = None
+    writes: dict = field(default_factory=dict)
+    executed: bool = False
+    result: Any = None
+    from_cache: bool = False
+    error: Optional[BaseException] = None
+    duration: float = 0.0
+    cancelled: int = 0
+
+    @property
+    def waits_on(self) -> Set[int]:
+        return self.deps | set(self.soft)
+
+
+def _step_writes(step: dict) -> Optional[Set[str]]:
+    """步驟寫入的鍵（None：未宣告 outputs 的 update_context 步驟，視為屏障）"""
+    if step.get('update_context') and 'outputs' not in step:
+        return None
+    keys = set(step.get('outputs', ()))
+    if step.get('update_image'):
+        keys.add(_IMAGE)
+    return keys
+
+
+def _step_reads(step: dict) -> Set[str]:
+    keys = set(step.get('inputs', ())) | set(step.get('conditional_inputs', ())) | set(step.get('speculate', {}))
+    if step.get('uses_image', True):
+        keys.add(_IMAGE)
+    return keys
+
+
+def plan_steps(steps: List[dict]) -> List[ScheduledStep]:
+    """由步驟宣告建立依賴圖"""
+    writes: List[Optional[Set[str]]] = []
+    nodes: List[ScheduledStep] = []
+
+    def producer(key: str, before: int) -> Optional[int]:
+        for i in range(before - 1, -1, -1):
+            if writes[i] is None or key in writes[i]:
+                return i
+        return None
+
+    for j, step in enumerate(steps):
+        step_writes = _step_writes(step)
+        speculate = step.get('speculate', {})
+        deps: Set[int] = set()
+        soft: Dict[int, Dict[str, Any]] = {}
+        if step_writes is None:
+            deps = set(range(j))
+        else:
+            for key in _step_reads(step):
+                i = producer(key, j)
+                if i is None:
+                    continue
+                if key in speculate:
+                    soft.setdefault(i, {})[key] = speculate[key]
+                else:
+                    deps.add(i)
+        # 同一產生者另有非假設的輸入時無法預先執行
+        soft = {i: keys for i, keys in soft.items() if i not in deps}
+
+        image_source = None
+        if step.get('uses_image', True):
+            image_source = next((i for i in range(j - 1, -1, -1) if steps[i].get('update_image')), None)
+            if image_source is not None:
+                deps.add(image_source)
+
+        ancestors: Set[int] = set()
+        for i in deps | set(soft):
+            ancestors |= {i} | nodes[i].ancestors
+        writes.append(step_writes)
+        nodes.append(ScheduledStep(j, step, deps, soft, ancestors, image_source))
+    return nodes
+
+
+class StepScheduler:
+    """依 DAG 平行執行一個風格的步驟清單"""
+
+    def __init__(
+        self,
+        steps: List[dict],
+        gemini_bucket: Optional[TokenBucket] = None,
+        on_event: Optional[Callable[[StepEvent], Awaitable]] = None,
+        step_scope: Optional[Callable[[int], ContextManager]] = None,
+        use_cache: bool = True
+    ):
+        """
+        Args:
+            steps: 步驟清單
+            gemini_bucket: 每次呼叫 Gemini 前取得一個 token（None 不限制）
+            on_event: 排程事件回呼（依序 await）
+            step_scope: 每個步驟執行時進入的 context manager（例如進度回呼）
+            use_cache: 是否使用步驟快取
+        """
+        self.steps = steps
+        self.gemini_bucket = gemini_bucket
+        self.on_event = on_event
+        self.step_scope = step_scope
+        self.use_cache = use_cache
+        self.nodes: List[ScheduledStep] = []
+        self._initial: Optional[RunState] = None
+        self._running: Dict[asyncio.Task, ScheduledStep] = {}
+
+    async def run(self, image: Image.Image, context: dict, artifact_id: str) -> RunState:
+        """執行所有步驟，回傳最終狀態（任一步驟確認失敗時拋出該例外）"""
+        self.nodes = plan_steps(self.steps)
+        self._initial = RunState(image, dict(context), artifact_id)
+        self._running = {}
+        try:
+            while any(node.status != CONFIRMED for node in self.nodes):
+                for node in self.nodes:
+                    if node.status == PENDING and self._ready(node):
+                        await self._start(node)
+                if not self._running:
+                    raise RuntimeError("步驟依賴無法滿足")
+                done, _ = await asyncio.wait(self._running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    node = self._running.pop(task, None)
+                    if node is not None:
+                        self._finish(node, task)
+                await self._confirm()
+        finally:
+            for task in self._running:
+                task.cancel()
+            if self._running:
+                await asyncio.gather(*self._running, return_exceptions=True)
+            self._running = {}
+        return self._final_state()
+
+    def _ready(self, node: ScheduledStep) -> bool:
+        # Gemini 步驟不預先執行
+        gemini = is_gemini_step(node.step)
+        for i in node.deps:
+            dep = self.nodes[i]
+            if dep.status == CONFIRMED:
+                continue
+            if dep.status == DONE and dep.error is None and not gemini:
+                continue
+            return False
+        for i in node.soft:
+            producer = self.nodes[i]
+            if producer.status == CONFIRMED:
+                continue
+            if gemini or producer.error is not None:
+                return False
+        return True
+
+    async def _start(self, node: ScheduledStep) -> None:
+        view = dict(self._initial.context)
+        used = set()
+        for i in sorted(node.ancestors):
+            ancestor = self.nodes[i]
+            if ancestor.status in (DONE, CONFIRMED):
+                view.update(ancestor.writes)
+                used.add(i)
+        assumed = {i: dict(keys) for i, keys in node.soft.items() if i not in used}
+        for keys in assumed.values():
+            view.update(keys)
+
+        if node.image_source is None:
+            image, artifact_id = self._initial.image, self._initial.artifact_id
+        else:
+            source = self.nodes[node.image_source].state
+            image, artifact_id = source.image, source.artifact_id
+
+        node.used = used
+        node.assumed = assumed
+        node.speculative = bool(assumed) or any(self.nodes[i].status != CONFIRMED for i in used)
+        node.before = dict(view)
+        node.state = RunState(image, view, artifact_id)
+        node.status = RUNNING
+        node.started = time.monotonic()
+        node.task = asyncio.create_task(self._execute(node))
+        self._running[node.task] = node
+        await self._emit(StepEvent('start', node.index, node.step, speculative=node.speculative))
+
+    async def _execute(self, node: ScheduledStep):
+        scope = self.step_scope(node.index) if self.step_scope is not None else nullcontext()
+        with scope:
+            return await execute_step(node.step, node.state, self.gemini_bucket, self.use_cache)
+
+    def _finish(self, node: ScheduledStep, task: asyncio.Task) -> None:
+        node.status = DONE
+        node.duration = time.monotonic() - node.started
+        node.task = None
+        try:
+            node.executed, node.result, node.from_cache = task.result()
+        except Exception as e:
+            node.error = e
+            return
+        context = node.state.context
+        node.writes = {
+            key: value for key, value in context.items()
+            if key not in node.before or node.before[key] is not value
+        }
+
+    async def _confirm(self) -> None:
+        """依序確認已完成的步驟（依賴皆已確認、假設與實際值相符）"""
+        for node in self.nodes:
+            if node.status != DONE:
+                continue
+            if any(self.nodes[i].status != CONFIRMED for i in node.waits_on):
+                continue
+            mismatch = any(
+                self.nodes[i].state.context.get(key) != value
+                for i, keys in node.assumed.items() for key, value in keys.items()
+            )
+            if mismatch:
+                await self._invalidate(node)
+                continue
+            if node.error is not None:
+                await self._emit(StepEvent('error', node.index, node.step, error=node.error, duration=node.duration))
+                raise node.error
+            node.status = CONFIRMED
+            await self._emit(StepEvent(
+                'complete', node.index, node.step,
+                speculative=node.speculative,
+                executed=node.executed,
+                result=node.result,
+                image=node.state.image,
+                context=node.state.context,
+                from_cache=node.from_cache,
+                duration=node.duration
+            ))
+
+    async def _invalidate(self, node: ScheduledStep) -> None:
+        """作廢預先執行的結果（連同用到它的後續步驟），之後重新排程"""
+        if node.status == RUNNING:
+            node.task.cancel()
+            self._running.pop(node.task, None)
+        elif node.status != DONE:
+            return
+        node.status = PENDING
+        node.task = None
+        node.cancelled += 1
+        node.state = None
+        node.writes = {}
+        node.result = None
+        node.error = None
+        node.executed = node.from_cache = False
+        await self._emit(StepEvent('cancel', node.index, node.step, speculative=True))
+        for other in self.nodes:
+            if other.status in (RUNNING, DONE) and node.index in other.used:
+                await self._invalidate(other)
+
+    async def _emit(self, event: StepEvent) -> None:
+        if self.on_event is not None:
+            await self.on_event(event)
+
+    def _final_state(self) -> RunState:
+        context = dict(self._initial.context)
+        image, artifact_id = self._initial.image, self._initial.artifact_id
+        for node in self.nodes:
+            context.update(node.writes)
+            if node.step.get('update_image'):
+                image, artifact_id = node.state.image, node.state.artifact_id
+        return RunState(image, context, artifact_id)
+
+    def timings(self) -> List[dict]:
+        """每個步驟的執行時間（毫秒）與預先執行統計"""
+        return [
+            {
+                'step_id': node.index + 1,
+                'name': node.step['name'],
+                'executed': node.executed,
+                'cached': node.from_cache,
+                'speculative': node.speculative,
+                'cancelled': node.cancelled,
+                'duration_ms': round(node.duration * 1000, 1)
+            }
+            for node in self.nodes
+        ]
+
+
+async def run_steps(
+    steps: List[dict],
+    image: Image.Image,
+    context: Optional[dict] = None,
+    artifact_id: str = "",
+    **kwargs: Any
+) -> RunState:
+    """以 StepScheduler 執行步驟清單（kwargs 傳給 StepScheduler）"""
+    return await StepScheduler(steps, **kwargs).run(image, context or {}, artifact_id)
@@ -0,0 +1,105 @@
+"""步驟快取 - 細粒度 Pipeline 每個步驟的中間產物記憶化
+
+鍵 = (輸入產物 ID, 組件身分, 組件讀取的 context 值)：
+- 輸入產物 ID：上傳圖片為像素雜湊；之後每個更新圖片的步驟，
+  產物 ID 直接沿用該步驟的快取鍵（依推導來源定址，不必重新雜湊整張圖）
+- 組件讀取的 context 鍵由步驟設定的 "inputs" 宣告
+
+後期步驟失敗後重跑、或與其他風格共用前綴（檢測、去背、裁切、Prompt）時，
+已完成的步驟直接從快取取回，不再呼叫 Gemini。
+"""
+
+import hashlib
+import pickle
+import threading
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+from ..config import CACHE_CONFIG
+from ..result_cache import CacheBackend, create_backend
+
+
+def component_identity(component: Callable) -> str:
+    """組件身分（模組 + 名稱）"""
+    return f"{component.__module__}.{component.__qualname__}"
+
+
+def context_fingerprint(context: dict, keys: Iterable[str]) -> str:
+    """組件讀取的 context 值（未設定的鍵也要區分）"""
+    h = hashlib.sha256()
+    for key in sorted(keys):
+        if key not in context:
+            # 與值為 None 的鍵區分
+            h.update(key.encode() + b"\0")
+            continue
+        h.update(key.encode() + b"=")
+        h.update(repr(context[key]).encode() + b"\0")
+    return h.hexdigest()
+
+
+class StepCache:
+    """步驟結果快取（結果以 pickle 儲存於 CacheBackend）"""
+
+    def __init__(self, backend: Optional[CacheBackend]):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    @staticmethod
+    def step_key(artifact_id: str, component: Callable, context: dict, keys: Iterable[str] = ()) -> str:
+        """建立步驟快取鍵"""
+        h = hashlib.sha256()
+        h.update(artifact_id.encode() + b"\0")
+        h.update(component_identity(component).encode() + b"\0")
+        h.update(context_fingerprint(context, keys).encode())
+        return h.hexdigest()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """查詢快取，回傳 (是否命中, 結果)"""
+        if not self.enabled:
+            return False, None
+        data = self.backend.get(key)
+        if data is None:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, pickle.loads(data)
+
+    def put(self, key: str, result: Any) -> None:
+        """寫入步驟結果"""
+        if not self.enabled:
+            return
+        self.backend.put(key, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "entries": len(self.backend) if self.enabled else 0,
+            "bytes": self.backend.total_bytes if self.enabled else 0,
+        }
+
+
+_STEP_CACHE: Optional[StepCache] = None
+_STEP_CACHE_LOCK = threading.Lock()
+
+
+def get_step_cache() -> StepCache:
+    """取得全域步驟快取（第一次使用時依 CACHE_CONFIG 建立）"""
+    global _STEP_CACHE
+    if _STEP_CACHE is None:
+        with _STEP_CACHE_LOCK:
+            if _STEP_CACHE is None:
+                if CACHE_CONFIG.step_backend == "none":
+                    _STEP_CACHE = StepCache(None)
+                else:
+                    _STEP_CACHE = StepCache(create_backend(
+                        CACHE_CONFIG.step_backend, CACHE_CONFIG.step_max_bytes, CACHE_CONFIG.step_path, suffix=".pkl"
+                    ))
+    return _STEP_CACHE
@@ -1,6 +1,33 @@
-"""細粒度風格配置 - 使用拆分後的細粒度組件"""
+"""細粒度風格配置 - 使用拆分後的細粒度組件
+
+步驟欄位：
+- component: 組件函數 (image, context) -> Image 或 dict
+- update_context / update_image / show_image: 結果用途
+- conditional: 依 context 決定是否執行（使用具名判斷函數，多風格扇出以函數身分比對步驟）
+- inputs: 組件讀取的 context 鍵（步驟快取鍵的一部分）
+- outputs / conditional_inputs / uses_image / speculate: DAG 排程用的宣告（見 scheduler.py）
+"""
 
 from . import components_fine_grained as fg
+from ..prompts import (
+    STYLE_PROMPT_TEMPLATE, BODY_INSTRUCTIONS, ANALYZE_JSON_PROMPT, UNIVERSAL_INTELLIGENT_PROMPT,
+)
+
+
+def _prompt_text(*prompts) -> str:
+    """合併風格用到的所有 Prompt（作為結果快取鍵的一部分，Prompt 改版即失效）"""
+    parts = []
+    for prompt in prompts:
+        if isinstance(prompt, dict):
+            parts.extend(prompt[key] for key in sorted(prompt))
+        else:
+            parts.append(prompt)
+    return "\n\n".join(parts)
+
+
+def is_photo(ctx: dict) -> bool:
+    """僅照片執行的步驟"""
+    return ctx.get("image_type") == "photo"
 
 
 # ============================================================
@@ -10,19 +37,23 @@ from . import components_fine_grained as fg
 I4_DETAILED_FINE = {
     "name": "I4 詳細版（細粒度）",
     "description": "完整流程，每個步驟獨立顯示",
+    "prompt_text": _prompt_text(ANALYZE_JSON_PROMPT, BODY_INSTRUCTIONS, STYLE_PROMPT_TEMPLATE),
     "steps": [
-        # 步驟1：檢測圖片類型
+        # 步驟1：檢測圖片類型（與身體範圍合併為一次 API 呼叫，以原圖判斷）
         {
             "name": "檢測圖片類型",
             "icon": "🔍",
-            "component": fg.detect_image_type,
+            "component": fg.analyze_image,
+            "outputs": ["image_type", "body_extent"],
             "update_context": True
         },
-        # 步驟2：去背處理（照片）或格式轉換（插畫）
+        # 步驟2：去背處理（照片）或格式轉換（插畫）；檢測期間先假設為照片去背
         {
             "name": "去背處理",
             "icon": "✂️",
             "component": fg.rembg_remove_background,
+            "inputs": ["image_type"],
+            "speculate": {"image_type": "photo"},
             "update_image": True,
             "show_image": True
         },
@@ -33,13 +64,18 @@ I4_DETAILED_FINE = {
             "component": fg.crop_to_content,
             "update_image": True,
             "show_image": True,
-            "conditional": lambda ctx: ctx.get("image_type") == "photo"
+            "conditional": is_photo,
+            "conditional_inputs": ["image_type"],
+            "speculate": {"image_type": "photo"}
         },
-        # 步驟4：檢測身體範圍（原版順序：在去背之後）
+        # 步驟4：檢測身體範圍（沿用步驟1的結果，介面上仍顯示為獨立步驟）
         {
             "name": "檢測身體範圍",
             "icon": "🔍",
-            "component": fg.detect_body_extent,
+            "component": fg.use_detected_body_extent,
+            "inputs": ["body_extent"],
+            "outputs": ["body_extent"],
+            "uses_image": False,
             "update_context": True
         },
         # 步驟5：生成Body Instruction（需要新增組件）
@@ -47,6 +83,9 @@ I4_DETAILED_FINE = {
             "name": "生成處理指令",
             "icon": "📝",
             "component": fg.generate_body_instruction,
+            "inputs": ["body_extent"],
+            "outputs": ["body_instruction"],
+            "uses_image": False,
             "update_context": True
         },
         # 步驟6：構建完整Prompt
@@ -54,6 +93,9 @@ I4_DETAILED_FINE = {
             "name": "構建AI Prompt",
             "icon": "📋",
             "component": fg.build_full_prompt,
+            "inputs": ["body_extent"],
+            "outputs": ["prompt"],
+            "uses_image": False,
             "update_context": True
         },
         # 步驟7：AI生成向量插畫
@@ -61,6 +103,7 @@ I4_DETAILED_FINE = {
             "name": "AI生成插畫",
             "icon": "🎨",
             "component": fg.ai_generate_style,
+            "inputs": ["prompt"],
             "update_image": True,
             "show_image": True
         },
@@ -85,14 +128,28 @@ I4_DETAILED_FINE = {
             "name": "底部裁切",
             "icon": "✂️",
             "component": fg.crop_bottom_edge,
+            "inputs": ["image_type"],
             "update_image": True,
             "show_image": True,
-            "conditional": lambda ctx: ctx.get("image_type") == "photo"
+            "conditional": is_photo,
+            "conditional_inputs": ["image_type"]
         }
     ]
 }
 
 
+# ============================================================
+# I4 詳細版（白底）- 與詳細版共用檢測、去背、Prompt 與 AI 生成
+# ============================================================
+
+I4_DETAILED_WHITE_FINE = {
+    "name": "I4 詳細版・白底（細粒度）",
+    "description": "詳細版流程，保留 AI 生成的白色背景與原尺寸",
+    "prompt_text": I4_DETAILED_FINE["prompt_text"],
+    "steps": I4_DETAILED_FINE["steps"][:7]
+}
+
+
 # ============================================================
 # 萬能智能版 - 細粒度配置
 # ============================================================
@@ -100,6 +157,7 @@ I4_DETAILED_FINE = {
 UNIVERSAL_INTELLIGENT_FINE = {
     "name": "萬能智能版（細粒度）",
     "description": "極簡流程，AI 萬能生成 + 透明背景",
+    "prompt_text": _prompt_text(UNIVERSAL_INTELLIGENT_PROMPT),
     "steps": [
         {
             "name": "AI 萬能智能生成",
@@ -126,6 +184,7 @@ UNIVERSAL_INTELLIGENT_FINE = {
 I4_SIMPLIFIED_FINE = {
     "name": "I4 簡化版（細粒度）",
     "description": "跳過檢測和預處理的快速版本",
+    "prompt_text": _prompt_text(BODY_INSTRUCTIONS, STYLE_PROMPT_TEMPLATE),
     "steps": [
         {
             "name": "準備圖片給 AI",
@@ -137,12 +196,16 @@ I4_SIMPLIFIED_FINE = {
             "name": "構建風格 Prompt",
             "icon": "📝",
             "component": fg.build_full_prompt,
+            "inputs": ["body_extent"],
+            "outputs": ["prompt"],
+            "uses_image": False,
             "update_context": True
         },
         {
             "name": "AI 生成向量插畫",
             "icon": "🎨",
             "component": fg.ai_generate_style,
+            "inputs": ["prompt"],
             "update_image": True,
             "show_image": True
         }
@@ -156,6 +219,7 @@ I4_SIMPLIFIED_FINE = {
 
 FINE_GRAINED_STYLES = {
     "i4_detailed": I4_DETAILED_FINE,
+    "i4_detailed_white": I4_DETAILED_WHITE_FINE,
     "universal_intelligent": UNIVERSAL_INTELLIGENT_FINE,
     "i4_simplified": I4_SIMPLIFIED_FINE
 }
@@ -169,6 +233,12 @@ STYLE_OPTIONS = [
         "description": "完整流程（10步驟）",
         "recommended": True
     },
+    {
+        "id": "i4_detailed_white",
+        "name": "I4 詳細版（白底）",
+        "description": "完整流程，保留白色背景（7步驟）",
+        "recommended": False
+    },
     {
         "id": "universal_intelligent",
         "name": "萬能智能版",
@@ -0,0 +1,95 @@
+"""預覽暫存 - 中間步驟的縮圖以短效 URL 提供，不再以 base64 PNG 塞進 JSON
+
+- 縮圖：最長邊 PREVIEW_CONFIG.max_side，WebP（保留透明）或 JPEG
+- 暫存：記憶體內，依有效時間與位元組上限淘汰
+- websocket 只傳送 /api/previews/{token}，瀏覽器再以一般 HTTP 取回
+"""
+
+import io
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from .config import PREVIEW_CONFIG
+
+MEDIA_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg", "PNG": "image/png"}
+
+
+def encode_preview(image: Image.Image, max_side: int = None, fmt: str = None, quality: int = None) -> bytes:
+    """將圖片縮小並編碼為預覽用格式"""
+    max_side = max_side or PREVIEW_CONFIG.max_side
+    fmt = fmt or PREVIEW_CONFIG.format
+    quality = quality or PREVIEW_CONFIG.quality
+
+    preview = image
+    if max(image.size) > max_side:
+        preview = image.copy()
+        preview.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+
+    if fmt == "JPEG" and preview.mode != "RGB":
+        # JPEG 不支援透明，以白底合成（與結果頁背景一致）
+        rgba = preview.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.split()[3])
+        preview = background
+
+    buffered = io.BytesIO()
+    preview.save(buffered, format=fmt, quality=quality)
+    return buffered.getvalue()
+
+
+class PreviewStore:
+    """短效預覽暫存（token -> (到期時間, media type, bytes)）"""
+
+    def __init__(self, ttl_seconds: int, max_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Tuple[float, str, bytes]]" = OrderedDict()
+        self._total_bytes = 0
+
+    def put(self, data: bytes, media_type: str) -> str:
+        """存入預覽，回傳 token"""
+        token = secrets.token_urlsafe(16)
+        with self._lock:
+            self._items[token] = (time.monotonic() + self.ttl_seconds, media_type, data)
+            self._total_bytes += len(data)
+            self._evict()
+        return token
+
+    def get(self, token: str) -> Optional[Tuple[str, bytes]]:
+        """取回 (media type, bytes)；過期或不存在回傳 None"""
+        with self._lock:
+            self._evict()
+            item = self._items.get(token)
+        if item is None:
+            return None
+        return item[1], item[2]
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        # 先進先出：最舊的最先到期
+        while self._items:
+            token, (expires, _, data) = next(iter(self._items.items()))
+            if expires > now and self._total_bytes <= self.max_bytes:
+                break
+            self._items.popitem(last=False)
+            self._total_bytes -= len(data)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._items), "bytes": self._total_bytes}
+
+
+PREVIEW_STORE = PreviewStore(PREVIEW_CONFIG.ttl_seconds, PREVIEW_CONFIG.max_bytes)
+
+
+def publish_preview(image: Image.Image) -> str:
+    """編碼縮圖並存入暫存，回傳預覽 URL（在 CPU 執行緒池呼叫；縮圖記憶於 ImageArtifact）"""
+    from .artifact import artifact_for
+    data, media_type = artifact_for(image).preview()
+    token = PREVIEW_STORE.put(data, media_type)
+    return f"/api/previews/{token}"
@@ -242,6 +242,27 @@ TYPE: [PHOTO/ILLUSTRATION]
 BODY: [HEAD_ONLY/HEAD_NECK/HEAD_CHEST/FULL_BODY]"""
 
 
+# ============================================================
+# 合併檢測 Prompt（細粒度 Pipeline，JSON 結構化輸出）
+# ============================================================
+
+ANALYZE_JSON_PROMPT = """Analyze this image and classify it on two axes.
+
+1. image_type:
+   - ILLUSTRATION - a digital illustration, vector art, cartoon, anime, or any non-photographic artwork
+   - PHOTO - a real photograph of a person
+
+2. body_extent (the visible body parts of the person):
+   - HEAD_ONLY - ONLY the head/face (stops at the chin or neck base, no visible shoulders or chest)
+   - HEAD_NECK - head and neck, but stops at or just below the neck (no visible shoulders or chest)
+   - HEAD_CHEST - head, neck, shoulders, and upper chest ONLY (stops at upper chest level, NO visible waist, NO visible lower chest below the shoulders, NO visible abdomen, NO visible lower body parts)
+   - FULL_BODY - ANY part of the body below the upper chest: waist (腰部), lower chest below shoulders (肩膀以下的胸部), abdomen (腹部), hips (臀部), legs (腿部), or ANY lower body parts
+
+CRITICAL: If you can see the waist (腰部), lower chest below shoulders, abdomen, or any part below the upper chest/shoulder area, body_extent MUST be FULL_BODY, NOT HEAD_CHEST.
+
+Respond with JSON only."""
+
+
 # ============================================================
 # 身體檢測 Prompt (原版詳細版本)
 # ============================================================
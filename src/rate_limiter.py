@@ -0,0 +1,344 @@
+"""速率限制 - 進程共用的 Gemini 配額控制
+
+- TokenBucket：以「預約」計算等待時間（執行緒安全，async 與同步呼叫端共用同一個 bucket）
+- ModelLimiter：每個模型一個 bucket（model_text 與 model_image 配額分開），
+  遇到 429 時依 Retry-After（或加抖動的指數退避）讓所有呼叫端一起暫停，並暫時降低速率；
+  之後每次成功逐步恢復到設定值
+- RetryPolicy：一次呼叫的配額重試流程（等待時間、錯誤判斷、是否重試），
+  call（async）與 call_sync 只負責等待與呼叫
+- RateLimiter：依模型名稱取得 ModelLimiter，提供 call / call_sync 重試包裝與配額使用統計
+"""
+
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import deque
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .config import API_CONFIG, RATE_LIMIT_CONFIG
+
+
+class TokenBucket:
+    """
+    token bucket
+
+    每秒補充 rate 個 token，最多累積 capacity 個。reserve 直接扣除 token（可為負數）
+    並回傳需等待的秒數，因此等待本身不需持有鎖，先預約者先取得。
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        if rate <= 0:
+            raise ValueError("rate 必須大於 0")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests_per_minute: float, burst: float = None) -> "TokenBucket":
+        """以每分鐘請求數建立（預設可突發 1 個）"""
+        return cls(requests_per_minute / 60.0, burst if burst is not None else 1.0)
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens: float = 1.0, not_before: float = 0.0) -> float:
+        """
+        預約 tokens 個 token，回傳需等待的秒數
+
+        Args:
+            not_before: 不早於此時間點（time.monotonic），用於配額暫停
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, not_before - now)
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+    async def acquire(self, tokens: float = 1.0) -> float:
+        """取得 token（非阻塞等待），回傳等待秒數"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def acquire_sync(self, tokens: float = 1.0) -> float:
+        """取得 token（阻塞目前執行緒），回傳等待秒數"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+# ============================================================
+# 配額錯誤判斷
+# ============================================================
+
+_RETRY_DELAY_PATTERN = re.compile(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s")
+
+
+def is_quota_error(error: Exception) -> bool:
+    """是否為配額錯誤（HTTP 429 / RESOURCE_EXHAUSTED）"""
+    if getattr(error, "code", None) == 429 or getattr(error, "status", None) == "RESOURCE_EXHAUSTED":
+        return True
+    error_str = str(error)
+    return "429" in error_str or "RESOURCE_EXHAUSTED" in error_str
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """從錯誤取出伺服器建議的等待秒數（Retry-After 標頭或 RetryInfo.retryDelay）"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+    for text in (str(getattr(error, "details", "") or ""), str(error)):
+        match = _RETRY_DELAY_PATTERN.search(text)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+# ============================================================
+# 每模型限制器
+# ============================================================
+
+class ModelLimiter:
+    """單一模型的速率限制與配額狀態"""
+
+    def __init__(self, model: str, requests_per_minute: float):
+        self.model = model
+        self.configured_rpm = requests_per_minute
+        self.bucket = TokenBucket.per_minute(requests_per_minute)
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self._consecutive_errors = 0
+        self._recent = deque()  # 最近 60 秒內送出的請求時間
+        self.requests = 0
+        self.quota_errors = 0
+        self.retries = 0
+
+    @property
+    def current_rpm(self) -> float:
+        return self.bucket.rate * 60.0
+
+    def reserve(self) -> float:
+        """預約一次請求，回傳需等待的秒數（含配額暫停）"""
+        with self._lock:
+            paused_until = self._paused_until
+        return self.bucket.reserve(1.0, not_before=paused_until)
+
+    def pause_remaining(self) -> float:
+        """配額暫停剩餘秒數"""
+        with self._lock:
+            return max(0.0, self._paused_until - time.monotonic())
+
+    def record_request(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            self._recent.append(now)
+            while self._recent and self._recent[0] < now - 60:
+                self._recent.popleft()
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def on_success(self) -> None:
+        """成功：速率逐步恢復（每次 +10% 設定值）"""
+        with self._lock:
+            self._consecutive_errors = 0
+            rate = min(self.configured_rpm, self.current_rpm + self.configured_rpm * 0.1)
+        if rate != self.current_rpm:
+            self.bucket.set_rate(rate / 60.0)
+
+    def on_quota_error(self, retry_after: Optional[float]) -> float:
+        """
+        配額錯誤：所有呼叫端一起暫停，速率減半
+
+        Returns:
+            暫停秒數
+        """
+        with self._lock:
+            self.quota_errors += 1
+            self._consecutive_errors += 1
+            if retry_after is not None:
+                delay = retry_after
+            else:
+                backoff = RATE_LIMIT_CONFIG.backoff_base * (2 ** (self._consecutive_errors - 1))
+                delay = min(RATE_LIMIT_CONFIG.backoff_max, backoff)
+            # 抖動，避免所有呼叫端同時恢復
+            delay *= random.uniform(1.0, 1.0 + RATE_LIMIT_CONFIG.jitter)
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            rate = max(RATE_LIMIT_CONFIG.min_rpm, self.current_rpm / 2)
+        self.bucket.set_rate(rate / 60.0)
+        return delay
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and self._recent[0] < now - 60:
+                self._recent.popleft()
+            return {
+                "model": self.model,
+                "configured_rpm": self.configured_rpm,
+                "current_rpm": round(self.current_rpm, 2),
+                "requests_last_minute": len(self._recent),
+                "usage_ratio": round(len(self._recent) / self.configured_rpm, 3) if self.configured_rpm else 0.0,
+                "paused_seconds": round(max(0.0, self._paused_until - now), 1),
+                "requests": self.requests,
+                "quota_errors": self.quota_errors,
+                "retries": self.retries,
+            }
+
+
+class RetryPolicy:
+    """
+    一次呼叫（含重試）的配額處理
+
+    使用方式：每次嘗試前以 wait / pause_remaining 取得等待秒數並等待，呼叫後回報
+    succeeded 或 failed；failed 回傳 True 表示應重試，否則呼叫端重新拋出錯誤。
+    """
+
+    def __init__(self, limiter: ModelLimiter, max_retries: int = None):
+        self.limiter = limiter
+        self.max_retries = API_CONFIG.max_retries if max_retries is None else max_retries
+        self.attempt = 0
+
+    @property
+    def attempts(self) -> range:
+        return range(self.max_retries + 1)
+
+    def wait(self) -> float:
+        """預約本次嘗試，回傳需等待的秒數"""
+        return self.limiter.reserve()
+
+    def pause_remaining(self) -> float:
+        """等待期間若有其他呼叫遇到配額錯誤，一併延後"""
+        return self.limiter.pause_remaining()
+
+    def started(self, attempt: int) -> None:
+        self.attempt = attempt
+        self.limiter.record_request()
+
+    def succeeded(self) -> None:
+        self.limiter.on_success()
+
+    def failed(self, error: Exception) -> bool:
+        """回報錯誤，回傳是否重試（非配額錯誤或已達重試上限時為 False）"""
+        if not is_quota_error(error):
+            return False
+        # 最後一次也要記錄，讓其他呼叫端一起暫停
+        delay = self.limiter.on_quota_error(retry_after_seconds(error))
+        if self.attempt == self.max_retries:
+            return False
+        self.limiter.record_retry()
+        print(f"⏳ {self.limiter.model} 配額限制 (嘗試 {self.attempt + 1}/{self.max_retries + 1})，全部請求暫停 {delay:.1f} 秒")
+        return True
+
+
+class RateLimiter:
+    """進程共用的 Gemini 速率限制器"""
+
+    def __init__(self):
+        self._limiters: Dict[str, ModelLimiter] = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, model: str) -> ModelLimiter:
+        """取得模型的限制器（圖片生成模型與其他模型使用不同配額）"""
+        with self._lock:
+            limiter = self._limiters.get(model)
+            if limiter is None:
+                rpm = RATE_LIMIT_CONFIG.image_rpm if model == API_CONFIG.model_image else RATE_LIMIT_CONFIG.text_rpm
+                limiter = self._limiters[model] = ModelLimiter(model, rpm)
+            return limiter
+
+    async def call(self, model: str, func: Callable[[], Awaitable[Any]], max_retries: int = None) -> Any:
+        """
+        在速率限制下執行 async 呼叫，配額錯誤時重試
+
+        Args:
+            model: 模型名稱
+            func: 無參數函數，每次呼叫回傳新的 awaitable
+            max_retries: 最大重試次數（None 使用 API_CONFIG.max_retries）
+        """
+        policy = RetryPolicy(self.limiter(model), max_retries)
+        for attempt in policy.attempts:
+            wait = policy.wait()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = policy.pause_remaining()
+            policy.started(attempt)
+            try:
+                result = await func()
+            except Exception as e:
+                if policy.failed(e):
+                    continue
+                raise
+            policy.succeeded()
+            return result
+
+    def call_sync(self, model: str, func: Callable[[], Any], max_retries: int = None) -> Any:
+        """call 的同步版本（在工作執行緒中使用）"""
+        policy = RetryPolicy(self.limiter(model), max_retries)
+        for attempt in policy.attempts:
+            wait = policy.wait()
+            while wait > 0:
+                time.sleep(wait)
+                wait = policy.pause_remaining()
+            policy.started(attempt)
+            try:
+                result = func()
+            except Exception as e:
+                if policy.failed(e):
+                    continue
+                raise
+            policy.succeeded()
+            return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return {limiter.model: limiter.stats() for limiter in limiters}
+
+
+# 全域速率限制器
+RATE_LIMITER = RateLimiter()
+
+
+def rate_limited(model: str, max_retries: int = None) -> Callable:
+    """
+    同步函數裝飾器：呼叫前經過 model 的速率限制，配額錯誤時重試
+
+    Args:
+        model: 模型名稱（決定使用哪個配額）
+        max_retries: 最大重試次數（None 使用 API_CONFIG.max_retries）
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            return RATE_LIMITER.call_sync(model, lambda: func(*args, **kwargs), max_retries)
+        return wrapper
+    return decorator
@@ -0,0 +1,112 @@
+"""rembg Session 管理 - 每個進程只載入一次去背模型
+
+rembg.remove() 不帶 session 時每次呼叫都可能重新載入 ONNX 模型（數秒、數百 MB），
+這裡統一建立並持有一個 session：
+- 延遲建立、執行緒安全
+- 模型可設定（u2net / u2netp / isnet / silueta）
+- 限制 ONNX Runtime intra-op 執行緒數
+- 可在啟動時預熱（跑一次小圖推論）
+"""
+
+import threading
+import time
+
+import numpy as np
+import onnxruntime as ort
+from PIL import Image
+from rembg import remove
+from rembg.sessions import sessions_class
+
+from .config import REMBG_CONFIG
+from .metrics import REMBG_SECONDS
+
+
+# 設定檔名稱 → rembg 模型名稱
+MODEL_ALIASES = {
+    "u2net": "u2net",
+    "u2netp": "u2netp",
+    "isnet": "isnet-general-use",
+    "silueta": "silueta",
+}
+
+
+class RembgSessionManager:
+    """持有全進程共用的 rembg session"""
+
+    def __init__(self, model: str = None, intra_op_threads: int = None):
+        self.model = model or REMBG_CONFIG.model
+        self.intra_op_threads = intra_op_threads or REMBG_CONFIG.intra_op_threads
+        self._lock = threading.Lock()
+        self._session = None
+        self._load_seconds = 0.0
+        self._inferences = 0
+        self._last_seconds = 0.0
+
+    def _create_session(self):
+        model_name = MODEL_ALIASES.get(self.model)
+        if model_name is None:
+            raise ValueError(f"不支援的 rembg 模型：{self.model}（可選：{', '.join(MODEL_ALIASES)}）")
+
+        session_class = next((sc for sc in sessions_class if sc.name() == model_name), None)
+        if session_class is None:
+            raise ValueError(f"目前安裝的 rembg 不支援模型：{model_name}")
+
+        sess_opts = ort.SessionOptions()
+        sess_opts.intra_op_num_threads = self.intra_op_threads
+        sess_opts.inter_op_num_threads = 1
+        return session_class(model_name, sess_opts)
+
+    def get_session(self):
+        """取得 session（第一次呼叫時載入模型）"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    start = time.perf_counter()
+                    self._session = self._create_session()
+                    self._load_seconds = time.perf_counter() - start
+        return self._session
+
+    def remove(self, image: Image.Image) -> Image.Image:
+        """使用共用 session 去背"""
+        session = self.get_session()
+        start = time.perf_counter()
+        result = remove(image, session=session)
+        self._last_seconds = time.perf_counter() - start
+        self._inferences += 1
+        REMBG_SECONDS.observe(self._last_seconds)
+        return result
+
+    def warm_up(self) -> float:
+        """
+        預熱模型：載入 session 並跑一次小圖推論
+
+        Returns:
+            預熱花費秒數
+        """
+        start = time.perf_counter()
+        self.remove(Image.fromarray(np.zeros((64, 64, 3), dtype=np.uint8)))
+        return time.perf_counter() - start
+
+    def stats(self) -> dict:
+        """模型載入與推論統計"""
+        return {
+            "model": self.model,
+            "loaded": self._session is not None,
+            "load_seconds": round(self._load_seconds, 3),
+            "inferences": self._inferences,
+            "last_inference_seconds": round(self._last_seconds, 3),
+        }
+
+
+# 全域 session 管理器
+REMBG_SESSIONS = RembgSessionManager()
+
+
+def rembg_remove(image: Image.Image) -> Image.Image:
+    """rembg 去背（共用 session，取代直接呼叫 rembg.remove）"""
+    return REMBG_SESSIONS.remove(image)
+
+
+def warm_up_rembg() -> float:
+    """預熱全域 rembg session"""
+    return REMBG_SESSIONS.warm_up()
@@ -0,0 +1,290 @@
+"""結果快取 - 以圖片內容 + 風格 + Prompt 為鍵，快取整條 Pipeline 的最終 PNG
+
+同一張頭像重複上傳、或換風格再跑一次時，AI 生成（10–40 秒、計費）可直接略過。
+- 鍵：解碼後像素的 SHA-256 + 風格 ID + Prompt 文字
+- 值：最終結果的 PNG bytes
+- 依位元組上限做 LRU 淘汰
+- 可替換後端：記憶體 / 本地目錄 / SQLite
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+
+from .artifact import artifact_for
+from .config import CACHE_CONFIG
+
+
+def hash_image_pixels(image: Image.Image) -> str:
+    """計算解碼後像素的 SHA-256（與檔案格式、EXIF、壓縮參數無關；記憶於 ImageArtifact）"""
+    return artifact_for(image).content_hash()
+
+
+def make_cache_key(image_hash: str, style_id: str, prompt_text: str = "") -> str:
+    """
+    建立結果快取鍵
+
+    Args:
+        image_hash: 上傳原始圖片的像素雜湊（hash_image_pixels）
+        style_id: 風格 ID（FINE_GRAINED_STYLES 的鍵）
+        prompt_text: 該風格使用的 Prompt 文字（Prompt 改版後自動失效）
+    """
+    h = hashlib.sha256()
+    h.update(image_hash.encode())
+    h.update(b"\0" + style_id.encode())
+    h.update(b"\0" + prompt_text.encode())
+    return h.hexdigest()
+
+
+# ============================================================
+# 後端
+# ============================================================
+
+class CacheBackend:
+    """快取後端基底類別：維護 LRU 索引與位元組上限，子類別只負責實際讀寫"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # key -> size（最舊在前）
+        self._total_bytes = 0
+
+    # 子類別實作
+    def _read(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def _write(self, key: str, data: bytes) -> None:
+        raise NotImplementedError
+
+    def _delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def _touch(self, key: str) -> None:
+        """更新存取時間（重啟後用於重建 LRU 順序）"""
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._index:
+                return None
+            data = self._read(key)
+            if data is None:
+                # 儲存層資料遺失，同步移除索引
+                self._total_bytes -= self._index.pop(key)
+                return None
+            self._index.move_to_end(key)
+            self._touch(key)
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        size = len(data)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._index:
+                self._total_bytes -= self._index.pop(key)
+            self._write(key, data)
+            self._index[key] = size
+            self._total_bytes += size
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes and self._index:
+            old_key, old_size = self._index.popitem(last=False)
+            self._delete(old_key)
+            self._total_bytes -= old_size
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._index):
+                self._delete(key)
+            self._index.clear()
+            self._total_bytes = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+class MemoryCacheBackend(CacheBackend):
+    """記憶體後端（進程重啟後清空）"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(max_bytes)
+        self._data = {}
+
+    def _read(self, key):
+        return self._data.get(key)
+
+    def _write(self, key, data):
+        self._data[key] = data
+
+    def _delete(self, key):
+        self._data.pop(key, None)
+
+
+class DiskCacheBackend(CacheBackend):
+    """本地目錄後端（每個鍵一個檔案，以 mtime 記錄存取順序）"""
+
+    def __init__(self, max_bytes: int, path: str, suffix: str = ".png"):
+        super().__init__(max_bytes)
+        self.root = Path(path)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.suffix = suffix
+
+        files = sorted(self.root.glob(f"*{suffix}"), key=lambda p: p.stat().st_mtime)
+        for file in files:
+            size = file.stat().st_size
+            self._index[file.stem] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}{self.suffix}"
+
+    def _read(self, key):
+        try:
+            return self._path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key, data):
+        tmp = self._path(key).with_suffix(".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, self._path(key))
+
+    def _delete(self, key):
+        self._path(key).unlink(missing_ok=True)
+
+    def _touch(self, key):
+        os.utime(self._path(key))
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """SQLite 後端（單一檔案，適合容器掛載的 volume）"""
+
+    def __init__(self, max_bytes: int, path: str):
+        super().__init__(max_bytes)
+        db_path = Path(path)
+        if db_path.suffix != ".db":
+            db_path = db_path / "results.db"
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+        for key, size in self._conn.execute("SELECT key, size FROM results ORDER BY accessed"):
+            self._index[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _read(self, key):
+        row = self._conn.execute("SELECT data FROM results WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _write(self, key, data):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO results (key, data, size, accessed) VALUES (?, ?, ?, ?)",
+            (key, data, len(data), time.time())
+        )
+        self._conn.commit()
+
+    def _delete(self, key):
+        self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+        self._conn.commit()
+
+    def _touch(self, key):
+        self._conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+
+
+def create_backend(backend: str, max_bytes: int, path: str, suffix: str = ".png") -> CacheBackend:
+    """依名稱建立後端（memory / disk / sqlite）"""
+    if backend == "memory":
+        return MemoryCacheBackend(max_bytes)
+    if backend == "disk":
+        return DiskCacheBackend(max_bytes, path, suffix)
+    if backend == "sqlite":
+        return SQLiteCacheBackend(max_bytes, path)
+    raise ValueError(f"不支援的快取後端：{backend}（可選：memory, disk, sqlite）")
+
+
+# ============================================================
+# 結果快取
+# ============================================================
+
+class ResultCache:
+    """最終結果快取（PNG bytes），並統計命中率"""
+
+    def __init__(self, backend: Optional[CacheBackend]):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def get(self, key: str) -> Optional[bytes]:
+        """查詢快取，回傳 PNG bytes 或 None"""
+        if not self.enabled:
+            return None
+        data = self.backend.get(key)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, image: Image.Image) -> bytes:
+        """寫入結果圖片，回傳寫入的 PNG bytes（與其他使用者共用同一份 PNG 編碼）"""
+        data = artifact_for(image).png()
+        if self.enabled:
+            self.backend.put(key, data)
+        return data
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "entries": len(self.backend) if self.enabled else 0,
+            "bytes": self.backend.total_bytes if self.enabled else 0,
+            "max_bytes": self.backend.max_bytes if self.enabled else 0,
+        }
+
+
+def _create_default_cache() -> ResultCache:
+    if CACHE_CONFIG.backend == "none":
+        return ResultCache(None)
+    backend = create_backend(CACHE_CONFIG.backend, CACHE_CONFIG.max_bytes, CACHE_CONFIG.path)
+    return ResultCache(backend)
+
+
+_RESULT_CACHE: Optional[ResultCache] = None
+_RESULT_CACHE_LOCK = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """取得全域結果快取（第一次使用時依 CACHE_CONFIG 建立）"""
+    global _RESULT_CACHE
+    if _RESULT_CACHE is None:
+        with _RESULT_CACHE_LOCK:
+            if _RESULT_CACHE is None:
+                _RESULT_CACHE = _create_default_cache()
+    return _RESULT_CACHE
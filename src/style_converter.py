@@ -14,14 +14,16 @@ import json
 import re
 import requests
 from PIL import Image, ImageDraw, ImageFilter
-from google import genai
 from google.genai import types
 from dotenv import load_dotenv
 import numpy as np
-from scipy import ndimage
 
 from .config import STYLE_CONFIG, API_CONFIG
-from .utils import retry_on_quota_error, prepare_image_for_api
+from .utils import prepare_image_for_api, encode_image_for_api
+from .gemini_pool import get_genai_client, generate_content
+from .image_ops import edge_background_mask, outline_mask
+from .metrics import step_run, style_run
+from .tracing import KIND_CLIENT, span
 from .prompts import get_style_prompt, ANALYZE_PROMPT
 
 
@@ -37,8 +39,8 @@ class StyleConverter:
             self.api_url = API_CONFIG.api_gateway_url  # 已經包含完整路徑
             self.client = None
         else:
-            # 直接使用 Gemini SDK
-            self.client = genai.Client(api_key=API_CONFIG.api_key)
+            # 直接使用 Gemini SDK（共用全進程客戶端，重用 HTTP 連線）
+            self.client = get_genai_client()
             self.api_key = None
             self.api_url = None
     
@@ -89,8 +91,9 @@ class StyleConverter:
         if openrouter_key:
             headers["Authorization"] = f"Bearer {openrouter_key}"
         
-        response = requests.post(self.api_url, json=payload, headers=headers, timeout=120)
-        response.raise_for_status()
+        with span("openrouter.request", KIND_CLIENT, **{"gemini.model": payload["model"]}):
+            response = requests.post(self.api_url, json=payload, headers=headers, timeout=120)
+            response.raise_for_status()
         
         # 調試：打印響應狀態和內容
         try:
@@ -103,7 +106,6 @@ class StyleConverter:
             print(f"⚠️ 請求 Headers: {headers}")
             raise ValueError(f"API 回應格式錯誤: {e}")
     
-    @retry_on_quota_error(max_retries=API_CONFIG.max_retries, base_delay=API_CONFIG.base_retry_delay)
     def analyze_image(self, image: Image.Image) -> dict:
         """
         合併檢測：同時分析圖片類型和身體範圍（單一 API 呼叫）
@@ -129,13 +131,15 @@ class StyleConverter:
                 result = response["choices"][0]["message"]["content"].strip().upper()
             else:
                 # 使用 Gemini SDK（Prompt 順序：圖片在前，符合最佳實踐）
-                _, img_bytes = prepare_image_for_api(image)
-                api_response = self.client.models.generate_content(
+                # 經過共用速率限制器；配額錯誤在這裡重試，不會被下方的例外處理吞掉
+                with span("gemini.build_request"):
+                    img_bytes, mime_type = encode_image_for_api(image, "analysis")
+                api_response = generate_content(
                     model=API_CONFIG.model_text,
                     contents=[
                         types.Part.from_bytes(
                             data=img_bytes,
-                            mime_type="image/png"
+                            mime_type=mime_type
                         ),
                         prompt  # Prompt 在圖片後面
                     ],
@@ -143,7 +147,8 @@ class StyleConverter:
                         response_modalities=['TEXT']
                     )
                 )
-                result = api_response.candidates[0].content.parts[0].text.strip().upper()
+                with span("gemini.parse_response"):
+                    result = api_response.candidates[0].content.parts[0].text.strip().upper()
             
             # 解析回應
             image_type = "photo"
@@ -272,8 +277,9 @@ class StyleConverter:
                 raise
         else:
             # 使用 Gemini SDK
-            _, img_bytes = prepare_image_for_api(image)
-            api_response = self.client.models.generate_content(
+            with span("gemini.build_request"):
+                _, img_bytes = prepare_image_for_api(image)
+            api_response = generate_content(
                 model=API_CONFIG.model_image,
                 contents=[
                     prompt,
@@ -288,11 +294,13 @@ class StyleConverter:
             )
             
             # 從回應中提取圖片
-            for part in api_response.candidates[0].content.parts:
-                if part.inline_data is not None:
-                    image_data = part.inline_data.data
-                    result_image = Image.open(io.BytesIO(image_data))
-                    return result_image
+            with span("gemini.parse_response"):
+                for part in api_response.candidates[0].content.parts:
+                    if part.inline_data is not None:
+                        image_data = part.inline_data.data
+                        result_image = Image.open(io.BytesIO(image_data))
+                        result_image.load()
+                        return result_image
             
             raise ValueError("Gemini API 未返回圖片")
     
@@ -304,58 +312,23 @@ class StyleConverter:
             image = image.convert("RGBA")
         
         data = np.array(image)
-        height, width = data.shape[0], data.shape[1]
-        
-        # 找出接近純白色的像素（降低閾值以捕捉更多白色）
-        white_mask = (data[:, :, 0] > threshold) & \
-                     (data[:, :, 1] > threshold) & \
-                     (data[:, :, 2] > threshold)
-        
-        # 使用連通區域標記
-        labeled, num_features = ndimage.label(white_mask)
-        
-        # 找出與邊緣接觸的標籤
-        edge_labels = set()
-        edge_labels.update(labeled[0, :])
-        edge_labels.update(labeled[-1, :])
-        edge_labels.update(labeled[:, 0])
-        edge_labels.update(labeled[:, -1])
-        edge_labels.discard(0)
-        
-        # 找出非白色區域（人物區域），提高閾值保護亮部衣物
-        person_mask = (data[:, :, 0] < 245) | (data[:, :, 1] < 245) | (data[:, :, 2] < 245)
-        
-        # 對人物遮罩進行膨脹，創建保護區域
-        if np.any(person_mask):
-            person_mask_expanded = ndimage.binary_dilation(person_mask, structure=np.ones((20, 20)))
-        else:
-            person_mask_expanded = np.zeros((height, width), dtype=bool)
         
-        # 處理每個與邊緣相連的白色區域
-        bg_mask = np.zeros((height, width), dtype=bool)
-        for label in edge_labels:
-            region_mask = (labeled == label)
-            
-            # 檢查這個區域是否主要在保護區域外
-            overlap = np.sum(region_mask & person_mask_expanded)
-            total = np.sum(region_mask)
-            
-            # 如果重疊小於30%，視為背景
-            if total > 0 and overlap / total < 0.3:
-                bg_mask = bg_mask | region_mask
+        # 與邊緣相連、且不在人物保護區內的白色區域（單次 bincount 計算，不逐一標籤迴圈）
+        bg_mask = edge_background_mask(data, threshold=threshold)
         
         # 將背景設為透明
         data[bg_mask, 3] = 0
         
         return Image.fromarray(data, "RGBA")
     
-    def add_white_outline(self, image: Image.Image, outline_width: int = 8) -> Image.Image:
+    def add_white_outline(self, image: Image.Image, outline_width: int = 8, rounded: bool = False) -> Image.Image:
         """
         為圖片添加白色粗線描邊
         
         Args:
             image: 輸入圖片（RGBA 模式）
-            outline_width: 描邊寬度（像素）
+            outline_width: 描邊寬度（像素），距離轉換計算，30–50px 也不會變慢
+            rounded: 圓角描邊（預設 False：與舊版相同的方角效果）
             
         Returns:
             添加描邊後的圖片
@@ -363,9 +336,6 @@ class StyleConverter:
         if image.mode != "RGBA":
             image = image.convert("RGBA")
         
-        # 獲取 alpha 通道
-        alpha = image.split()[3]
-        
         # 創建一個更大的畫布來容納描邊
         width, height = image.size
         new_width = width + outline_width * 2
@@ -377,26 +347,12 @@ class StyleConverter:
         # 將原圖貼到中心位置
         result.paste(image, (outline_width, outline_width), image)
         
-        # 獲取結果的 alpha 通道
-        result_alpha = result.split()[3]
-        
-        # 對 alpha 通道進行膨脹來創建描邊
-        alpha_array = np.array(result_alpha)
-        
-        # 使用多次膨脹來創建粗線描邊
-        for _ in range(outline_width):
-            alpha_array = ndimage.binary_dilation(alpha_array, structure=np.ones((3, 3)))
-        
-        # 創建描邊遮罩（膨脹後的區域減去原始區域）
-        original_alpha = np.array(result.split()[3])
-        outline_mask = alpha_array & (~original_alpha.astype(bool))
+        # 以距離轉換計算描邊遮罩（膨脹後的區域減去原始區域）
+        result_array = np.array(result)
+        mask = outline_mask(result_array[:, :, 3], outline_width, rounded=rounded)
         
         # 創建白色描邊
-        result_array = np.array(result)
-        result_array[outline_mask, 0] = 255  # R
-        result_array[outline_mask, 1] = 255  # G
-        result_array[outline_mask, 2] = 255  # B
-        result_array[outline_mask, 3] = 255  # A
+        result_array[mask] = (255, 255, 255, 255)
         
         return Image.fromarray(result_array, "RGBA")
     
@@ -610,40 +566,40 @@ class StyleConverter:
             - 透明背景
             - 身體生成機制：如果只有脖子，生成到胸部；如果全身，只生成到胸部
         """
-        # 使用合併的 API 呼叫同時檢測圖片類型和身體範圍（節省 33% API 配額）
-        analysis = self.analyze_image(image)
-        image_type = analysis["image_type"]
-        body_extent = analysis["body_extent"]
-        
-        print(f"📊 圖片分析結果: 類型={image_type}, 身體範圍={body_extent}")
-        
-        if image_type == "illustration":
-            # 如果是插畫/向量圖，也進行 AI 生成轉換（所有圖片都轉換，包括選擇性橘色高光）
-            result = self.convert_to_cartoon_illustration(image, body_extent="head_chest")
+        with style_run("style_converter"):
+            # 使用合併的 API 呼叫同時檢測圖片類型和身體範圍（節省 33% API 配額）
+            with step_run("analyze_image"):
+                analysis = self.analyze_image(image)
+            image_type = analysis["image_type"]
+            body_extent = analysis["body_extent"]
             
-            # 處理透明背景（插畫/向量圖也需要處理）
-            if transparent_bg:
-                result = self.make_white_transparent(result)
-        else:
-            # 如果是真人照片，根據身體部位範圍進行處理
-            # 轉換為向量插畫風格（AI 會根據 body_extent 自動處理身體生成和裁剪到胸部以上，包括選擇性橘色高光）
-            result = self.convert_to_cartoon_illustration(image, body_extent=body_extent)
+            print(f"📊 圖片分析結果: 類型={image_type}, 身體範圍={body_extent}")
+            
+            # 插畫/向量圖也進行 AI 生成轉換（固定生成到胸部）；真人照片根據身體部位範圍處理
+            # （AI 會根據 body_extent 自動處理身體生成和裁剪到胸部以上，包括選擇性橘色高光）
+            if image_type == "illustration":
+                body_extent = "head_chest"
+            with step_run("convert_to_cartoon_illustration"):
+                result = self.convert_to_cartoon_illustration(image, body_extent=body_extent)
             
             # 處理透明背景
             if transparent_bg:
-                result = self.make_white_transparent(result)
-        
-        # 統一尺寸和位置（增加同質性）
-        if normalize_size:
-            result = self.normalize_size_and_position(result, target_size=target_size)
-            # 使用統一的輸出尺寸
-            if output_size is None:
-                output_size = target_size
-        
-        # 不添加白色描邊
-        # 對於真人照片，進行水平底部裁切
-        if image_type == "photo" and normalize_size:
-            result = self.crop_horizontal_bottom(result)
-        
-        return result
+                with step_run("make_white_transparent"):
+                    result = self.make_white_transparent(result)
+            
+            # 統一尺寸和位置（增加同質性）
+            if normalize_size:
+                with step_run("normalize_size_and_position"):
+                    result = self.normalize_size_and_position(result, target_size=target_size)
+                # 使用統一的輸出尺寸
+                if output_size is None:
+                    output_size = target_size
+            
+            # 不添加白色描邊
+            # 對於真人照片，進行水平底部裁切
+            if image_type == "photo" and normalize_size:
+                with step_run("crop_horizontal_bottom"):
+                    result = self.crop_horizontal_bottom(result)
+            
+            return result
 
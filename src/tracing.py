@@ -0,0 +1,381 @@
+"""請求追蹤 - 與 OpenTelemetry 相容的 span，輸出為 OTLP/JSON（不依賴 opentelemetry-sdk）
+
+- 每個 websocket session 一個根 span；背景工作以 traceparent（W3C 格式）接在 session 之下
+- 風格、步驟 span 由 metrics.style_run / step_run 建立，與指標共用同一組量測點
+- 內層 span：圖片解碼（image.decode）、編碼（image.encode）、API 請求組裝（gemini.build_request）、
+  網路呼叫（gemini.generate_content）、回應解析（gemini.parse_response）
+
+目前 span 存在 contextvar 中，asyncio task 與 run_cpu 的執行緒都會帶著走。
+結束的 span 由背景執行緒批次輸出：file（JSON Lines，每行一個 ExportTraceServiceRequest，
+collector 的 otlpjsonfile receiver 可直接讀取，依大小輪替）或 otlp（POST 到 OTLP/HTTP JSON 端點）；
+預設停用（TRACE_EXPORTER=none）。
+"""
+
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from .config import TRACE_CONFIG
+
+# OTLP SpanKind
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+# OTLP StatusCode
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# 一次輸出的 span 數上限
+MAX_BATCH = 512
+
+
+def _attribute_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _attributes(attributes: Dict[str, Any]) -> List[dict]:
+    return [{"key": key, "value": _attribute_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class Span:
+    """一個已開始的 span"""
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str] = None,
+        kind: int = KIND_INTERNAL,
+        attributes: Dict[str, Any] = None
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.events: List[dict] = []
+        self.status_code = STATUS_UNSET
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    @property
+    def traceparent(self) -> str:
+        """W3C traceparent（跨 task / 工作傳遞上層 span）"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def record_error(self, error: BaseException) -> None:
+        self.status_code = STATUS_ERROR
+        self.status_message = str(error) or type(error).__name__
+        self.events.append({
+            "name": "exception",
+            "timeUnixNano": str(time.time_ns()),
+            "attributes": _attributes({
+                "exception.type": type(error).__name__,
+                "exception.message": str(error),
+            }),
+        })
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    @property
+    def duration(self) -> float:
+        """秒（尚未結束時為目前經過時間）"""
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": _attributes(self.attributes),
+            "status": {"code": self.status_code},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.events:
+            span["events"] = self.events
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+class _NoopSpan:
+    """停用追蹤時的 span（所有操作皆無作用）"""
+    traceparent = None
+    duration = 0.0
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, **attributes: Any) -> None:
+        pass
+
+    def record_error(self, error: BaseException) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[tuple]:
+    """解析 W3C traceparent，回傳 (trace_id, span_id)；格式錯誤回傳 None"""
+    if not value:
+        return None
+    parts = value.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2]
+
+
+# ============================================================
+# 輸出
+# ============================================================
+
+class FileSpanExporter:
+    """OTLP/JSON Lines 檔案（每批一行）；超過 max_bytes 時輪替為 .1、.2……，保留 backups 份"""
+
+    def __init__(self, path: str, max_bytes: int = 0, backups: int = 0):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+    def export(self, request: dict) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        line = json.dumps(request, ensure_ascii=False) + "\n"
+        if self.max_bytes > 0 and self.path.exists() and self.path.stat().st_size + len(line) > self.max_bytes:
+            self._rotate()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def _rotate(self) -> None:
+        """traces.jsonl → .1 → .2 ……，超過 backups 份的最舊檔案刪除（backups=0 時直接清空）"""
+        if self.backups <= 0:
+            self.path.unlink(missing_ok=True)
+            return
+        self.path.with_name(f"{self.path.name}.{self.backups}").unlink(missing_ok=True)
+        for i in range(self.backups - 1, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{i}")
+            if older.exists():
+                older.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+        self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+
+
+class OtlpHttpSpanExporter:
+    """OTLP/HTTP（JSON 編碼）端點，例如本機 collector 的 :4318/v1/traces"""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def export(self, request: dict) -> None:
+        import requests
+        response = requests.post(self.endpoint, json=request, timeout=self.timeout)
+        response.raise_for_status()
+
+
+def _create_exporter():
+    if TRACE_CONFIG.exporter == "file":
+        return FileSpanExporter(TRACE_CONFIG.file, TRACE_CONFIG.file_max_bytes, TRACE_CONFIG.file_backups)
+    if TRACE_CONFIG.exporter == "otlp":
+        return OtlpHttpSpanExporter(TRACE_CONFIG.otlp_endpoint)
+    if TRACE_CONFIG.exporter == "none":
+        return None
+    raise ValueError(f"未知的 TRACE_EXPORTER：{TRACE_CONFIG.exporter}")
+
+
+class Tracer:
+    """收集結束的 span，由背景執行緒批次輸出"""
+
+    def __init__(self, exporter=None, service_name: str = None, flush_interval: float = None):
+        self.exporter = exporter
+        self.service_name = service_name or TRACE_CONFIG.service_name
+        self.flush_interval = flush_interval if flush_interval is not None else TRACE_CONFIG.flush_interval
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.exported = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def submit(self, span: Span) -> None:
+        if not self.enabled:
+            return
+        self._ensure_thread()
+        self._queue.put(span)
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """輸出所有已結束的 span（等待至多 timeout 秒）"""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._worker, name="trace-exporter", daemon=True)
+                    self._thread.start()
+                    # 行程結束前送出剩餘的 span（CLI / 批次處理）
+                    atexit.register(self.flush)
+
+    def _worker(self) -> None:
+        batch: List[Span] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if isinstance(item, Span):
+                batch.append(item)
+                if len(batch) < MAX_BATCH:
+                    continue
+            if batch:
+                self._export(batch)
+                batch = []
+            if isinstance(item, threading.Event):
+                item.set()
+            deadline = time.monotonic() + self.flush_interval
+
+    def _export(self, spans: List[Span]) -> None:
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": _attributes({"service.name": self.service_name})},
+                "scopeSpans": [{
+                    "scope": {"name": __name__},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+        try:
+            self.exporter.export(request)
+            self.exported += len(spans)
+        except Exception as e:
+            self.failed += len(spans)
+            print(f"⚠️ 追蹤輸出失敗（{len(spans)} 個 span）：{e}")
+
+    def stats(self) -> dict:
+        return {
+            "exporter": TRACE_CONFIG.exporter if self.enabled else "none",
+            "pending": self._queue.qsize(),
+            "exported": self.exported,
+            "failed": self.failed,
+        }
+
+
+# 全域 tracer
+TRACER = Tracer(_create_exporter())
+
+
+# ============================================================
+# 建立 span
+# ============================================================
+
+_CURRENT: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("trace_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _CURRENT.get()
+
+
+def current_traceparent() -> Optional[str]:
+    """目前 span 的 traceparent（沒有 span 或停用時為 None）"""
+    span = _CURRENT.get()
+    return span.traceparent if span is not None else None
+
+
+@contextmanager
+def span(name: str, kind: int = KIND_INTERNAL, parent: Optional[str] = None, **attributes: Any):
+    """
+    開始一個 span（結束時送出）
+
+    Args:
+        name: span 名稱
+        kind: KIND_INTERNAL / KIND_SERVER / KIND_CLIENT
+        parent: 上層 span 的 traceparent（None 使用目前 span；都沒有時開始新的 trace）
+        attributes: span 屬性
+
+    Yields:
+        Span（停用追蹤時為無作用的 span）
+    """
+    if not TRACER.enabled:
+        yield _NOOP_SPAN
+        return
+
+    remote = parse_traceparent(parent)
+    current = _CURRENT.get()
+    if remote is not None:
+        trace_id, parent_id = remote
+    elif current is not None:
+        trace_id, parent_id = current.trace_id, current.span_id
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+
+    new_span = Span(name, trace_id, parent_id, kind, attributes)
+    token = _CURRENT.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.record_error(e)
+        raise
+    finally:
+        _CURRENT.reset(token)
+        new_span.end()
+        TRACER.submit(new_span)
+
+
+def traced(name: str, kind: int = KIND_INTERNAL, **attributes: Any) -> Callable:
+    """以 span 包住函式（同步或 async）"""
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, kind, **attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, kind, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
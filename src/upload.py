@@ -0,0 +1,115 @@
+"""上傳處理 - 有界記憶體的串流接收與提早縮小解碼
+
+websocket 上傳改為「JSON 檔頭 + 多個二進位 frame」：
+- 分塊寫入 SpooledTemporaryFile（小檔留在記憶體，大檔落地），不再同時持有
+  JSON 文字、base64 文字、原始 bytes 三份副本
+- 解碼前依檔頭檢查像素數上限
+- JPEG 以 draft() 在 DCT 階段直接縮小，其他格式以 reduce() 整數倍縮小，
+  最長邊不超過 UPLOAD_CONFIG.max_side（AI 只輸出 1K）
+"""
+
+import base64
+import binascii
+import io
+import tempfile
+from typing import BinaryIO
+
+from PIL import Image
+
+from .config import UPLOAD_CONFIG
+from .tracing import traced
+
+
+class UploadError(ValueError):
+    """上傳內容不符限制"""
+
+
+class UploadBuffer:
+    """分塊接收上傳內容（超過 spool_bytes 自動改用暫存檔）"""
+
+    def __init__(self, expected_size: int = None):
+        if expected_size is not None and expected_size > UPLOAD_CONFIG.max_bytes:
+            raise UploadError(f"檔案過大：{expected_size / 1024 / 1024:.1f}MB（上限 {UPLOAD_CONFIG.max_bytes // 1024 // 1024}MB）")
+        self.expected_size = expected_size
+        self.received = 0
+        self._file = tempfile.SpooledTemporaryFile(max_size=UPLOAD_CONFIG.spool_bytes)
+
+    @property
+    def complete(self) -> bool:
+        return self.expected_size is not None and self.received >= self.expected_size
+
+    def write(self, chunk: bytes) -> None:
+        self.received += len(chunk)
+        if self.received > UPLOAD_CONFIG.max_bytes:
+            raise UploadError(f"檔案過大（上限 {UPLOAD_CONFIG.max_bytes // 1024 // 1024}MB）")
+        self._file.write(chunk)
+
+    def open(self) -> BinaryIO:
+        """回到開頭，供解碼使用"""
+        self._file.seek(0)
+        return self._file
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def read_data_url(data_url: str) -> BinaryIO:
+    """
+    解析舊格式的 data URL（"data:image/png;base64,..."），解碼前先檢查大小上限
+
+    Raises:
+        UploadError: 格式錯誤或超過 UPLOAD_CONFIG.max_bytes
+    """
+    if not isinstance(data_url, str) or "," not in data_url:
+        raise UploadError("圖片格式錯誤：需要 data URL")
+    encoded = data_url.split(",", 1)[1]
+    # base64 每 4 個字元解碼為 3 個位元組
+    if len(encoded) * 3 // 4 > UPLOAD_CONFIG.max_bytes:
+        raise UploadError(f"檔案過大（上限 {UPLOAD_CONFIG.max_bytes // 1024 // 1024}MB）")
+    try:
+        return io.BytesIO(base64.b64decode(encoded, validate=True))
+    except (binascii.Error, ValueError) as e:
+        raise UploadError(f"圖片格式錯誤：base64 無法解碼（{e}）")
+
+
+@traced("image.decode")
+def decode_upload(fileobj: BinaryIO, max_side: int = None) -> Image.Image:
+    """
+    解碼上傳圖片（檢查像素上限，必要時提早縮小）
+
+    Args:
+        fileobj: 圖片檔案物件
+        max_side: 解碼後最長邊，None 使用 UPLOAD_CONFIG.max_side
+
+    Returns:
+        已載入的 PIL Image
+    """
+    max_side = max_side or UPLOAD_CONFIG.max_side
+
+    try:
+        image = Image.open(fileobj)
+    except Exception as e:
+        raise UploadError(f"無法辨識的圖片格式：{e}")
+
+    # 只讀了檔頭，尚未解碼像素
+    if image.width * image.height > UPLOAD_CONFIG.max_pixels:
+        raise UploadError(
+            f"圖片像素過多：{image.width}x{image.height}（上限 {UPLOAD_CONFIG.max_pixels:,} 像素）"
+        )
+
+    longest = max(image.size)
+    if longest > max_side:
+        if image.format == "JPEG":
+            # DCT 階段縮小（1/2、1/4、1/8），結果不小於要求尺寸
+            image.draft(image.mode, (image.width * max_side // longest, image.height * max_side // longest))
+        image.load()
+
+        factor = max(image.size) // max_side
+        if factor >= 2:
+            image = image.reduce(factor)
+        if max(image.size) > max_side:
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    else:
+        image.load()
+
+    return image
@@ -1,41 +1,33 @@
 """工具函數 - 共用的輔助函數"""
 
 import io
-import time
-from functools import wraps
-from typing import Callable, TypeVar, Any
+import warnings
+from dataclasses import dataclass
+from typing import Callable, Tuple
 from PIL import Image
 
-T = TypeVar('T')
 
-
-def retry_on_quota_error(max_retries: int = 3, base_delay: int = 60) -> Callable:
+def retry_on_quota_error(max_retries: int = 3, base_delay: int = None, model: str = None) -> Callable:
     """
-    API 配額錯誤自動重試裝飾器
+    API 配額錯誤自動重試裝飾器（相容舊介面）
+    
+    改由共用速率限制器處理：遇到 429 時依 Retry-After 或加抖動的指數退避，
+    同一模型的所有呼叫一起暫停，不再讓單一執行緒睡 60 秒以上。
     
     Args:
-        max_retries: 最大重試次數
-        base_delay: 基礎等待秒數（使用指數退避）
+        max_retries: 最大嘗試次數（含第一次，與舊版相同；即最多重試 max_retries - 1 次）
+        base_delay: 已棄用，傳入時發出 DeprecationWarning 並忽略（退避時間見 RateLimitConfig）
+        model: 使用哪個模型的配額（預設 API_CONFIG.model_text）
     """
-    def decorator(func: Callable[..., T]) -> Callable[..., T]:
-        @wraps(func)
-        def wrapper(*args: Any, **kwargs: Any) -> T:
-            last_exception = None
-            for attempt in range(max_retries):
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    error_str = str(e)
-                    if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str:
-                        wait_time = base_delay * (2 ** attempt)
-                        print(f"⏳ API 配額限制 (嘗試 {attempt + 1}/{max_retries})，等待 {wait_time} 秒後重試...")
-                        time.sleep(wait_time)
-                        last_exception = e
-                    else:
-                        raise
-            raise Exception(f"API 呼叫失敗，已達最大重試次數 ({max_retries}): {last_exception}")
-        return wrapper
-    return decorator
+    from .config import API_CONFIG
+    from .rate_limiter import rate_limited
+    if base_delay is not None:
+        warnings.warn(
+            "retry_on_quota_error 的 base_delay 已棄用且不再生效，退避時間改由 GEMINI_BACKOFF_BASE / GEMINI_BACKOFF_MAX 設定",
+            DeprecationWarning,
+            stacklevel=2
+        )
+    return rate_limited(model or API_CONFIG.model_text, max(0, max_retries - 1))
 
 
 def prepare_image_for_api(image: Image.Image) -> tuple[Image.Image, bytes]:
@@ -49,13 +41,8 @@ def prepare_image_for_api(image: Image.Image) -> tuple[Image.Image, bytes]:
         (RGB 模式的圖片, PNG 格式的 bytes)
     """
     # 轉換為 RGB 模式
-    if image.mode == "RGBA":
-        background = Image.new("RGB", image.size, (255, 255, 255))
-        background.paste(image, mask=image.split()[3])
-        rgb_image = background
-    elif image.mode != "RGB":
-        rgb_image = image.convert("RGB")
-    else:
+    rgb_image = flatten_to_rgb(image)
+    if rgb_image is image:
         rgb_image = image.copy()
     
     # 轉換為 bytes
@@ -64,3 +51,76 @@ def prepare_image_for_api(image: Image.Image) -> tuple[Image.Image, bytes]:
     img_bytes = img_byte_arr.getvalue()
     
     return rgb_image, img_bytes
+
+
+def flatten_to_rgb(image: Image.Image) -> Image.Image:
+    """轉為 RGB（透明部分以白底合成）；已是 RGB 時回傳原圖"""
+    if image.mode == "RGBA":
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[3])
+        return background
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
+
+
+# ============================================================
+# 送往 API 的圖片編碼（依呼叫類型的解析度策略，並快取結果）
+# ============================================================
+
+MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+@dataclass(frozen=True)
+class ApiImagePolicy:
+    """圖片送往 API 前的處理方式"""
+    max_side: int
+    format: str
+    quality: int
+
+
+def api_image_policy(purpose: str) -> ApiImagePolicy:
+    """
+    呼叫類型對應的解析度與編碼
+
+    Args:
+        purpose: "analysis"（分類呼叫）或 "generation"（生成呼叫的輸入）
+    """
+    from .config import API_IMAGE_CONFIG
+    if purpose == "analysis":
+        return ApiImagePolicy(
+            API_IMAGE_CONFIG.analysis_max_side, API_IMAGE_CONFIG.analysis_format, API_IMAGE_CONFIG.analysis_quality
+        )
+    if purpose == "generation":
+        return ApiImagePolicy(
+            API_IMAGE_CONFIG.generation_max_side, API_IMAGE_CONFIG.generation_format, API_IMAGE_CONFIG.generation_quality
+        )
+    raise ValueError(f"不支援的呼叫類型：{purpose}（可選：analysis, generation）")
+
+
+def encode_with_policy(image: Image.Image, policy: ApiImagePolicy) -> Tuple[bytes, str]:
+    """依策略縮小並編碼（不快取，請改用 encode_image_for_api）"""
+    # JPEG 不支援透明：以白底合成（與 prepare_image_for_api 相同）；PNG / WEBP 保留原模式
+    if policy.format == "JPEG" or image.mode not in ("RGB", "RGBA"):
+        image = flatten_to_rgb(image)
+    if max(image.size) > policy.max_side:
+        image = image.copy()
+        image.thumbnail((policy.max_side, policy.max_side), Image.Resampling.LANCZOS)
+
+    buffered = io.BytesIO()
+    if policy.format == "PNG":
+        image.save(buffered, format="PNG")
+    else:
+        image.save(buffered, format=policy.format, quality=policy.quality)
+    return buffered.getvalue(), MIME_TYPES[policy.format]
+
+
+def encode_image_for_api(image: Image.Image, purpose: str = "analysis") -> Tuple[bytes, str]:
+    """
+    依呼叫類型編碼圖片（記憶於圖片的 ImageArtifact，同一張圖、同一策略只編碼一次）
+
+    Returns:
+        (編碼後的 bytes, MIME type)
+    """
+    from .artifact import artifact_for
+    return artifact_for(image).api_payload(purpose)
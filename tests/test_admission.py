@@ -0,0 +1,108 @@
+"""准入控制：全域與每風格上限、多風格工作、等待名額與卸載；JobManager 依名額排隊"""
+
+import asyncio
+
+import pytest
+from PIL import Image
+
+from src.admission import AdmissionController, OverCapacityError
+
+
+def _controller(**kwargs) -> AdmissionController:
+    kwargs.setdefault("max_active", 2)
+    kwargs.setdefault("style_limits", {"i4_detailed": 1})
+    kwargs.setdefault("max_queue", 3)
+    kwargs.setdefault("max_rss_mb", 0)
+    return AdmissionController(**kwargs)
+
+
+def test_global_and_style_limits():
+    admission = _controller()
+
+    assert admission.try_acquire("i4_detailed")
+    assert not admission.try_acquire("i4_detailed")
+    assert admission.try_acquire("universal_intelligent")
+    assert not admission.try_acquire("universal_intelligent")
+
+    admission.release("i4_detailed")
+    assert admission.active == 1
+    assert admission.try_acquire("i4_detailed")
+
+
+def test_multi_style_job_takes_one_global_slot_and_every_style_slot():
+    admission = _controller()
+
+    assert admission.try_acquire("i4_detailed", "i4_detailed_white")
+    assert admission.active == 1
+    assert admission.stats()["active"] == {"i4_detailed": 1, "i4_detailed_white": 1}
+    assert not admission.try_acquire("i4_detailed")
+    assert admission.try_acquire("i4_detailed_white")
+
+    admission.release("i4_detailed", "i4_detailed_white")
+    assert admission.stats()["active"] == {"i4_detailed_white": 1}
+
+
+def test_check_capacity_counts_waiters():
+    admission = _controller(max_active=1)
+
+    async def scenario():
+        admission.try_acquire("a")
+        waiters = [asyncio.create_task(admission.acquire("b", interval=0.01)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert admission.waiting == 2
+        with pytest.raises(OverCapacityError):
+            admission.check_capacity(queue_depth=1)
+        admission.check_capacity(queue_depth=0)
+
+        admission.release("a")
+        done, pending = await asyncio.wait(waiters, timeout=1, return_when=asyncio.FIRST_COMPLETED)
+        assert len(done) == 1 and len(pending) == 1
+        admission.release("b")
+        await asyncio.wait_for(pending.pop(), 1)
+        assert admission.waiting == 0
+        assert admission.stats()["rejected"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_memory_threshold_blocks_admission():
+    admission = _controller(max_rss_mb=0.001)
+
+    assert not admission.try_acquire("a")
+    with pytest.raises(OverCapacityError):
+        admission.check_capacity()
+
+
+def test_job_manager_queues_beyond_style_limit(tmp_path, monkeypatch):
+    from src.jobs import QUEUED, JobManager
+
+    admission = _controller(max_active=4, style_limits={"slow": 1}, max_queue=10)
+    manager = JobManager(str(tmp_path), admission)
+    started = []
+    gate = asyncio.Event()
+
+    async def fake_run(job_id):
+        started.append(job_id)
+        await gate.wait()
+
+    monkeypatch.setattr(manager, "_run", fake_run)
+    image = Image.new("RGB", (4, 4))
+
+    async def scenario():
+        first = await manager.submit(image, "slow")
+        second = await manager.submit(image, "slow")
+        other = await manager.submit(image, "fast")
+        await asyncio.sleep(0.05)
+        assert started == [first, other]
+        job = await manager.get(second)
+        assert job["status"] == QUEUED and job["position"] == 1
+
+        gate.set()
+        for _ in range(100):
+            if len(started) == 3:
+                break
+            await asyncio.sleep(0.01)
+        assert started == [first, other, second]
+        await manager.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,67 @@
+"""圖片產物：同一張圖共用同一個 ImageArtifact、編碼只計算一次；登錄表不讓圖片存活"""
+
+import gc
+import weakref
+
+import pytest
+from PIL import Image
+
+from src import artifact as artifact_module
+from src.artifact import artifact_for
+
+
+def _image(color=(200, 10, 10)) -> Image.Image:
+    return Image.new("RGB", (8, 6), color)
+
+
+def test_same_image_returns_same_artifact():
+    image = _image()
+
+    assert artifact_for(image) is artifact_for(image)
+    assert artifact_for(image) is not artifact_for(image.copy())
+
+
+def test_encodings_are_memoized():
+    image = _image()
+    artifact = artifact_for(image)
+
+    assert artifact.png() is artifact.png()
+    assert artifact.jpeg(80) is artifact.jpeg(80)
+    assert artifact.jpeg(80) is not artifact.jpeg(90)
+    assert artifact.content_hash() == artifact_for(image.copy()).content_hash()
+
+
+def test_registry_entry_dropped_when_image_is_collected():
+    image = _image()
+    artifact = artifact_for(image)
+    artifact.png()
+    key = id(image)
+    image_ref = weakref.ref(image)
+    artifact_ref = weakref.ref(artifact)
+    assert artifact_module._ARTIFACTS[key] is artifact
+
+    del image, artifact
+    gc.collect()
+
+    assert image_ref() is None
+    assert artifact_ref() is None
+    assert artifact_module._ARTIFACTS.get(key) is None
+
+
+def test_artifact_does_not_keep_image_alive():
+    image = _image()
+    artifact = artifact_for(image)
+
+    del image
+    gc.collect()
+
+    with pytest.raises(ReferenceError):
+        artifact.png()
+
+
+def test_reused_id_gets_a_fresh_artifact():
+    image = _image()
+    stale = artifact_for(image)
+    stale._image_ref = weakref.ref(_image((1, 2, 3)))  # 模擬 id 被回收後重用
+
+    assert artifact_for(image) is not stale
@@ -0,0 +1,108 @@
+"""批次處理：項目列舉、輸出檔名、路徑限制與進度日誌"""
+
+import asyncio
+
+import pytest
+from PIL import Image
+
+from src.batch import BatchJournal, collect_items
+
+
+def _touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"")
+    return path
+
+
+def test_same_stem_different_suffix_do_not_collide(tmp_path):
+    _touch(tmp_path / "in" / "a.jpg")
+    _touch(tmp_path / "in" / "a.png")
+
+    items = collect_items(str(tmp_path / "in"), str(tmp_path / "out"), "i4_detailed")
+
+    assert [item.output.name for item in items] == ["a_jpg_i4_detailed.png", "a_png_i4_detailed.png"]
+
+
+def test_manifest_same_name_in_different_folders_get_an_index(tmp_path):
+    _touch(tmp_path / "x" / "a.jpg")
+    _touch(tmp_path / "y" / "a.jpg")
+    manifest = tmp_path / "team.txt"
+    manifest.write_text("x/a.jpg\ny/a.jpg\n", encoding="utf-8")
+
+    items = collect_items(str(manifest), str(tmp_path / "out"), "s")
+
+    assert [item.output.name for item in items] == ["a_jpg_s.png", "a_jpg_s_2.png"]
+
+
+def test_root_rejects_paths_outside(tmp_path):
+    root = tmp_path / "root"
+    _touch(root / "in" / "a.jpg")
+    manifest = _touch(root / "list.txt")
+    manifest.write_text("../../etc/passwd\n", encoding="utf-8")
+
+    assert len(collect_items("in", "out", "s", root)) == 1
+    with pytest.raises(PermissionError):
+        collect_items("../", "out", "s", root)
+    with pytest.raises(PermissionError):
+        collect_items("list.txt", "out", "s", root)
+
+
+def test_journal_keeps_last_record_and_ignores_torn_line(tmp_path):
+    journal = BatchJournal(tmp_path / "journal.jsonl")
+    journal.append({"key": "a", "status": "failed"})
+    journal.append({"key": "a", "status": "done"})
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"key": "b", "sta')
+
+    assert journal.load() == {"a": {"key": "a", "status": "done"}}
+
+
+def _batch_job(tmp_path, monkeypatch, component, admission=None):
+    from src.batch import BatchJob
+    from src.pipeline.style_configs_fine_grained import FINE_GRAINED_STYLES
+
+    monkeypatch.setitem(FINE_GRAINED_STYLES, "batch_test", {
+        "name": "測試", "steps": [{"name": "test", "component": component, "update_image": True}]
+    })
+    (tmp_path / "in").mkdir()
+    Image.new("RGB", (8, 8), (1, 2, 3)).save(tmp_path / "in" / "a.png")
+    return BatchJob(str(tmp_path / "in"), str(tmp_path / "out"), "batch_test", workers=2, admission=admission)
+
+
+def test_batch_items_go_through_admission(tmp_path, monkeypatch):
+    from src.admission import AdmissionController
+
+    admission = AdmissionController(max_active=1, style_limits={}, max_queue=10, max_rss_mb=0)
+    seen = []
+
+    def component(image, context):
+        seen.append(admission.stats()["active"])
+        return image.convert("L")
+
+    job = _batch_job(tmp_path, monkeypatch, component, admission)
+    summary = asyncio.run(job.run())
+
+    assert summary["completed"] == 1
+    assert seen == [{"batch_test": 1}]
+    assert admission.active == 0
+    assert (tmp_path / "out" / "a_png_batch_test.png").exists()
+
+
+def test_start_batch_job_records_crash_and_prunes_finished(tmp_path, monkeypatch):
+    from src import batch
+
+    job = _batch_job(tmp_path, monkeypatch, lambda image, context: image)
+    monkeypatch.setattr(batch.BatchJournal, "load", lambda self: 1 / 0)
+    monkeypatch.setattr(batch, "BATCH_JOBS", {})
+
+    async def scenario():
+        batch.start_batch_job(job)
+        await asyncio.gather(job.task, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+
+    assert job.summary()["status"] == "failed"
+    assert "division by zero" in job.summary()["error"]
+    batch.prune_batch_jobs(keep=0)
+    assert batch.BATCH_JOBS == {}
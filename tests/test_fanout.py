@@ -0,0 +1,87 @@
+"""多風格扇出：共用前綴的合併與只執行一次"""
+
+import asyncio
+
+from PIL import Image
+
+from src.pipeline.fanout import build_style_dag, run_fanout
+from src.pipeline.style_configs_fine_grained import FINE_GRAINED_STYLES
+
+
+def _path(root, style_id):
+    """風格在前綴樹中經過的節點"""
+    def walk(node, trail):
+        if style_id in node.styles:
+            return trail
+        for child in node.children:
+            found = walk(child, trail + [child])
+            if found is not None:
+                return found
+        return None
+    return walk(root, [])
+
+
+def test_shipped_detailed_styles_share_detection_rembg_and_generation():
+    styles = {style_id: FINE_GRAINED_STYLES[style_id] for style_id in ("i4_detailed", "i4_detailed_white")}
+    root = build_style_dag(styles)
+
+    assert sum(len(config['steps']) for config in styles.values()) == 17
+    assert root.count() == 10
+    detailed, white = _path(root, "i4_detailed"), _path(root, "i4_detailed_white")
+    assert detailed[:7] == white
+    assert white[-1].step['component'].__name__ == "ai_generate_style"
+
+
+def test_all_shipped_styles_merge_only_the_shared_prefix():
+    root = build_style_dag(FINE_GRAINED_STYLES)
+
+    total = sum(len(config['steps']) for config in FINE_GRAINED_STYLES.values())
+    assert root.count() == total - 7
+    assert sorted(root.subtree_styles()) == sorted(FINE_GRAINED_STYLES)
+
+
+def test_conditional_steps_merge_by_named_predicate():
+    step = FINE_GRAINED_STYLES["i4_detailed"]["steps"][2]
+    copy = dict(step)
+    lambda_copy = dict(step, conditional=lambda ctx: ctx.get("image_type") == "photo")
+
+    assert build_style_dag({"a": {"steps": [step]}, "b": {"steps": [copy]}}).count() == 1
+    assert build_style_dag({"a": {"steps": [step]}, "b": {"steps": [lambda_copy]}}).count() == 2
+
+
+def test_run_fanout_executes_shared_prefix_once():
+    calls = []
+
+    def shared(image, context):
+        calls.append("shared")
+        return image.convert("L")
+
+    def branch_a(image, context):
+        calls.append("a")
+        return image.transpose(Image.Transpose.ROTATE_90)
+
+    def branch_b(image, context):
+        calls.append("b")
+        return image.transpose(Image.Transpose.ROTATE_180)
+
+    def step(component):
+        return {"name": component.__name__, "component": component, "update_image": True}
+
+    styles = {
+        "fanout_test_a": {"steps": [step(shared), step(branch_a)]},
+        "fanout_test_b": {"steps": [step(shared), step(branch_b)]},
+    }
+    results = {}
+
+    async def on_result(style_id, image, error, cached):
+        assert error is None
+        results[style_id] = image
+
+    image = Image.new("RGB", (32, 16), (12, 34, 56))
+    summary = asyncio.run(run_fanout(image, styles, on_result))
+
+    assert sorted(calls) == ["a", "b", "shared"]
+    assert summary["steps_total"] == 4
+    assert summary["steps_merged"] == 3
+    assert results["fanout_test_a"].size == (16, 32)
+    assert results["fanout_test_b"].size == (32, 16)
@@ -0,0 +1,53 @@
+"""多風格扇出工作：經 JobManager 排隊與准入，結果以 URL 回傳並保存於工作目錄"""
+
+import asyncio
+
+from PIL import Image
+
+from src.admission import AdmissionController
+from src.jobs import DONE, JobManager
+from src.pipeline.style_configs_fine_grained import FINE_GRAINED_STYLES
+
+
+def _flip(image, context):
+    return image.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+
+
+def _grey(image, context):
+    return image.convert("L")
+
+
+def _style(*components) -> dict:
+    return {
+        "name": "測試",
+        "steps": [{"name": c.__name__, "component": c, "update_image": True} for c in components],
+    }
+
+
+def test_fanout_job_streams_result_urls(tmp_path, monkeypatch):
+    monkeypatch.setitem(FINE_GRAINED_STYLES, "fanout_job_a", _style(_flip, _grey))
+    monkeypatch.setitem(FINE_GRAINED_STYLES, "fanout_job_b", _style(_flip))
+    admission = AdmissionController(max_active=1, style_limits={}, max_queue=10, max_rss_mb=0)
+    manager = JobManager(str(tmp_path), admission)
+    image = Image.new("RGB", (8, 6), (200, 10, 10))
+
+    async def scenario():
+        job_id = await manager.submit_fanout(image, ["fanout_job_a", "fanout_job_b"])
+        events = [event async for event in manager.subscribe(job_id)]
+        job = await manager.get(job_id)
+        await manager.stop()
+        return job_id, events, job
+
+    job_id, events, job = asyncio.run(scenario())
+
+    completed = {event["style"]: event for event in events if event["type"] == "style_complete"}
+    assert set(completed) == {"fanout_job_a", "fanout_job_b"}
+    assert completed["fanout_job_a"]["image"] == f"/api/jobs/{job_id}/result?style=fanout_job_a"
+    assert not any(str(event.get("image", "")).startswith("data:") for event in events)
+    assert events[-1]["type"] == "complete" and events[-1]["final"]
+    assert events[-1]["summary"]["steps_merged"] == 2
+
+    assert job["status"] == DONE
+    assert set(job["results"]) == {"fanout_job_a", "fanout_job_b"}
+    assert Image.open(manager.result_path(job_id, "fanout_job_a")).mode == "L"
+    assert admission.active == 0
@@ -0,0 +1,85 @@
+"""呼叫期限與對沖請求：先成功者勝出、取消的嘗試不視為錯誤、預算與逾時"""
+
+import asyncio
+import itertools
+
+import pytest
+
+from src.config import DEADLINE_CONFIG
+from src.hedging import GEMINI_LATENCY, GeminiTimeoutError, call_with_deadline, hedged_call
+
+_models = itertools.count()
+
+
+@pytest.fixture
+def model(monkeypatch):
+    """已有足夠延遲樣本（p90 = 0.05 秒）的模型"""
+    monkeypatch.setattr(DEADLINE_CONFIG, "hedge_enabled", True)
+    monkeypatch.setattr(DEADLINE_CONFIG, "hedge_min_samples", 5)
+    monkeypatch.setattr(DEADLINE_CONFIG, "hedge_budget", 1.0)
+    name = f"hedge-test-{next(_models)}"
+    for _ in range(10):
+        GEMINI_LATENCY.get(name).record_attempt(0.05)
+    return name
+
+
+def _attempts(*behaviours):
+    """依序回傳每次呼叫的行為：(延遲秒數, 結果或例外)"""
+    queue = list(behaviours)
+    started = []
+
+    async def func():
+        delay, outcome = queue.pop(0)
+        started.append(outcome)
+        await asyncio.sleep(delay)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+    return func, started
+
+
+def test_hedge_wins_when_primary_is_slow(model):
+    func, started = _attempts((1.0, "primary"), (0.0, "hedge"))
+
+    assert asyncio.run(hedged_call(model, func, hedge=True)) == "hedge"
+    stats = GEMINI_LATENCY.get(model).stats()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1 and stats["calls"] == 1
+
+
+def test_no_hedge_without_opt_in(model):
+    func, started = _attempts((0.1, "primary"))
+
+    assert asyncio.run(hedged_call(model, func, hedge=False)) == "primary"
+    assert started == ["primary"]
+
+
+def test_cancelled_attempt_is_skipped(model):
+    func, started = _attempts((0.1, asyncio.CancelledError()), (0.2, "hedge"))
+
+    assert asyncio.run(hedged_call(model, func, hedge=True)) == "hedge"
+
+
+def test_both_attempts_failing_raises_first_error(model):
+    func, started = _attempts((0.1, ValueError("primary")), (0.2, KeyError("hedge")))
+
+    with pytest.raises(ValueError, match="primary"):
+        asyncio.run(hedged_call(model, func, hedge=True))
+
+
+def test_hedge_budget_limits_extra_requests(model, monkeypatch):
+    monkeypatch.setattr(DEADLINE_CONFIG, "hedge_budget", 0.0)
+    func, started = _attempts((0.1, "primary"), (0.0, "hedge"))
+
+    assert asyncio.run(hedged_call(model, func, hedge=True)) == "primary"
+    assert started == ["primary"]
+
+
+def test_call_with_deadline_times_out(monkeypatch):
+    monkeypatch.setattr(DEADLINE_CONFIG, "text_timeout", 0.01)
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    with pytest.raises(GeminiTimeoutError):
+        asyncio.run(call_with_deadline("deadline-test", slow))
+    assert GEMINI_LATENCY.get("deadline-test").stats()["timeouts"] == 1
@@ -0,0 +1,109 @@
+"""背景工作：進度模式、事件 seq 重新訂閱、工作 ID 檢查"""
+
+import asyncio
+import json
+
+import pytest
+from PIL import Image
+
+from src import jobs
+from src.admission import AdmissionController
+from src.jobs import DONE, JobManager, is_valid_job_id
+from src.pipeline.style_configs_fine_grained import FINE_GRAINED_STYLES
+
+
+def _grey(image, context):
+    return image.convert("L")
+
+
+def _manager(tmp_path, monkeypatch) -> JobManager:
+    monkeypatch.setitem(FINE_GRAINED_STYLES, "jobs_test", {
+        "name": "測試",
+        "steps": [{"name": "灰階", "icon": "⚪", "component": _grey, "update_image": True}],
+    })
+    admission = AdmissionController(max_active=2, style_limits={}, max_queue=10, max_rss_mb=0)
+    return JobManager(str(tmp_path), admission)
+
+
+def _run_job(manager: JobManager, options: dict = None) -> list:
+    async def scenario():
+        # 每次使用新圖片，避免結果快取命中而略過步驟
+        image = Image.new("RGB", (8, 8), (len(str(options)), 2, 3))
+        job_id = await manager.submit(image, "jobs_test", options)
+        events = [event async for event in manager.subscribe(job_id)]
+        await manager.stop()
+        return events
+    return asyncio.run(scenario())
+
+
+def test_progress_defaults_to_real_events(tmp_path, monkeypatch):
+    ticks = []
+
+    async def fake_simulate(reporter, step_id, total_steps, step_name):
+        ticks.append(step_id)
+
+    monkeypatch.setattr(jobs, "simulate_progress", fake_simulate)
+    manager = _manager(tmp_path, monkeypatch)
+
+    events = _run_job(manager)
+    assert events[-1]["type"] == "complete"
+    assert ticks == []
+
+    _run_job(manager, {"progress": "simulated"})
+    assert ticks == [1]
+
+
+def test_resubscribe_replays_events_after_seq(tmp_path, monkeypatch):
+    manager = _manager(tmp_path, monkeypatch)
+
+    async def scenario():
+        job_id = await manager.submit(Image.new("RGB", (8, 8), (9, 9, 9)), "jobs_test")
+        live = [event async for event in manager.subscribe(job_id)]
+        saved = [event for event in live if "seq" in event]
+        replay = [event async for event in manager.subscribe(job_id, after=saved[0]["seq"])]
+        tail = [event async for event in manager.subscribe(job_id, after=saved[-1]["seq"])]
+        full = [event async for event in manager.subscribe(job_id)]
+        job = await manager.get(job_id)
+        await manager.stop()
+        return saved, replay, tail, full, job
+
+    saved, replay, tail, full, job = asyncio.run(scenario())
+
+    assert [event["seq"] for event in saved] == list(range(1, len(saved) + 1))
+    assert replay == saved[1:]
+    assert tail == []
+    assert full == saved
+    assert saved[-1]["type"] == "complete" and saved[-1]["final"]
+    assert job["status"] == DONE and job["result"] == f"/api/jobs/{job['id']}/result"
+
+
+@pytest.mark.parametrize("job_id", ["", "../etc/passwd", "0123456789ABCDEF", "0123456789abcde", None])
+def test_invalid_job_ids_are_rejected(tmp_path, job_id):
+    manager = JobManager(str(tmp_path))
+
+    assert not is_valid_job_id(job_id)
+    with pytest.raises(ValueError):
+        manager.job_dir(job_id)
+
+
+def test_valid_job_id_stays_under_root(tmp_path):
+    manager = JobManager(str(tmp_path))
+
+    assert is_valid_job_id("0123456789abcdef")
+    assert manager.job_dir("0123456789abcdef").parent == tmp_path
+    with pytest.raises(ValueError):
+        manager.result_path("0123456789abcdef", "../x")
+
+
+@pytest.mark.parametrize("job_id, style", [
+    ("../../etc/passwd", None),
+    ("0123456789abcdef", None),
+    ("0123456789abcdef", "../x"),
+])
+def test_job_result_endpoint_returns_404(job_id, style):
+    from app import get_job_result
+
+    response = asyncio.run(get_job_result(job_id, style))
+
+    assert response.status_code == 404
+    assert "error" in json.loads(response.body)
@@ -0,0 +1,71 @@
+"""白色描邊：方角與舊版迭代膨脹逐像素相同，圓角為歐氏距離的圓形描邊"""
+
+import numpy as np
+import pytest
+from PIL import Image
+from scipy import ndimage
+
+from src.image_ops import outline_mask
+from src.style_converter import StyleConverter
+
+
+def _legacy_add_white_outline(image: Image.Image, outline_width: int) -> Image.Image:
+    """舊版 StyleConverter.add_white_outline（重複 outline_width 次 3×3 膨脹），凍結作為比對基準"""
+    width, height = image.size
+    result = Image.new("RGBA", (width + outline_width * 2, height + outline_width * 2), (0, 0, 0, 0))
+    result.paste(image, (outline_width, outline_width), image)
+    alpha_array = np.array(result.split()[3])
+    for _ in range(outline_width):
+        alpha_array = ndimage.binary_dilation(alpha_array, structure=np.ones((3, 3)))
+    mask = alpha_array & (~np.array(result.split()[3]).astype(bool))
+    result_array = np.array(result)
+    result_array[mask] = (255, 255, 255, 255)
+    return Image.fromarray(result_array, "RGBA")
+
+
+def _subject(size: int = 200, seed: int = 0) -> Image.Image:
+    """不規則的半透明人形：橢圓 + 矩形 + 雜點"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:size, :size]
+    body = ((yy - size * 0.4) / (size * 0.25)) ** 2 + ((xx - size * 0.5) / (size * 0.18)) ** 2 <= 1
+    body |= (yy > size * 0.6) & (abs(xx - size * 0.5) < size * 0.3)
+    body |= rng.random((size, size)) > 0.995
+    data = np.zeros((size, size, 4), dtype=np.uint8)
+    data[..., :3] = rng.integers(0, 255, (size, size, 3), dtype=np.uint8)
+    data[..., 3] = np.where(body, rng.integers(1, 256, (size, size)), 0)
+    return Image.fromarray(data, "RGBA")
+
+
+def _disk(radius: int) -> np.ndarray:
+    yy, xx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    return xx ** 2 + yy ** 2 <= radius ** 2
+
+
+def test_default_outline_matches_legacy_at_width_8():
+    image = _subject()
+    converter = StyleConverter.__new__(StyleConverter)  # 不建立 API 客戶端
+    expected = np.array(_legacy_add_white_outline(image, 8))
+    assert np.array_equal(np.array(converter.add_white_outline(image, 8)), expected)
+
+
+@pytest.mark.parametrize("width", [30, 40, 50])
+def test_rounded_outline_is_euclidean_disk_dilation(width):
+    foreground = np.asarray(_subject(160))[..., 3] > 0
+    canvas = np.pad(foreground, width)
+    expected = ndimage.binary_dilation(canvas, structure=_disk(width)) & ~canvas
+    assert np.array_equal(outline_mask(canvas, width, rounded=True), expected)
+
+
+@pytest.mark.parametrize("width", [30, 50])
+def test_rounded_outline_has_round_corners(width):
+    # 正方形前景：方角描邊含對角點，圓角描邊在 width 距離外的對角點為空
+    canvas = np.zeros((4 * width, 4 * width), dtype=bool)
+    canvas[2 * width:3 * width, 2 * width:3 * width] = True
+    corner = (2 * width - width, 2 * width - width)
+    square = outline_mask(canvas, width)
+    rounded = outline_mask(canvas, width, rounded=True)
+    assert square[corner] and not rounded[corner]
+    # 邊的中點兩者相同（距離正好 width）
+    edge = (width, int(2.5 * width))
+    assert square[edge] and rounded[edge]
+    assert not (rounded & ~square).any()
@@ -0,0 +1,138 @@
+"""速率限制：token bucket 預約、配額錯誤的暫停與退避、async / 同步共用的重試流程"""
+
+import asyncio
+import warnings
+
+import pytest
+
+from src.config import RATE_LIMIT_CONFIG
+from src.rate_limiter import ModelLimiter, RateLimiter, TokenBucket, is_quota_error, retry_after_seconds
+
+
+class QuotaError(Exception):
+    code = 429
+
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(RATE_LIMIT_CONFIG, "jitter", 0.0)
+    monkeypatch.setattr(RATE_LIMIT_CONFIG, "backoff_base", 2.0)
+    monkeypatch.setattr(RATE_LIMIT_CONFIG, "backoff_max", 5.0)
+
+
+@pytest.fixture
+def fast_limits(monkeypatch):
+    """高配額、毫秒級退避（重試流程不實際等待）"""
+    monkeypatch.setattr(RATE_LIMIT_CONFIG, "text_rpm", 600_000)
+    monkeypatch.setattr(RATE_LIMIT_CONFIG, "backoff_base", 0.001)
+    monkeypatch.setattr(RATE_LIMIT_CONFIG, "backoff_max", 0.001)
+
+
+def test_token_bucket_reservations_queue_up():
+    bucket = TokenBucket(rate=10, capacity=1)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_token_bucket_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def test_quota_error_detection_and_retry_delay():
+    error = Exception("429 RESOURCE_EXHAUSTED {'retryDelay': '7s'}")
+
+    assert is_quota_error(error) and is_quota_error(QuotaError())
+    assert not is_quota_error(ValueError("bad request"))
+    assert retry_after_seconds(error) == 7.0
+
+
+def test_quota_error_backs_off_exponentially_and_halves_rate():
+    limiter = ModelLimiter("m", 60)
+
+    assert limiter.on_quota_error(None) == pytest.approx(2.0)
+    assert limiter.on_quota_error(None) == pytest.approx(4.0)
+    assert limiter.on_quota_error(None) == pytest.approx(5.0)
+    assert limiter.on_quota_error(3.0) == pytest.approx(3.0)
+    assert limiter.current_rpm == pytest.approx(max(RATE_LIMIT_CONFIG.min_rpm, 60 / 16))
+    assert limiter.pause_remaining() > 4
+
+    limiter.on_success()
+    assert limiter.current_rpm > max(RATE_LIMIT_CONFIG.min_rpm, 60 / 16)
+
+
+def _flaky(failures: int, error: Exception = None):
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error or QuotaError("429")
+        return "ok"
+    return func, calls
+
+
+def test_call_sync_retries_quota_errors(fast_limits):
+    limiter = RateLimiter()
+    func, calls = _flaky(2)
+
+    assert limiter.call_sync("m", func, max_retries=2) == "ok"
+    assert len(calls) == 3
+    assert limiter.stats()["m"]["retries"] == 2
+
+
+def test_call_sync_gives_up_and_does_not_retry_other_errors(fast_limits):
+    limiter = RateLimiter()
+    func, calls = _flaky(5)
+    with pytest.raises(QuotaError):
+        limiter.call_sync("m", func, max_retries=1)
+    assert len(calls) == 2
+    assert limiter.stats()["m"]["quota_errors"] == 2
+
+    func, calls = _flaky(1, ValueError("bad"))
+    with pytest.raises(ValueError):
+        limiter.call_sync("m", func, max_retries=3)
+    assert len(calls) == 1
+
+
+def test_async_call_follows_the_same_policy(fast_limits):
+    limiter = RateLimiter()
+    func, calls = _flaky(1)
+
+    async def call():
+        return func()
+
+    assert asyncio.run(limiter.call("m", call, max_retries=1)) == "ok"
+    assert len(calls) == 2
+    assert limiter.stats()["m"]["retries"] == 1
+
+
+def test_retry_on_quota_error_warns_on_base_delay(monkeypatch):
+    from src.utils import retry_on_quota_error
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        retry_on_quota_error(max_retries=3, model="m")
+    with pytest.warns(DeprecationWarning, match="base_delay"):
+        retry_on_quota_error(max_retries=3, base_delay=60, model="m")
+
+
+def test_sync_generate_content_records_call_latency(monkeypatch, fast_limits):
+    from src import gemini_pool
+    from src.hedging import GEMINI_LATENCY
+
+    class Models:
+        def generate_content(self, **request):
+            return "response"
+
+    class Client:
+        models = Models()
+
+    monkeypatch.setattr(gemini_pool.GEMINI_POOL, "get_client", lambda api_key=None: Client())
+    stats = GEMINI_LATENCY.get("sync-test-model")
+    before = stats.calls
+
+    assert gemini_pool.generate_content(model="sync-test-model", contents=["x"]) == "response"
+    assert stats.calls == before + 1
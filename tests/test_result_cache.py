@@ -0,0 +1,104 @@
+"""結果快取：鍵隨圖片、風格、Prompt 變化；像素雜湊與檔案格式無關；後端依位元組上限 LRU 淘汰"""
+
+import io
+
+import pytest
+from PIL import Image
+
+from src.result_cache import (
+    DiskCacheBackend,
+    MemoryCacheBackend,
+    ResultCache,
+    SQLiteCacheBackend,
+    create_backend,
+    hash_image_pixels,
+    make_cache_key,
+)
+
+
+def _image(color=(200, 10, 10)) -> Image.Image:
+    return Image.new("RGB", (8, 6), color)
+
+
+def _reencode(image: Image.Image, fmt: str) -> Image.Image:
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt)
+    buffer.seek(0)
+    return Image.open(buffer)
+
+
+def test_cache_key_changes_with_every_field():
+    key = make_cache_key("abc", "i4_detailed", "prompt")
+
+    assert key == make_cache_key("abc", "i4_detailed", "prompt")
+    assert key != make_cache_key("abd", "i4_detailed", "prompt")
+    assert key != make_cache_key("abc", "i4_detailed_white", "prompt")
+    assert key != make_cache_key("abc", "i4_detailed", "prompt v2")
+    # 以分隔符區分欄位，欄位內容互換邊界不會撞鍵
+    assert make_cache_key("a", "bc") != make_cache_key("ab", "c")
+
+
+def test_pixel_hash_ignores_file_format():
+    image = _image()
+
+    assert hash_image_pixels(_reencode(image, "PNG")) == hash_image_pixels(_reencode(image, "BMP"))
+    assert hash_image_pixels(image) != hash_image_pixels(_image((10, 200, 10)))
+
+
+def test_memory_backend_evicts_least_recently_used_by_bytes():
+    backend = MemoryCacheBackend(max_bytes=10)
+    backend.put("a", b"1234")
+    backend.put("b", b"1234")
+    assert backend.get("a") == b"1234"
+
+    backend.put("c", b"1234")
+
+    assert backend.get("b") is None
+    assert backend.get("a") == b"1234" and backend.get("c") == b"1234"
+    assert backend.total_bytes == 8 and len(backend) == 2
+
+
+def test_entry_larger_than_limit_is_not_stored():
+    backend = MemoryCacheBackend(max_bytes=4)
+    backend.put("big", b"12345")
+
+    assert backend.get("big") is None and backend.total_bytes == 0
+
+
+@pytest.mark.parametrize("backend_name", ["disk", "sqlite"])
+def test_persistent_backends_survive_restart(tmp_path, backend_name):
+    backend = create_backend(backend_name, 100, str(tmp_path))
+    backend.put("key", b"data")
+
+    reopened = create_backend(backend_name, 100, str(tmp_path))
+
+    assert isinstance(reopened, (DiskCacheBackend, SQLiteCacheBackend))
+    assert reopened.get("key") == b"data" and reopened.total_bytes == 4
+
+
+def test_unknown_backend_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        create_backend("redis", 100, str(tmp_path))
+
+
+def test_result_cache_counts_hits_and_misses():
+    cache = ResultCache(MemoryCacheBackend(max_bytes=1 << 20))
+
+    assert cache.get("key") is None
+    data = cache.put("key", _image())
+    assert cache.get("key") == data
+    assert Image.open(io.BytesIO(data)).size == (8, 6)
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["entries"] == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResultCache(None)
+
+    assert cache.put("key", _image())
+    assert cache.get("key") is None
+    assert cache.stats() == {
+        "enabled": False, "hits": 0, "misses": 0, "hit_ratio": 0.0,
+        "entries": 0, "bytes": 0, "max_bytes": 0,
+    }
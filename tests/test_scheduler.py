@@ -0,0 +1,112 @@
+"""DAG 排程：依宣告的輸入/輸出建立依賴、獨立步驟並行、預先執行與假設不成立時作廢重跑"""
+
+import asyncio
+
+import pytest
+from PIL import Image
+
+from src.pipeline.scheduler import StepScheduler, plan_steps
+
+
+def _is_photo(context):
+    return context.get("image_type") == "photo"
+
+
+def _steps(kind: str, calls: list, remove_delay: float = 0.1) -> list:
+    """檢測（0.05 秒）→ 去背（假設為照片預先執行）→ 生成（Gemini），另有一個只讀 context 的獨立步驟"""
+
+    async def detect(image, context):
+        calls.append("detect")
+        await asyncio.sleep(0.05)
+        return {"image_type": kind}
+
+    async def remove_background(image, context):
+        calls.append(("remove_background", context.get("image_type")))
+        await asyncio.sleep(remove_delay)
+        return image.convert("L")
+
+    async def tag(image, context):
+        calls.append("tag")
+        return {"tag": "ok"}
+
+    async def generate(image, context):
+        calls.append(("generate", image.mode))
+        return image.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+
+    return [
+        {"name": "檢測", "component": detect, "update_context": True, "outputs": ["image_type"]},
+        {
+            "name": "去背", "component": remove_background, "update_image": True,
+            "conditional": _is_photo, "conditional_inputs": ["image_type"],
+            "speculate": {"image_type": "photo"},
+        },
+        {"name": "標記", "component": tag, "update_context": True, "outputs": ["tag"], "uses_image": False},
+        {"name": "生成", "component": generate, "update_image": True, "gemini": True},
+    ]
+
+
+def _run(steps):
+    events = []
+
+    async def on_event(event):
+        events.append((event.kind, event.index, event.speculative, event.executed))
+
+    scheduler = StepScheduler(steps, on_event=on_event, use_cache=False)
+    image = Image.new("RGB", (4, 2), (200, 10, 10))
+    state = asyncio.run(scheduler.run(image, {}, "upload"))
+    return state, events, scheduler.timings()
+
+
+def test_plan_follows_declared_reads_and_writes():
+    nodes = plan_steps(_steps("photo", []))
+
+    assert nodes[1].deps == set() and nodes[1].soft == {0: {"image_type": "photo"}}
+    assert nodes[2].deps == set()
+    assert nodes[3].deps == {1} and nodes[3].ancestors == {0, 1}
+
+
+def test_context_step_without_outputs_is_a_barrier():
+    steps = _steps("photo", [])
+    del steps[2]["outputs"]
+
+    assert plan_steps(steps)[2].deps == {0, 1}
+
+
+def test_speculation_confirmed_without_rerun():
+    calls = []
+    state, events, timings = _run(_steps("photo", calls))
+
+    starts = [index for kind, index, *_ in events if kind == "start"]
+    assert starts[:3] == [0, 1, 2]
+    assert ("start", 1, True, False) in events
+    assert not any(kind == "cancel" for kind, *_ in events)
+    assert calls.count(("remove_background", "photo")) == 1
+    assert ("generate", "L") in calls
+    assert [kind for kind, *_ in events if kind == "complete"] == ["complete"] * 4
+    assert state.image.mode == "L"
+    assert state.context["image_type"] == "photo" and state.context["tag"] == "ok"
+    assert timings[1]["speculative"] and timings[1]["cancelled"] == 0
+
+
+@pytest.mark.parametrize("remove_delay", [0.1, 0.0])
+def test_wrong_assumption_cancels_and_reruns(remove_delay):
+    calls = []
+    state, events, timings = _run(_steps("illustration", calls, remove_delay))
+
+    assert ("cancel", 1, True, False) in events
+    assert ("complete", 1, False, False) in events
+    # Gemini 步驟等到去背確認（略過）後才以原圖執行一次
+    assert [call for call in calls if call[0] == "generate"] == [("generate", "RGB")]
+    assert state.image.mode == "RGB" and state.context["image_type"] == "illustration"
+    assert timings[1]["cancelled"] == 1 and not timings[1]["executed"]
+
+
+def test_confirmed_error_is_raised():
+    async def broken(image, context):
+        raise ValueError("boom")
+
+    steps = _steps("photo", [])
+    steps[3]["component"] = broken
+
+    with pytest.raises(ValueError, match="boom"):
+        _run(steps)
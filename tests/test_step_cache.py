@@ -0,0 +1,81 @@
+"""步驟快取：鍵隨輸入產物、組件與宣告的 context 值變化；重跑時命中快取不再執行組件"""
+
+import asyncio
+
+from PIL import Image
+
+from src.pipeline import runner
+from src.pipeline.runner import RunState, execute_step
+from src.pipeline.step_cache import StepCache, context_fingerprint
+from src.result_cache import MemoryCacheBackend
+
+
+def _detect(image, context):
+    return {"is_photo": True}
+
+
+def _flip(image, context):
+    _flip.calls += 1
+    return image.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+
+
+_flip.calls = 0
+
+
+def test_fingerprint_distinguishes_missing_key_from_none():
+    assert context_fingerprint({}, ["a"]) != context_fingerprint({"a": None}, ["a"])
+    assert context_fingerprint({"a": 1}, ["a"]) != context_fingerprint({"a": 2}, ["a"])
+
+
+def test_fingerprint_reads_only_declared_keys_in_any_order():
+    context = {"a": 1, "b": 2}
+
+    assert context_fingerprint(context, ["a", "b"]) == context_fingerprint(context, ["b", "a"])
+    assert context_fingerprint(context, ["a"]) == context_fingerprint({**context, "b": 3}, ["a"])
+
+
+def test_step_key_varies_with_artifact_component_and_inputs():
+    key = StepCache.step_key("img", _flip, {"a": 1}, ["a"])
+
+    assert key == StepCache.step_key("img", _flip, {"a": 1, "b": 2}, ["a"])
+    assert key != StepCache.step_key("other", _flip, {"a": 1}, ["a"])
+    assert key != StepCache.step_key("img", _detect, {"a": 1}, ["a"])
+    assert key != StepCache.step_key("img", _flip, {"a": 2}, ["a"])
+
+
+def test_step_cache_round_trip_and_stats():
+    cache = StepCache(MemoryCacheBackend(max_bytes=1 << 20))
+
+    assert cache.get("key") == (False, None)
+    cache.put("key", {"is_photo": True})
+    assert cache.get("key") == (True, {"is_photo": True})
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert StepCache(None).get("key") == (False, None)
+
+
+def test_rerun_hits_cache_and_chains_artifact_ids(monkeypatch):
+    cache = StepCache(MemoryCacheBackend(max_bytes=1 << 20))
+    monkeypatch.setattr(runner, "get_step_cache", lambda: cache)
+    steps = [
+        {"name": "detect", "component": _detect, "update_context": True},
+        {"name": "flip", "component": _flip, "inputs": ["is_photo"], "update_image": True},
+    ]
+    image = Image.new("RGB", (4, 2), (200, 10, 10))
+
+    async def run():
+        state = RunState(image, {}, "upload")
+        hits = []
+        for step in steps:
+            executed, result, cached = await execute_step(step, state)
+            hits.append(cached)
+        return state, hits
+
+    _flip.calls = 0
+    first, first_hits = asyncio.run(run())
+    second, second_hits = asyncio.run(run())
+
+    assert first_hits == [False, False] and second_hits == [True, True]
+    assert _flip.calls == 1
+    assert first.artifact_id == second.artifact_id != "upload"
+    assert second.context["is_photo"] is True
+    assert second.image.tobytes() == first.image.tobytes()
@@ -0,0 +1,35 @@
+"""上傳：舊格式 data URL 的大小上限與格式錯誤"""
+
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from src.config import UPLOAD_CONFIG
+from src.upload import UploadBuffer, UploadError, decode_upload, read_data_url
+
+
+def _png_data_url() -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", (4, 3), (1, 2, 3)).save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_data_url_decodes():
+    assert decode_upload(read_data_url(_png_data_url())).size == (4, 3)
+
+
+@pytest.mark.parametrize("value", ["no-comma-here", "data:image/png;base64,@@@@", None, 123])
+def test_malformed_data_url_is_an_upload_error(value):
+    with pytest.raises(UploadError):
+        read_data_url(value)
+
+
+def test_data_url_size_is_checked_before_decoding(monkeypatch):
+    monkeypatch.setattr(UPLOAD_CONFIG, "max_bytes", 30)
+
+    with pytest.raises(UploadError, match="過大"):
+        read_data_url("data:image/png;base64," + "A" * 44)
+    with pytest.raises(UploadError, match="過大"):
+        UploadBuffer(31)